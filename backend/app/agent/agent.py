@@ -1,17 +1,130 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
 import logging
-from typing import Optional
-
-from app.agent.tools import SearchTools
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Optional, TypeVar, Union
+
+import orjson
+from app.agent.executor import GuardedAgentExecutor
+from app.agent.output_parser import FINAL_ANSWER_MARKER, ReActOutputParser
+from app.agent.router import QueryRouter, RouteDecision, looks_like_near_me
+from app.agent.tools import NearbyPlace, SearchTools
 from app.core.config import settings
 from app.core.database import DatabaseManager
-from langchain.agents import AgentExecutor, create_react_agent
-from langchain.prompts import PromptTemplate
+from app.services.semantic_cache import GeoBucket, SemanticCache, geo_bucket
+from langchain.agents import AgentExecutor
 from langchain.tools import StructuredTool, Tool
+from langchain.tools.render import render_text_description
+from langchain_core.agents import AgentAction
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import Runnable, RunnableLambda, RunnablePassthrough
 from langchain_openai import ChatOpenAI
 from pydantic import BaseModel, Field
 
 logger = logging.getLogger(__name__)
 
+# Данные текущего пользователя для инструментов агента.
+# Инструменты и executor создаются один раз, а telegram_id и координаты
+# выставляются в начале обработки каждого запроса (_set_request_context).
+_telegram_id_ctx: ContextVar[Optional[int]] = ContextVar("telegram_id", default=None)
+_user_lat_ctx: ContextVar[Optional[float]] = ContextVar("user_latitude", default=None)
+_user_lon_ctx: ContextVar[Optional[float]] = ContextVar("user_longitude", default=None)
+# Места, найденные инструментами в текущем запросе (id -> данные для карточки)
+_candidates_ctx: ContextVar[Optional[dict[int, dict]]] = ContextVar("candidates", default=None)
+# Профиль пользователя загружается в фоне с начала обработки запроса,
+# параллельно с первым вызовом LLM и поисковыми инструментами
+_profile_task_ctx: ContextVar[Optional[asyncio.Task]] = ContextVar("profile_task", default=None)
+# Упреждающий геопоиск вокруг пользователя, запущенный до ответа LLM
+_speculative_geo_ctx: ContextVar[Optional[asyncio.Task]] = ContextVar(
+    "speculative_geo", default=None
+)
+
+# Пул потоков для блокирующих вызовов инструментов (БД, эмбеддинги).
+# Ограничен отдельно от пула по умолчанию, чтобы число одновременных
+# запросов к БД соответствовало размеру пула соединений
+_tools_pool = ThreadPoolExecutor(
+    max_workers=settings.AGENT_TOOL_THREADS, thread_name_prefix="agent-tools"
+)
+
+# Параметры упреждающего геопоиска (значения по умолчанию search_by_geo)
+SPECULATIVE_GEO_RADIUS = 1500
+SPECULATIVE_GEO_MIN_RATING = 4.0
+# Загружается с запасом: при фильтре по тегам обычно остается limit мест без запроса в БД
+SPECULATIVE_GEO_FETCH_LIMIT = 150
+
+# Маркер типа ответа в Final Answer: [TYPE: question] / [TYPE: recommendation]
+_TYPE_RE = re.compile(r"\[TYPE:\s*(question|recommendation)\s*\]")
+
+# Базовые примеры для промпта: неясный запрос и поиск по критериям
+_BASE_EXAMPLES = """Пример 1: НЕЯСНЫЙ ЗАПРОС - задаём вопрос
+User: "Хочу куда-то сходить"
+Thought: Запрос слишком неясен - нет никаких критериев. Нужно уточнить
+Final Answer: [TYPE: question]
+Подскажи, какой отдых тебе интересен? Например:
+- Кафе или ресторан?
+- Культурное место (музей, театр)?
+- Активный отдых?
+- Или что-то ещё?
+
+Пример 2: ЕСТЬ КРИТЕРИИ - ищем места
+User: "Хочу активный отдых, может быть лыжи?"
+Thought: Пользователь хочет активный отдых и лыжи - есть конкретные критерии, нужен семантический поиск
+Action: search_by_preferences
+Action Input: {"query": "активный отдых лыжи сноуборд", "min_rating": 4.0, "limit": 50}
+Observation: [список найденных мест с id: 123, 456, 789, 101, 202, ...]
+Thought: Нашёл места. Теперь выберу самые подходящие для показа пользователю
+Action: select_places_to_show
+Action Input: {"place_ids": [123, 456, 789, 101, 202]}
+Observation: [детальная информация о выбранных местах]
+Thought: Отлично, места выбраны. Дам краткий ответ
+Final Answer: [TYPE: recommendation]
+Нашёл для тебя несколько отличных мест для активного отдыха с лыжами! Смотри варианты ниже 👇
+"""
+
+# Примеры работы с профилем - только для пользователей с историей диалога
+_ADVANCED_EXAMPLES = """Пример 3: ИСПОЛЬЗОВАНИЕ ПРОФИЛЯ
+User: "Напомни, где я был?"
+Thought: Пользователь хочет вспомнить свои предпочтения - нужен профиль
+Action: get_user_profile
+Action Input: ""
+Observation: {"preferred_tags": ["кафе", "бары"], "visited_places": [123, 456], "is_empty": false}
+Thought: У пользователя есть история. Могу предложить похожие места
+Final Answer: [TYPE: recommendation]
+Вижу, тебе нравятся кафе и бары! Вот несколько новых мест в этом стиле 😊
+
+Пример 4: ПЕРСОНАЛИЗИРОВАННОЕ РАНЖИРОВАНИЕ
+User: "Покажи кафе в центре"
+Thought: Нужен геопоиск в центре
+Action: search_by_geo
+Action Input: {"location": "центр", "radius_meters": 2000, "tags": ["Кафе"], "min_rating": 4.0, "limit": 50}
+Observation: [список из 50 кафе с их id: 123, 456, 789, ...]
+Thought: Много результатов. Если у пользователя есть история, можно переранжировать
+Action: get_user_profile
+Action Input: ""
+Observation: {"is_empty": false, "preferred_tags": ["Кафе", "Бары"]}
+Thought: У пользователя есть профиль, переранжирую результаты
+Action: rank_personalized
+Action Input: {"place_ids": [123, 456, 789, ...]}
+Observation: [отранжированный список с personalization_score: 123, 789, 456, ...]
+Thought: Результаты переранжированы. Теперь выберу лучшие места для показа
+Action: select_places_to_show
+Action Input: {"place_ids": [123, 789, 456, 101, 202]}
+Observation: [детальная информация о выбранных местах]
+Thought: Готово! Даю персонализированные рекомендации
+Final Answer: [TYPE: recommendation]
+Нашёл для тебя кафе в центре, отсортированные по твоим предпочтениям! 😊
+"""
+
+# Количество мест, показываемых при ответе по быстрому пути (без агента)
+FAST_ROUTE_PLACES_LIMIT = 5
+FAST_ROUTE_ANSWER = (
+    "[TYPE: recommendation]\nНашёл для тебя несколько подходящих мест! Смотри варианты ниже 👇"
+)
+
 
 class SearchByPreferencesInput(BaseModel):
     """
@@ -36,16 +149,62 @@ class SearchByGeoInput(BaseModel):
     limit: int = Field(default=50, description="Максимальное количество результатов")
 
 
-class SelectPlacesToShowInput(BaseModel):
+class PlaceIdsInput(BaseModel):
     """
-    Входные данные для инструмента select_places_to_show.
+    Входные данные для инструментов select_places_to_show и rank_personalized.
     """
 
     place_ids: list[int] = Field(
-        description="Список ID мест для показа пользователю (выбери самые подходящие, максимум 7)"
+        min_length=1,
+        description="Список ID мест (для показа пользователю - самые подходящие, максимум 7)",
     )
 
 
+ToolInput = TypeVar("ToolInput", bound=BaseModel)
+T = TypeVar("T")
+
+
+def _parse_tool_input(model: type[ToolInput], tool_input: Union[str, dict]) -> ToolInput:
+    """
+    Разбор Action Input ReAct агента по схеме инструмента.
+
+    ReAct агент передает в инструмент сырую JSON строку, поэтому она разбирается
+    и валидируется за один проход pydantic (model_validate_json).
+    """
+    if isinstance(tool_input, dict):
+        return model.model_validate(tool_input)
+    return model.model_validate_json(tool_input)
+
+
+def _remember_candidates(places: list[dict]) -> list[dict]:
+    """
+    Запомнить найденные места текущего запроса для select_places_to_show.
+    """
+    candidates = _candidates_ctx.get()
+    if candidates is not None:
+        for place in places:
+            candidates.setdefault(place["id"], {}).update(place)
+    return places
+
+
+async def _run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Выполнение блокирующего вызова в пуле потоков инструментов.
+
+    Аналог asyncio.to_thread с ограниченным пулом: контекстные переменные
+    текущего запроса передаются в поток.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return await loop.run_in_executor(_tools_pool, call)
+
+
+def _looks_like_json_object(value: str) -> bool:
+    value = value.strip()
+    return value.startswith("{") and value.endswith("}")
+
+
 class PlacesRecommendationAgent:
     """
     LLM-агент для рекомендаций мест досуга.
@@ -55,146 +214,191 @@ class PlacesRecommendationAgent:
         self.db_manager = db_manager
         self.search_tools = SearchTools(db_manager)
 
+        model_kwargs = {}
+        if settings.LLM_SERVICE_TIER:
+            model_kwargs["service_tier"] = settings.LLM_SERVICE_TIER
+
+        extra_body = None
+        if settings.LLM_LATENCY_OPTIMIZED:
+            extra_body = {"performanceConfig": {"latency": "optimized"}}
+
         self.llm = ChatOpenAI(
             base_url=settings.LLM_BASE_URL,
             model=settings.OPENAI_MODEL,
             temperature=settings.OPENAI_TEMPERATURE,
             api_key=settings.OPENAI_API_KEY,
+            model_kwargs=model_kwargs,
+            extra_body=extra_body,
+            # Расход токенов приходит и при потоковой генерации (для логов)
+            stream_usage=True,
         )
 
-        self.available_tags = self.search_tools.get_all_tags()
-        self.available_districts = self.search_tools.get_all_districts()
+        self.semantic_cache = (
+            SemanticCache(
+                max_size=settings.SEMANTIC_CACHE_SIZE,
+                ttl=settings.SEMANTIC_CACHE_TTL,
+                threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+            )
+            if settings.SEMANTIC_CACHE_ENABLED
+            else None
+        )
 
-        self.prompt = self._create_prompt()
+        self._executors: dict[bool, AgentExecutor] = {}
+        self._build_from_reference_data(
+            self.search_tools.get_all_tags(), self.search_tools.get_all_districts()
+        )
 
-        self.user_coordinates = {}
+    def _build_from_reference_data(
+        self, available_tags: list[str], available_districts: list[str]
+    ) -> None:
+        """
+        Построение всего, что зависит от справочных данных: описание районов,
+        инструменты, промпты, роутер и executor.
 
-    def _create_tools(
-        self,
-        telegram_id: Optional[int] = None,
-        user_latitude: Optional[float] = None,
-        user_longitude: Optional[float] = None,
-    ) -> list[StructuredTool]:
+        Строка с перечнем районов собирается один раз и затем только подставляется
+        в описание инструмента и промпт. Теги в промпт не входят - агент получает
+        их по запросу через инструмент get_available_tags.
+        """
+        self.available_tags = available_tags
+        self.available_districts = available_districts
 
-        def get_user_profile_tool(dummy: str = "") -> dict:
-            """
-            Получить профиль пользователя.
+        self._districts_description = ""
+        if self.available_districts:
+            self._districts_description = (
+                f"\n\nДОСТУПНЫЕ РАЙОНЫ В БАЗЕ ({len(self.available_districts)} всего):\n"
+                + ", ".join(self.available_districts)
+            )
 
-            dummy: Фиктивный параметр (игнорируется)
-            """
-            if telegram_id is None:
-                raise ValueError("telegram_id not provided for get_user_profile")
+        self._static_tools = self._create_static_tools()
+        self.tools = self._create_tools()
 
-            return self.search_tools.get_user_profile(telegram_id)
+        # Описание инструментов рендерится один раз и общее для всех вариантов промпта
+        self._tools_description = render_text_description(self.tools)
+        self._tool_names = ", ".join(tool.name for tool in self.tools)
 
-        def rank_personalized_tool(tool_input: str) -> list[dict]:
-            """
-            Переранжировать места с учетом профиля пользователя.
-            """
-            import json
+        # Промпты без примеров работы с профилем и с ними (для пользователей с историей).
+        # Строки и шаблоны замораживаются до следующего изменения справочных данных
+        self._prompt_strs = {
+            include_advanced: self._build_prompt_str(include_advanced)
+            for include_advanced in (False, True)
+        }
+        self._prompts = {
+            include_advanced: self._create_prompt(prompt_str)
+            for include_advanced, prompt_str in self._prompt_strs.items()
+        }
+        self._executors = {}
 
-            try:
-                if isinstance(tool_input, str):
-                    data = json.loads(tool_input)
-                elif isinstance(tool_input, dict):
-                    data = tool_input
-                else:
-                    raise ValueError(f"Unexpected input type: {type(tool_input)}")
+        self.router = QueryRouter(self.available_tags) if settings.AGENT_FAST_ROUTING else None
 
-                place_ids = data.get("place_ids", [])
-            except (json.JSONDecodeError, AttributeError) as e:
-                raise ValueError(f"Invalid input format: {e}")
+    async def _refresh_reference_data(self) -> None:
+        """
+        Пересборка агента, если справочные данные изменились.
 
-            if not place_ids:
-                raise ValueError("place_ids is required for rank_personalized")
+        Списки берутся из TTL-кэша SearchTools, поэтому проверка дешевая,
+        а БД запрашивается не чаще раза в REFERENCE_DATA_TTL (в пуле потоков,
+        не блокируя event loop).
+        """
+        available_tags = await _run_blocking(self.search_tools.get_all_tags)
+        available_districts = await _run_blocking(self.search_tools.get_all_districts)
 
-            if telegram_id is None:
-                raise ValueError("telegram_id not provided for rank_personalized")
+        # Пока TTL не истек, кэш возвращает те же объекты списков
+        if available_tags is self.available_tags and available_districts is self.available_districts:
+            return
 
-            if isinstance(place_ids, list):
-                place_ids = [int(pid) if isinstance(pid, str) else pid for pid in place_ids]
+        if available_tags != self.available_tags or available_districts != self.available_districts:
+            logger.info("Reference data changed, rebuilding agent prompt and tools")
+            self._build_from_reference_data(available_tags, available_districts)
+            # Данные в БД обновились - закэшированные ответы могли устареть
+            if self.semantic_cache is not None:
+                self.semantic_cache.clear()
 
-            return self.search_tools.rank_personalized(place_ids, telegram_id)
+    def _create_static_tools(self) -> dict[str, StructuredTool]:
+        """
+        Инструменты, не зависящие от пользователя, по имени инструмента.
+        """
 
         def select_places_to_show_tool(tool_input: str) -> list[dict]:
             """
             Финальный выбор мест для показа пользователю.
             """
-            import json
+            data = _parse_tool_input(PlaceIdsInput, tool_input)
+            return self.search_tools.select_places_to_show(data.place_ids, _candidates_ctx.get())
 
-            try:
-                if isinstance(tool_input, str):
-                    data = json.loads(tool_input)
-                elif isinstance(tool_input, dict):
-                    data = tool_input
-                else:
-                    raise ValueError(f"Unexpected input type: {type(tool_input)}")
-
-                place_ids = data.get("place_ids", [])
-            except (json.JSONDecodeError, AttributeError) as e:
-                raise ValueError(f"Invalid input format: {e}")
-
-            if not place_ids:
-                raise ValueError("place_ids is required for select_places_to_show")
-
-            if isinstance(place_ids, list):
-                place_ids = [int(pid) if isinstance(pid, str) else pid for pid in place_ids]
+        async def aselect_places_to_show_tool(tool_input: str) -> list[dict]:
+            """
+            Асинхронная версия select_places_to_show.
+            """
+            data = _parse_tool_input(PlaceIdsInput, tool_input)
+            return await _run_blocking(
+                self.search_tools.select_places_to_show, data.place_ids, _candidates_ctx.get()
+            )
 
-            return self.search_tools.select_places_to_show(place_ids)
+        def parse_preferences_args(
+            query: str, tags: Optional[list[str]], min_rating: float, limit: int
+        ) -> SearchByPreferencesInput:
+            # ReAct агент передает весь Action Input (JSON) в первый параметр
+            if _looks_like_json_object(query):
+                try:
+                    return _parse_tool_input(SearchByPreferencesInput, query)
+                except ValueError as e:
+                    logger.warning(f"Failed to parse JSON from query: {e}")
 
-        tags_description = ""
-        if self.available_tags:
-            tags_description = f"\n\nДОСТУПНЫЕ ТЕГИ В БАЗЕ ({len(self.available_tags)} всего):\n"
-            tags_description += ", ".join(self.available_tags)
+            return SearchByPreferencesInput(
+                query=query, tags=tags, min_rating=min_rating, limit=limit
+            )
 
-        districts_description = ""
-        if self.available_districts:
-            districts_description = (
-                f"\n\nДОСТУПНЫЕ РАЙОНЫ В БАЗЕ ({len(self.available_districts)} всего):\n"
+        def search_by_preferences_wrapper(
+            query: str,
+            tags: Optional[list[str]] = None,
+            min_rating: float = 4.0,
+            limit: int = 50,
+        ) -> list[dict]:
+            """
+            Семантический поиск мест по описанию предпочтений.
+            """
+            data = parse_preferences_args(query, tags, min_rating, limit)
+            return _remember_candidates(
+                self.search_tools.search_by_preferences(
+                    query=data.query, tags=data.tags, min_rating=data.min_rating, limit=data.limit
+                )
             )
-            districts_description += ", ".join(self.available_districts)
 
-        def search_by_geo_wrapper(
-            location: str,
-            radius_meters: int = 1500,
+        async def asearch_by_preferences_wrapper(
+            query: str,
             tags: Optional[list[str]] = None,
             min_rating: float = 4.0,
             limit: int = 50,
         ) -> list[dict]:
             """
-            Поиск мест рядом с адресом или координатами пользователя.
+            Асинхронная версия search_by_preferences.
             """
-            import json
+            data = parse_preferences_args(query, tags, min_rating, limit)
+            return _remember_candidates(
+                await self._search_by_preferences(
+                    query=data.query, tags=data.tags, min_rating=data.min_rating, limit=data.limit
+                )
+            )
 
-            if location and location.strip().startswith("{") and location.strip().endswith("}"):
-                try:
-                    data = json.loads(location)
-                    location = data.get("location", location)
-                    radius_meters = data.get("radius_meters", radius_meters)
-                    tags = data.get("tags", tags)
-                    min_rating = data.get("min_rating", min_rating)
-                    limit = data.get("limit", limit)
-                    logger.info(
-                        f"Parsed JSON from location param: location={location}, tags={tags}"
-                    )
-                except (json.JSONDecodeError, AttributeError) as e:
-                    logger.warning(f"Failed to parse JSON from location: {e}")
+        def get_available_tags_tool(dummy: str = "") -> list[str]:
+            """
+            Список всех тегов из базы.
 
-            return self.search_tools.search_by_geo(
-                location=location,
-                radius_meters=radius_meters,
-                tags=tags,
-                min_rating=min_rating,
-                limit=limit,
-                user_latitude=user_latitude,
-                user_longitude=user_longitude,
-            )
+            dummy: Фиктивный параметр (игнорируется)
+            """
+            return self.available_tags
 
-        return [
+        async def aget_available_tags_tool(dummy: str = "") -> list[str]:
+            """
+            Асинхронная версия get_available_tags (теги уже в памяти, без потока).
+            """
+            return self.available_tags
+
+        tools = [
             StructuredTool.from_function(
-                func=self.search_tools.search_by_preferences,
+                func=search_by_preferences_wrapper,
+                coroutine=asearch_by_preferences_wrapper,
                 name="search_by_preferences",
-                description=f"""Семантический поиск мест по описанию предпочтений.
+                description="""Семантический поиск мест по описанию предпочтений.
                 
 КОГДА ИСПОЛЬЗОВАТЬ:
 - Есть нечеткие параметры (уютное, романтичное, необычное, стильное, активный отдых, лыжи, etc)
@@ -202,13 +406,196 @@ class PlacesRecommendationAgent:
 - Нужен поиск по смыслу, а не по точным тегам
 
 ВАЖНО: используй русский язык в параметре query!
-{tags_description}
+Точные названия тегов для параметра tags можно узнать через get_available_tags.
 
 Возвращает список мест с полями: id, name, description, tags, district, rating, similarity_score""",
                 args_schema=SearchByPreferencesInput,
             ),
+            Tool(
+                name="select_places_to_show",
+                func=select_places_to_show_tool,
+                coroutine=aselect_places_to_show_tool,
+                description="""ФИНАЛЬНЫЙ ВЫБОР мест для показа пользователю.
+
+КОГДА ИСПОЛЬЗОВАТЬ:
+- ОБЯЗАТЕЛЬНО вызывай ПЕРЕД Final Answer с рекомендациями
+- После того как получил кандидатов через search_by_preferences или search_by_geo
+- Выбери из найденных мест самые подходящие для запроса пользователя
+
+ВАЖНО:
+- Выбери от 3 до 7 мест (сам решаешь сколько, но не больше 7)
+- Передай JSON с place_ids: {"place_ids": [123, 456, 789]}
+- Учитывай разнообразие - не выбирай 5 одинаковых кафе
+- Приоритизируй места которые лучше всего соответствуют запросу
+
+Возвращает полную информацию о выбранных местах""",
+            ),
+            Tool(
+                name="get_available_tags",
+                func=get_available_tags_tool,
+                coroutine=aget_available_tags_tool,
+                description="""Получить список всех тегов (категорий мест) из базы.
+
+КОГДА ИСПОЛЬЗОВАТЬ:
+- Нужно передать точные названия тегов в параметр tags поиска
+- Не уверен, как называется нужная категория в базе
+
+ВАЖНО: не требует параметров - просто вызывай без input или с пустой строкой
+
+Возвращает список названий тегов""",
+            ),
+        ]
+        return {tool.name: tool for tool in tools}
+
+    def _create_tools(self) -> list[StructuredTool]:
+        """
+        Полный набор инструментов агента.
+
+        Пользовательские инструменты читают telegram_id и координаты из контекстных
+        переменных, поэтому набор создается один раз и переиспользуется между запросами.
+        """
+
+        def get_user_profile_tool(dummy: str = "") -> dict:
+            """
+            Получить профиль пользователя.
+
+            dummy: Фиктивный параметр (игнорируется)
+            """
+            telegram_id = _telegram_id_ctx.get()
+            if telegram_id is None:
+                raise ValueError("telegram_id not provided for get_user_profile")
+
+            return self.search_tools.get_user_profile(telegram_id)
+
+        async def aget_user_profile_tool(dummy: str = "") -> dict:
+            """
+            Асинхронная версия get_user_profile: берет результат фоновой загрузки профиля.
+            """
+            telegram_id = _telegram_id_ctx.get()
+            if telegram_id is None:
+                raise ValueError("telegram_id not provided for get_user_profile")
+
+            return await self._get_prefetched_profile(telegram_id)
+
+        def rank_personalized_tool(tool_input: str) -> list[dict]:
+            """
+            Переранжировать места с учетом профиля пользователя.
+            """
+            place_ids = _parse_tool_input(PlaceIdsInput, tool_input).place_ids
+
+            telegram_id = _telegram_id_ctx.get()
+            if telegram_id is None:
+                raise ValueError("telegram_id not provided for rank_personalized")
+
+            return _remember_candidates(
+                self.search_tools.rank_personalized(place_ids, telegram_id)
+            )
+
+        async def arank_personalized_tool(tool_input: str) -> list[dict]:
+            """
+            Асинхронная версия rank_personalized: профиль берется из фоновой загрузки,
+            в БД остается только запрос данных о местах.
+            """
+            place_ids = _parse_tool_input(PlaceIdsInput, tool_input).place_ids
+
+            telegram_id = _telegram_id_ctx.get()
+            if telegram_id is None:
+                raise ValueError("telegram_id not provided for rank_personalized")
+
+            profile = await self._get_prefetched_profile(telegram_id)
+            return _remember_candidates(
+                await _run_blocking(
+                    self.search_tools.rank_personalized, place_ids, telegram_id, profile
+                )
+            )
+
+        def parse_geo_args(
+            location: str,
+            radius_meters: int,
+            tags: Optional[list[str]],
+            min_rating: float,
+            limit: int,
+        ) -> SearchByGeoInput:
+            # ReAct агент передает весь Action Input (JSON) в первый параметр
+            if location and _looks_like_json_object(location):
+                try:
+                    return _parse_tool_input(SearchByGeoInput, location)
+                except ValueError as e:
+                    logger.warning(f"Failed to parse JSON from location: {e}")
+
+            return SearchByGeoInput(
+                location=location,
+                radius_meters=radius_meters,
+                tags=tags,
+                min_rating=min_rating,
+                limit=limit,
+            )
+
+        def search_by_geo_wrapper(
+            location: str,
+            radius_meters: int = 1500,
+            tags: Optional[list[str]] = None,
+            min_rating: float = 4.0,
+            limit: int = 50,
+        ) -> list[dict]:
+            """
+            Поиск мест рядом с адресом или координатами пользователя.
+            """
+            data = parse_geo_args(location, radius_meters, tags, min_rating, limit)
+            return _remember_candidates(
+                self.search_tools.search_by_geo(
+                    location=data.location,
+                    radius_meters=data.radius_meters,
+                    tags=data.tags,
+                    min_rating=data.min_rating,
+                    limit=data.limit,
+                    user_latitude=_user_lat_ctx.get(),
+                    user_longitude=_user_lon_ctx.get(),
+                )
+            )
+
+        async def asearch_by_geo_wrapper(
+            location: str,
+            radius_meters: int = 1500,
+            tags: Optional[list[str]] = None,
+            min_rating: float = 4.0,
+            limit: int = 50,
+        ) -> list[dict]:
+            """
+            Асинхронная версия search_by_geo: если параметры совпадают с упреждающим
+            геопоиском, используется его результат без повторного запроса в БД.
+            """
+            data = parse_geo_args(location, radius_meters, tags, min_rating, limit)
+
+            prefetched = await self._get_speculative_geo(data)
+            if prefetched is not None:
+                places = self.search_tools.filter_nearby(prefetched, data.tags, data.limit)
+                # Упреждающий поиск загружает ближайшие места без фильтра по тегам:
+                # если выборка обрезана лимитом и подходящих мест меньше limit,
+                # остальные могут найтись дальше в радиусе - нужен запрос с фильтром в БД
+                if len(places) >= data.limit or len(prefetched) < SPECULATIVE_GEO_FETCH_LIMIT:
+                    logger.info(f"search_by_geo: {len(places)} places from speculative prefetch")
+                    return _remember_candidates(places)
+
+            return _remember_candidates(
+                await _run_blocking(
+                    self.search_tools.search_by_geo,
+                    location=data.location,
+                    radius_meters=data.radius_meters,
+                    tags=data.tags,
+                    min_rating=data.min_rating,
+                    limit=data.limit,
+                    user_latitude=_user_lat_ctx.get(),
+                    user_longitude=_user_lon_ctx.get(),
+                )
+            )
+
+        return [
+            self._static_tools["search_by_preferences"],
+            self._static_tools["get_available_tags"],
             StructuredTool.from_function(
                 func=search_by_geo_wrapper,
+                coroutine=asearch_by_geo_wrapper,
                 name="search_by_geo",
                 description=f"""Поиск мест рядом с адресом или координатами.
                 
@@ -220,7 +607,7 @@ class PlacesRecommendationAgent:
 
 ВАЖНО: Если пользователь хочет найти места "рядом со мной" или не указывает конкретное место, 
 используй location="текущая геолокация" - система автоматически использует координаты пользователя если они доступны.
-{districts_description}
+{self._districts_description}
 
 Возвращает список мест с полями: id, name, rating, distance_meters, address, district, tags""",
                 args_schema=SearchByGeoInput,
@@ -228,6 +615,7 @@ class PlacesRecommendationAgent:
             Tool(
                 name="get_user_profile",
                 func=get_user_profile_tool,
+                coroutine=aget_user_profile_tool,
                 description="""Получить профиль и историю пользователя.
                 
 КОГДА ИСПОЛЬЗОВАТЬ:
@@ -242,6 +630,7 @@ class PlacesRecommendationAgent:
             Tool(
                 name="rank_personalized",
                 func=rank_personalized_tool,
+                coroutine=arank_personalized_tool,
                 description="""Переранжировать результаты с учетом профиля пользователя.
                 
 КОГДА ИСПОЛЬЗОВАТЬ:
@@ -254,45 +643,26 @@ Telegram_id автоматически используется для теку
 
 Возвращает отранжированный список мест с дополнительным полем personalization_score""",
             ),
-            Tool(
-                name="select_places_to_show",
-                func=select_places_to_show_tool,
-                description="""ФИНАЛЬНЫЙ ВЫБОР мест для показа пользователю.
-
-КОГДА ИСПОЛЬЗОВАТЬ:
-- ОБЯЗАТЕЛЬНО вызывай ПЕРЕД Final Answer с рекомендациями
-- После того как получил кандидатов через search_by_preferences или search_by_geo
-- Выбери из найденных мест самые подходящие для запроса пользователя
-
-ВАЖНО:
-- Выбери от 3 до 7 мест (сам решаешь сколько, но не больше 7)
-- Передай JSON с place_ids: {"place_ids": [123, 456, 789]}
-- Учитывай разнообразие - не выбирай 5 одинаковых кафе
-- Приоритизируй места которые лучше всего соответствуют запросу
-
-Возвращает полную информацию о выбранных местах""",
-            ),
+            self._static_tools["select_places_to_show"],
         ]
 
-    def _create_prompt(self) -> PromptTemplate:
+    def _build_prompt_str(self, include_advanced_examples: bool = False) -> str:
         """
-        Создание системного промпта для ReAct агента.
+        Статический системный префикс промпта (роль, правила, примеры, описание инструментов).
+
+        Список районов в префикс не дублируется - он уже есть в описании search_by_geo.
+
+        include_advanced_examples: добавить примеры работы с профилем
+            (для пользователей с историей диалога)
         """
-        tags_info = ""
-        if self.available_tags:
-            tags_info = (
-                f"\n\nДОСТУПНЫЕ ТЕГИ В БАЗЕ ({len(self.available_tags)} всего):\n"
-                + ", ".join(self.available_tags)
-            )
+        examples = _BASE_EXAMPLES
+        if include_advanced_examples:
+            examples += "\n" + _ADVANCED_EXAMPLES
 
-        districts_info = ""
-        if self.available_districts:
-            districts_info = (
-                f"\n\nДОСТУПНЫЕ РАЙОНЫ В БАЗЕ ({len(self.available_districts)} всего):\n"
-                + ", ".join(self.available_districts)
-            )
+        tools_description = self._tools_description
+        tool_names = self._tool_names
 
-        template = f"""Ты ассистент по выбору мест досуга в Москве. У тебя есть база из 60,000+ мест.{tags_info}{districts_info}
+        return f"""Ты ассистент по выбору мест досуга в Москве. У тебя есть база из 60,000+ мест.
 
 ================================
 КРИТИЧЕСКИ ВАЖНО!!!
@@ -326,76 +696,7 @@ Telegram_id автоматически используется для теку
 ПРИМЕРЫ
 ================================
 
-Пример 1: НЕЯСНЫЙ ЗАПРОС - задаём вопрос
-User: "Хочу куда-то сходить"
-Thought: Запрос слишком неясен - нет никаких критериев. Нужно уточнить
-Final Answer: [TYPE: question]
-Подскажи, какой отдых тебе интересен? Например:
-- Кафе или ресторан?
-- Культурное место (музей, театр)?
-- Активный отдых?
-- Или что-то ещё?
-
-Пример 2: ЕСТЬ КРИТЕРИИ - ищем места
-User: "Хочу активный отдых, может быть лыжи?"
-Thought: Пользователь хочет активный отдых и лыжи - есть конкретные критерии, нужен семантический поиск
-Action: search_by_preferences
-Action Input: {{{{"query": "активный отдых лыжи сноуборд", "min_rating": 4.0, "limit": 50}}}}
-Observation: [список найденных мест с id: 123, 456, 789, 101, 202, ...]
-Thought: Нашёл места. Теперь выберу самые подходящие для показа пользователю
-Action: select_places_to_show
-Action Input: {{{{"place_ids": [123, 456, 789, 101, 202]}}}}
-Observation: [детальная информация о выбранных местах]
-Thought: Отлично, места выбраны. Дам краткий ответ
-Final Answer: [TYPE: recommendation]
-Нашёл для тебя несколько отличных мест для активного отдыха с лыжами! Смотри варианты ниже 👇
-
-Пример 3: ЛОКАЦИЯ - геопоиск
-User: "Кафе рядом с Кремлем"
-Thought: Указана конкретная локация (Кремль) - нужен геопоиск
-Action: search_by_geo
-Action Input: {{{{"location": "Кремль", "radius_meters": 1500, "min_rating": 4.0, "limit": 50}}}}
-Observation: [список найденных мест с id: 111, 222, 333, 444, 555, ...]
-Thought: Нашёл кафе. Выберу лучшие для показа
-Action: select_places_to_show
-Action Input: {{{{"place_ids": [111, 222, 333, 444]}}}}
-Observation: [детальная информация о выбранных местах]
-Thought: Места выбраны, даю рекомендацию
-Final Answer: [TYPE: recommendation]
-Вот уютные кафе неподалёку от Кремля 😊
-
-Пример 4: ИСПОЛЬЗОВАНИЕ ПРОФИЛЯ
-User: "Напомни, где я был?"
-Thought: Пользователь хочет вспомнить свои предпочтения - нужен профиль
-Action: get_user_profile
-Action Input: ""
-Observation: {{{{"preferred_tags": ["кафе", "бары"], "visited_places": [123, 456], "is_empty": false}}}}
-Thought: У пользователя есть история. Могу предложить похожие места
-Final Answer: [TYPE: recommendation]
-Вижу, тебе нравятся кафе и бары! Вот несколько новых мест в этом стиле 😊
-
-Пример 5: ПЕРСОНАЛИЗИРОВАННОЕ РАНЖИРОВАНИЕ
-User: "Покажи кафе в центре"
-Thought: Нужен геопоиск в центре
-Action: search_by_geo
-Action Input: {{{{"location": "центр", "radius_meters": 2000, "tags": ["Кафе"], "min_rating": 4.0, "limit": 50}}}}
-Observation: [список из 50 кафе с их id: 123, 456, 789, ...]
-Thought: Много результатов. Если у пользователя есть история, можно переранжировать
-Action: get_user_profile
-Action Input: ""
-Observation: {{{{"is_empty": false, "preferred_tags": ["Кафе", "Бары"]}}}}
-Thought: У пользователя есть профиль, переранжирую результаты
-Action: rank_personalized
-Action Input: {{{{"place_ids": [123, 456, 789, ...]}}}}
-Observation: [отранжированный список с personalization_score: 123, 789, 456, ...]
-Thought: Результаты переранжированы. Теперь выберу лучшие места для показа
-Action: select_places_to_show
-Action Input: {{{{"place_ids": [123, 789, 456, 101, 202]}}}}
-Observation: [детальная информация о выбранных местах]
-Thought: Готово! Даю персонализированные рекомендации
-Final Answer: [TYPE: recommendation]
-Нашёл для тебя кафе в центре, отсортированные по твоим предпочтениям! 😊
-
+{examples}
 ================================
 ПРАВИЛА (ОБЯЗАТЕЛЬНЫ К ВЫПОЛНЕНИЮ!)
 ================================
@@ -418,13 +719,13 @@ Final Answer: [TYPE: recommendation]
 
 У тебя есть доступ к следующим инструментам:
 
-{{tools}}
+{tools_description}
 
 Используй следующий формат СТРОГО:
 
 Question: входной вопрос/запрос пользователя
 Thought: подумай, что нужно сделать
-Action: действие из [{{tool_names}}]
+Action: действие из [{tool_names}]
 Action Input: ввод для действия в формате JSON
 Observation: результат действия
 ... (этот Thought/Action/Action Input/Observation может повторяться N раз)
@@ -448,12 +749,112 @@ Final Answer: [TYPE: question|recommendation]
 Инструменты get_user_profile и rank_personalized автоматически работают с текущим пользователем.
 Тебе НЕ НУЖНО передавать telegram_id - он уже встроен в инструменты!
 
-Начнем!
+Начнем!"""
+
+    def _create_prompt(self, static_prefix: str) -> Runnable:
+        """
+        Создание промпта для ReAct агента.
+
+        Промпт разделен на статический системный префикс и динамическую часть
+        с запросом и scratchpad. Префикс побайтово одинаков во всех запросах
+        и итерациях ReAct, поэтому провайдер может кэшировать его (prompt caching).
+
+        Вместо ChatPromptTemplate используется простая функция: системное сообщение
+        создается один раз, а на каждой итерации ReAct к нему только добавляются
+        история диалога и сообщение с запросом и scratchpad, без разбора шаблона.
+
+        Порядок сообщений: префикс -> история (отдельными сообщениями) -> текущий
+        запрос. История от хода к ходу только дописывается в конец, поэтому ее
+        начало тоже попадает в кэш префикса у провайдера.
+        """
+        if len(static_prefix) // 4 < 1024:
+            logger.warning("Static prompt prefix is too short for provider-side prompt caching")
+
+        if settings.LLM_PROMPT_CACHE_CONTROL:
+            system_message = SystemMessage(
+                content=[
+                    {"type": "text", "text": static_prefix, "cache_control": {"type": "ephemeral"}}
+                ]
+            )
+        else:
+            system_message = SystemMessage(content=static_prefix)
+
+        def format_messages(inputs: dict) -> list[BaseMessage]:
+            return [
+                system_message,
+                *inputs.get("chat_history", ()),
+                HumanMessage(
+                    content="".join(
+                        ("Question: ", inputs["input"], "\nThought:", inputs["agent_scratchpad"])
+                    )
+                ),
+            ]
+
+        return RunnableLambda(format_messages, name="ReActPrompt")
+
+    @staticmethod
+    def _history_messages(chat_history: Optional[list[dict[str, str]]]) -> list[BaseMessage]:
+        """
+        История диалога в виде сообщений чата для промпта.
+
+        Последнее сообщение помечается cache_control, чтобы провайдер кэшировал
+        префикс вместе с историей (для провайдеров с явными точками кэширования).
+        """
+        if not chat_history:
+            return []
+
+        messages: list[BaseMessage] = []
+        history = chat_history[-settings.AGENT_HISTORY_MESSAGES :]
+        for i, msg in enumerate(history):
+            content = msg["content"]
+            if settings.LLM_PROMPT_CACHE_CONTROL and i == len(history) - 1:
+                content = [{"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}]
+
+            if msg["role"] == "user":
+                messages.append(HumanMessage(content=content))
+            else:
+                messages.append(AIMessage(content=content))
+
+        return messages
+
+    def _create_agent(self, prompt: Runnable) -> Runnable:
+        """
+        Сборка ReAct агента (аналог create_react_agent).
+
+        Отличия от create_react_agent: результаты инструментов в scratchpad
+        сериализуются в JSON через orjson, а не через repr Python-объектов;
+        ответ LLM разбирается ReActOutputParser с локальным исправлением формата.
+        """
+        return (
+            RunnablePassthrough.assign(
+                agent_scratchpad=lambda x: self._format_scratchpad(x["intermediate_steps"])
+            )
+            | prompt
+            | self.llm.bind(stop=["\nObservation"])
+            | ReActOutputParser()
+        )
 
-Question: {{input}}
-Thought:{{agent_scratchpad}}"""
+    @staticmethod
+    def _format_observation(observation) -> str:
+        """
+        Результат инструмента в виде текста для LLM.
+        """
+        if isinstance(observation, str):
+            return observation
+        try:
+            return orjson.dumps(observation, default=str).decode()
+        except TypeError:
+            return str(observation)
 
-        return PromptTemplate.from_template(template)
+    def _format_scratchpad(self, intermediate_steps: list) -> str:
+        """
+        Scratchpad ReAct агента: предыдущие шаги с результатами инструментов.
+        """
+        parts = []
+        for action, observation in intermediate_steps:
+            parts.append(action.log)
+            parts.append(f"\nObservation: {self._format_observation(observation)}\nThought: ")
+        return "".join(parts)
 
     def _handle_parsing_error(self, error: Exception) -> str:
         error_str = str(error)
@@ -472,32 +873,153 @@ Thought:{{agent_scratchpad}}"""
             "Повтори попытку с правильным форматом."
         )
 
-    def create_executor(
-        self,
+    @staticmethod
+    def _set_request_context(
         telegram_id: int,
         user_latitude: Optional[float] = None,
         user_longitude: Optional[float] = None,
-    ) -> AgentExecutor:
+    ) -> None:
+        """
+        Данные текущего пользователя для инструментов агента.
+        """
+        _telegram_id_ctx.set(telegram_id)
+        _user_lat_ctx.set(user_latitude)
+        _user_lon_ctx.set(user_longitude)
+        _candidates_ctx.set({})
+        _profile_task_ctx.set(None)
+        _speculative_geo_ctx.set(None)
+
+    def get_executor(self, include_advanced_examples: bool = False) -> AgentExecutor:
+        """
+        Получение общего executor.
+
+        Executor не зависит от пользователя: telegram_id и координаты передаются
+        инструментам через контекстные переменные текущего запроса, поэтому
+        граф агента собирается один раз на вариант промпта.
+        """
+        executor = self._executors.get(include_advanced_examples)
+        if executor is None:
+            agent = self._create_agent(self._prompts[include_advanced_examples])
+
+            executor = GuardedAgentExecutor(
+                agent=agent,
+                tools=self.tools,
+                verbose=settings.DEBUG,
+                max_iterations=settings.AGENT_MAX_ITERATIONS,
+                max_execution_time=settings.AGENT_MAX_EXECUTION_TIME,
+                return_intermediate_steps=True,
+                handle_parsing_errors=self._handle_parsing_error,
+            )
+            self._executors[include_advanced_examples] = executor
+
+        return executor
+
+    def _start_profile_prefetch(self, telegram_id: int) -> None:
         """
-        Создание executor для конкретного пользователя с инъекцией telegram_id и координат.
+        Запуск фоновой загрузки профиля пользователя.
+
+        Профиль не зависит от результатов поиска, поэтому загружается параллельно
+        с первым вызовом LLM и поисковыми инструментами. get_user_profile и
+        rank_personalized затем получают готовый результат без отдельного запроса в БД.
         """
-        tools = self._create_tools(
-            telegram_id=telegram_id, user_latitude=user_latitude, user_longitude=user_longitude
+        task = asyncio.create_task(
+            _run_blocking(self.search_tools.get_user_profile, telegram_id)
         )
+        _profile_task_ctx.set(task)
+
+    async def _get_prefetched_profile(self, telegram_id: int) -> dict:
+        """
+        Профиль пользователя из фоновой загрузки (или загрузка, если она не запускалась).
+        """
+        task = _profile_task_ctx.get()
+        if task is None:
+            return await _run_blocking(self.search_tools.get_user_profile, telegram_id)
+
+        # shield: отмена одного инструмента не должна отменять общую загрузку профиля
+        return await asyncio.shield(task)
 
-        agent = create_react_agent(llm=self.llm, tools=tools, prompt=self.prompt)
+    def _start_speculative_geo(
+        self, message: str, user_latitude: Optional[float], user_longitude: Optional[float]
+    ) -> None:
+        """
+        Упреждающий геопоиск вокруг пользователя.
 
-        executor = AgentExecutor(
-            agent=agent,
-            tools=tools,
-            verbose=settings.DEBUG,
-            max_iterations=10,
-            max_execution_time=60,
-            return_intermediate_steps=True,
-            handle_parsing_errors=self._handle_parsing_error,
+        Для запросов "рядом со мной" агент почти всегда вызывает search_by_geo
+        с координатами пользователя и параметрами по умолчанию. Запрос к БД
+        запускается сразу, параллельно с первым вызовом LLM; если Action совпадет,
+        инструмент получит готовый результат. Иначе результат просто не используется.
+        """
+        if not (settings.AGENT_SPECULATIVE_GEO and user_latitude and user_longitude):
+            return
+        if not looks_like_near_me(message):
+            return
+
+        task = asyncio.create_task(
+            _run_blocking(
+                self.search_tools.fetch_nearby,
+                user_latitude,
+                user_longitude,
+                SPECULATIVE_GEO_RADIUS,
+                SPECULATIVE_GEO_MIN_RATING,
+                SPECULATIVE_GEO_FETCH_LIMIT,
+            )
         )
+        _speculative_geo_ctx.set(task)
 
-        return executor
+    async def _get_speculative_geo(self, data: SearchByGeoInput) -> Optional[list[NearbyPlace]]:
+        """
+        Результат упреждающего геопоиска, если он подходит под параметры вызова.
+
+        None - упреждающего поиска не было, параметры не совпали или он завершился ошибкой.
+        """
+        task = _speculative_geo_ctx.get()
+        if task is None:
+            return None
+
+        if (
+            data.radius_meters != SPECULATIVE_GEO_RADIUS
+            or data.min_rating != SPECULATIVE_GEO_MIN_RATING
+            or data.limit > SPECULATIVE_GEO_FETCH_LIMIT
+        ):
+            return None
+
+        user_lat, user_lon = _user_lat_ctx.get(), _user_lon_ctx.get()
+        coords = self.search_tools.resolve_coordinates(data.location, user_lat, user_lon)
+        if coords != (user_lat, user_lon):
+            return None
+
+        try:
+            # shield: отмена инструмента не должна отменять общий запрос
+            return await asyncio.shield(task)
+        except Exception as e:
+            logger.warning(f"Speculative geo search failed: {e}")
+            return None
+
+    async def _search_by_preferences(
+        self, query: str, tags: Optional[list[str]] = None, min_rating: float = 4.0, limit: int = 25
+    ) -> list[dict]:
+        """
+        Семантический поиск мест из event loop.
+
+        В потоке считается только эмбеддинг (кэш Redis, API эмбеддингов),
+        поиск в Qdrant выполняется асинхронным клиентом.
+        """
+        logger.info(f"search_by_preferences: query='{query}', tags={tags}, min_rating={min_rating}")
+
+        try:
+            query_vectors = await _run_blocking(self.search_tools.embed_queries, [query])
+            places = (
+                await self.search_tools.asearch_vectors(
+                    query_vectors, tags=tags, min_rating=min_rating, limit=limit
+                )
+            )[0]
+
+            logger.info(f"Found {len(places)} places by preferences")
+            return places
+
+        except Exception as e:
+            logger.error(f"Error in search_by_preferences: {e}", exc_info=True)
+            return []
 
     async def process_message(
         self,
@@ -517,47 +1039,285 @@ Thought:{{agent_scratchpad}}"""
                 "response_type": "question" | "recommendation"
             }
         """
+        # aclosing: при выходе из цикла генератор закрывается сразу, и его finally
+        # (отмена фоновых задач запроса) выполняется здесь, а не при сборке мусора
+        async with contextlib.aclosing(
+            self.stream_message(message, telegram_id, chat_history, user_latitude, user_longitude)
+        ) as events:
+            async for event in events:
+                if event["type"] == "result":
+                    return {
+                        "text": event["text"],
+                        "places": event["places"],
+                        "response_type": event["response_type"],
+                    }
+
+        return self._error_response()
+
+    async def stream_message(
+        self,
+        message: str,
+        telegram_id: int,
+        chat_history: Optional[list[dict[str, str]]] = None,
+        user_latitude: Optional[float] = None,
+        user_longitude: Optional[float] = None,
+    ) -> AsyncIterator[dict]:
+        """
+        Потоковая обработка сообщения пользователя.
+
+        Токены финального ответа отдаются сразу после того, как LLM начинает генерировать
+        Final Answer, не дожидаясь завершения всей цепочки ReAct:
+            {"type": "token", "text": "фрагмент ответа"}
+
+        Последнее событие - полный ответ в формате process_message:
+            {"type": "result", "text": ..., "places": [...], "response_type": ...}
+        """
         try:
             logger.info(f"User {telegram_id} sent message: {message[:50]}...")
 
             if user_latitude and user_longitude:
                 logger.info(f"User location: ({user_latitude}, {user_longitude})")
 
-            executor = self.create_executor(telegram_id, user_latitude, user_longitude)
+            self._set_request_context(telegram_id, user_latitude, user_longitude)
+            await self._refresh_reference_data()
+
+            bucket = geo_bucket(user_latitude, user_longitude)
+            query_embedding = await self._embed_for_cache(message, chat_history)
+            if query_embedding is not None:
+                cached = self.semantic_cache.get(query_embedding, bucket)
+                if cached is not None:
+                    yield {"type": "result", **cached}
+                    return
+
+            # Быстрый путь только для первого сообщения: продолжение диалога ("а подешевле?")
+            # без истории понять нельзя. Ответ быстрого пути в семантический кэш не пишется
+            if not chat_history:
+                routed = await self._try_fast_route(message, user_latitude, user_longitude)
+                if routed is not None:
+                    yield {"type": "result", **routed}
+                    return
+
+            executor = self.get_executor(include_advanced_examples=bool(chat_history))
+            self._start_profile_prefetch(telegram_id)
+            self._start_speculative_geo(message, user_latitude, user_longitude)
+
+            input_dict = {
+                "input": message,
+                "chat_history": self._history_messages(chat_history),
+            }
+
+            result = None
+            llm_outputs: dict[str, str] = {}
+            streamed_lengths: dict[str, int] = {}
+            input_tokens = output_tokens = 0
 
-            input_text = message
-            if chat_history:
-                history_context = "Контекст предыдущего диалога:\n"
-                for msg in chat_history[-4:]:
-                    role = "Пользователь" if msg["role"] == "user" else "Ассистент"
-                    history_context += f"{role}: {msg['content']}\n"
-                input_text = history_context + f"\nТекущий запрос: {message}"
+            async for event in executor.astream_events(input_dict, version="v2"):
+                kind = event["event"]
 
-            input_dict = {"input": input_text}
+                if kind == "on_chat_model_stream":
+                    content = event["data"]["chunk"].content
+                    if not isinstance(content, str) or not content:
+                        continue
 
-            result = await executor.ainvoke(input_dict)
+                    run_id = event["run_id"]
+                    llm_outputs[run_id] = llm_outputs.get(run_id, "") + content
 
-            response_text = result.get("output", "Извините, произошла ошибка. Попробуйте еще раз.")
+                    visible = self._visible_final_answer(llm_outputs[run_id])
+                    if visible is None:
+                        continue
 
-            places = self._extract_places_from_result(result)
+                    streamed = streamed_lengths.get(run_id, 0)
+                    if len(visible) > streamed:
+                        streamed_lengths[run_id] = len(visible)
+                        yield {"type": "token", "text": visible[streamed:]}
 
-            response_type = self._parse_response_type(response_text, places)
+                elif kind == "on_chat_model_end":
+                    usage = getattr(event["data"].get("output"), "usage_metadata", None)
+                    if usage:
+                        input_tokens += usage.get("input_tokens", 0)
+                        output_tokens += usage.get("output_tokens", 0)
 
-            cleaned_text = self._clean_response_text(response_text)
+                elif (
+                    kind == "on_chain_end"
+                    and event["name"] == "AgentExecutor"
+                    and not event.get("parent_ids")
+                ):
+                    result = event["data"].get("output")
 
-            logger.info(
-                f"Response generated: type={response_type}, text={cleaned_text[:100]}... with {len(places)} places"
-            )
+            logger.info(f"LLM usage: input_tokens={input_tokens}, output_tokens={output_tokens}")
 
-            return {"text": cleaned_text, "places": places, "response_type": response_type}
+            if result is None:
+                raise RuntimeError("Agent finished without output")
+
+            response = self._build_response(result)
+            if not self._is_personalized(result.get("intermediate_steps", [])):
+                self._store_in_cache(query_embedding, bucket, response)
+
+            yield {"type": "result", **response}
 
         except Exception as e:
             logger.error(f"Error processing message: {e}", exc_info=True)
-            return {
-                "text": "Извините, произошла техническая ошибка. Пожалуйста, попробуйте снова через несколько секунд.",
-                "places": [],
-                "response_type": "question",
-            }
+            yield {"type": "result", **self._error_response()}
+        finally:
+            for task_ctx in (_profile_task_ctx, _speculative_geo_ctx):
+                task = task_ctx.get()
+                if task is not None and not task.done():
+                    task.cancel()
+
+    async def _embed_for_cache(
+        self, message: str, chat_history: Optional[list[dict[str, str]]]
+    ) -> Optional[list[float]]:
+        """
+        Эмбеддинг запроса для семантического кэша.
+
+        None - кэш выключен или не применим: при наличии истории диалога смысл
+        запроса зависит от контекста ("а подешевле?").
+        """
+        if self.semantic_cache is None or chat_history:
+            return None
+
+        try:
+            return await _run_blocking(self.search_tools.embed_query, message)
+        except Exception as e:
+            logger.error(f"Error embedding query for semantic cache: {e}", exc_info=True)
+            return None
+
+    def _store_in_cache(
+        self, query_embedding: Optional[list[float]], bucket: GeoBucket, response: dict
+    ) -> None:
+        """
+        Сохранение ответа в семантический кэш (только рекомендации с местами).
+        """
+        if query_embedding is None or self.semantic_cache is None:
+            return
+        if response["response_type"] != "recommendation" or not response["places"]:
+            return
+
+        self.semantic_cache.set(query_embedding, response, bucket)
+
+    @staticmethod
+    def _is_personalized(intermediate_steps: list) -> bool:
+        """
+        Использовал ли агент профиль пользователя (такой ответ нельзя отдавать другим).
+        """
+        return any(
+            getattr(step[0], "tool", None) in ("get_user_profile", "rank_personalized")
+            for step in intermediate_steps
+            if len(step) >= 2
+        )
+
+    async def _try_fast_route(
+        self,
+        message: str,
+        user_latitude: Optional[float] = None,
+        user_longitude: Optional[float] = None,
+    ) -> Optional[dict]:
+        """
+        Обработка однозначного запроса без ReAct агента.
+
+        Роутер сопоставляет запрос с одним вызовом поискового инструмента, лучшие
+        результаты выбираются напрямую. Ответ собирается из синтетической цепочки
+        шагов тем же кодом, что и ответ агента. None - запрос нужно отдать агенту.
+        """
+        if self.router is None:
+            return None
+
+        decision: Optional[RouteDecision] = self.router.route(
+            message, has_user_location=bool(user_latitude and user_longitude)
+        )
+        if decision is None:
+            return None
+
+        try:
+            if decision.tool == "search_by_geo":
+                candidates = await _run_blocking(
+                    self.search_tools.search_by_geo,
+                    **decision.tool_input,
+                    user_latitude=user_latitude,
+                    user_longitude=user_longitude,
+                )
+            else:
+                candidates = await self._search_by_preferences(**decision.tool_input)
+
+            if not candidates:
+                logger.info("Fast route found nothing, falling back to agent")
+                return None
+
+            place_ids = [place["id"] for place in candidates[:FAST_ROUTE_PLACES_LIMIT]]
+            selected = self.search_tools.select_places_to_show(
+                place_ids, {place["id"]: place for place in candidates}
+            )
+
+            intermediate_steps = [
+                (AgentAction(tool=decision.tool, tool_input=decision.tool_input, log=""), candidates),
+                (
+                    AgentAction(
+                        tool="select_places_to_show",
+                        tool_input={"place_ids": place_ids},
+                        log="",
+                    ),
+                    selected,
+                ),
+            ]
+        except Exception as e:
+            logger.error(f"Error in fast route, falling back to agent: {e}", exc_info=True)
+            return None
+
+        return self._build_response(
+            {"output": FAST_ROUTE_ANSWER, "intermediate_steps": intermediate_steps}
+        )
+
+    def _build_response(self, result: dict) -> dict:
+        """
+        Преобразование результата AgentExecutor в ответ для пользователя.
+        """
+        response_text = result.get("output", "Извините, произошла ошибка. Попробуйте еще раз.")
+
+        places = self._extract_places_from_result(result)
+
+        # Маркер типа ищется один раз и используется и для типа, и для очистки текста
+        type_match = _TYPE_RE.search(response_text)
+
+        response_type = self._parse_response_type(type_match, places)
+
+        cleaned_text = self._clean_response_text(response_text, type_match)
+
+        logger.info(
+            f"Response generated: type={response_type}, text={cleaned_text[:100]}... with {len(places)} places"
+        )
+
+        return {"text": cleaned_text, "places": places, "response_type": response_type}
+
+    @staticmethod
+    def _error_response() -> dict:
+        return {
+            "text": "Извините, произошла техническая ошибка. Пожалуйста, попробуйте снова через несколько секунд.",
+            "places": [],
+            "response_type": "question",
+        }
+
+    @staticmethod
+    def _visible_final_answer(llm_output: str) -> Optional[str]:
+        """
+        Часть финального ответа, которую уже можно показать пользователю.
+
+        None - если LLM еще не дошла до "Final Answer:" или маркер типа ответа
+        [TYPE: ...] пришел не полностью.
+        """
+        marker_pos = llm_output.find(FINAL_ANSWER_MARKER)
+        if marker_pos == -1:
+            return None
+
+        answer = llm_output[marker_pos + len(FINAL_ANSWER_MARKER) :].lstrip()
+        if "[TYPE:".startswith(answer):
+            return None
+        if answer.startswith("[TYPE:"):
+            type_end = answer.find("]")
+            if type_end == -1:
+                return None
+            answer = answer[type_end + 1 :].lstrip()
+
+        return answer
 
     def _extract_places_from_result(self, result: dict) -> list[dict]:
         """
@@ -593,81 +1353,31 @@ Thought:{{agent_scratchpad}}"""
         """
         Fallback: извлечь top-10 мест из всех результатов поиска.
         """
-        places = []
-        seen_ids = set()
-
+        # Первое вхождение каждого места (dict сохраняет порядок вставки)
+        id_to_place: dict[int, dict] = {}
         for step in intermediate_steps:
-            if len(step) >= 2:
-                action, observation = step[0], step[1]
-
-                if isinstance(observation, list):
-                    for place in observation:
-                        if isinstance(place, dict) and "id" in place:
-                            place_id = place["id"]
-                            if place_id not in seen_ids:
-                                seen_ids.add(place_id)
-                                places.append(place)
-
-        places = places[:10]
-
-        if places:
-            place_ids = [p["id"] for p in places]
-            try:
-                detailed_places = self.search_tools.get_places_details(place_ids)
-
-                if detailed_places:
-                    details_map = {p["id"]: p for p in detailed_places}
-
-                    enriched_places = []
-                    for place in places:
-                        place_id = place["id"]
-                        if place_id in details_map:
-                            enriched = details_map[place_id].copy()
-
-                            if "similarity_score" in place:
-                                enriched["similarity_score"] = place["similarity_score"]
-                            if "personalization_score" in place:
-                                enriched["personalization_score"] = place["personalization_score"]
-                            if "distance_meters" in place:
-                                enriched["distance_meters"] = place["distance_meters"]
-
-                            enriched_places.append(enriched)
-                        else:
-                            enriched_places.append(place)
-
-                    return enriched_places
-                else:
-                    logger.warning(
-                        "DB unavailable or returned empty results, using search results as-is"
-                    )
-                    return places
-            except Exception as e:
-                logger.error(f"Error enriching places from DB: {e}", exc_info=True)
-                return places
+            if len(step) >= 2 and isinstance(step[1], list):
+                for place in step[1]:
+                    if isinstance(place, dict) and "id" in place:
+                        id_to_place.setdefault(place["id"], place)
 
-        return places
+        # Результаты поиска уже содержат все поля для карточек, БД не нужна
+        return list(id_to_place.values())[:10]
 
-    def _parse_response_type(self, response_text: str, places: list[dict]) -> str:
+    def _parse_response_type(self, type_match: Optional[re.Match], places: list[dict]) -> str:
         """
-        Определяет тип ответа агента на основе текста и наличия мест.
+        Определяет тип ответа агента по маркеру [TYPE: ...] и наличию мест.
         """
-        if "[TYPE: question]" in response_text:
-            return "question"
-        if "[TYPE: recommendation]" in response_text:
-            return "recommendation"
-
-        if places and len(places) > 0:
-            return "recommendation"
+        if type_match:
+            return type_match.group(1)
 
-        return "question"
+        return "recommendation" if places else "question"
 
-    def _clean_response_text(self, response_text: str) -> str:
+    def _clean_response_text(self, response_text: str, type_match: Optional[re.Match]) -> str:
         """
         Удаляет маркеры типа ответа из текста для пользователя.
         """
-        cleaned = response_text.replace("[TYPE: question]", "").replace(
-            "[TYPE: recommendation]", ""
-        )
+        if type_match is None:
+            return response_text.strip()
 
-        cleaned = cleaned.strip()
-        return cleaned
+        return _TYPE_RE.sub("", response_text).strip()
@@ -0,0 +1,140 @@
+import logging
+from typing import AsyncIterator, Iterator, Optional, Union
+
+from langchain.agents import AgentExecutor
+from langchain_core.agents import AgentAction, AgentFinish, AgentStep
+
+logger = logging.getLogger(__name__)
+
+# Ответ при принудительной остановке агента (зацикливание, лимит итераций или времени)
+AGENT_STOPPED_ANSWER = (
+    "Не получилось до конца разобраться с запросом. "
+    "Попробуй переформулировать его или уточнить, что именно ищешь."
+)
+
+# Текст, который AgentExecutor возвращает при остановке с early_stopping_method="force"
+_LANGCHAIN_STOPPED_OUTPUT = "Agent stopped due to iteration limit or time limit."
+
+# Имя псевдо-инструмента, под которым AgentExecutor записывает ошибки парсинга
+_PARSING_ERROR_TOOL = "_Exception"
+
+NextStep = Union[AgentFinish, AgentAction, AgentStep]
+
+
+class GuardedAgentExecutor(AgentExecutor):
+    """
+    AgentExecutor с ранней остановкой бесполезных итераций.
+
+    Останавливает агента до выполнения очередного шага, если:
+    - LLM повторяет предыдущее действие с тем же Action Input (зацикливание);
+    - вторая ошибка формата подряд (исправление формата допускается один раз).
+    Вместо технического сообщения LangChain при остановке возвращается
+    понятный пользователю ответ.
+    """
+
+    def _guard(self, first: NextStep, intermediate_steps: list) -> Optional[AgentFinish]:
+        """
+        Проверка очередного шага. AgentFinish - шаг выполнять не нужно.
+        """
+        if not intermediate_steps:
+            return None
+
+        previous_action = intermediate_steps[-1][0]
+
+        if isinstance(first, AgentStep) and first.action.tool == _PARSING_ERROR_TOOL:
+            if previous_action.tool == _PARSING_ERROR_TOOL:
+                logger.warning("Agent stopped: repeated output parsing error")
+                return self._stopped()
+            return None
+
+        if isinstance(first, AgentAction) and (
+            first.tool == previous_action.tool
+            and self._normalize_input(first.tool_input)
+            == self._normalize_input(previous_action.tool_input)
+        ):
+            logger.warning(f"Agent stopped: repeated action {first.tool}")
+            return self._stopped()
+
+        return None
+
+    @staticmethod
+    def _normalize_input(tool_input: Union[str, dict]) -> str:
+        if isinstance(tool_input, str):
+            return "".join(tool_input.split())
+        return repr(sorted(tool_input.items()))
+
+    @staticmethod
+    def _stopped() -> AgentFinish:
+        return AgentFinish(return_values={"output": AGENT_STOPPED_ANSWER}, log="")
+
+    def _iter_next_step(
+        self,
+        name_to_tool_map,
+        color_mapping,
+        inputs,
+        intermediate_steps,
+        run_manager=None,
+    ) -> Iterator[NextStep]:
+        steps = super()._iter_next_step(
+            name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager
+        )
+        first = next(steps, None)
+        if first is None:
+            return
+
+        stop = self._guard(first, intermediate_steps)
+        if stop is not None:
+            steps.close()
+            yield stop
+            return
+
+        yield first
+        yield from steps
+
+    async def _aiter_next_step(
+        self,
+        name_to_tool_map,
+        color_mapping,
+        inputs,
+        intermediate_steps,
+        run_manager=None,
+    ) -> AsyncIterator[NextStep]:
+        steps = super()._aiter_next_step(
+            name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager
+        )
+        first = await anext(steps, None)
+        if first is None:
+            return
+
+        stop = self._guard(first, intermediate_steps)
+        if stop is not None:
+            await steps.aclose()
+            yield stop
+            return
+
+        yield first
+        async for step in steps:
+            yield step
+
+    def _return(self, output: AgentFinish, intermediate_steps: list, run_manager=None) -> dict:
+        return super()._return(self._replace_stopped(output), intermediate_steps, run_manager)
+
+    async def _areturn(
+        self, output: AgentFinish, intermediate_steps: list, run_manager=None
+    ) -> dict:
+        return await super()._areturn(
+            self._replace_stopped(output), intermediate_steps, run_manager
+        )
+
+    @classmethod
+    def _replace_stopped(cls, output: AgentFinish) -> AgentFinish:
+        """
+        Замена технического сообщения об остановке по лимиту на ответ для пользователя.
+
+        early_stopping_method="generate" (финальный ответ отдельным вызовом LLM)
+        не поддерживается агентами на Runnable, поэтому используется "force".
+        """
+        if output.return_values.get("output") == _LANGCHAIN_STOPPED_OUTPUT:
+            logger.warning("Agent stopped by iteration or time limit")
+            return cls._stopped()
+        return output
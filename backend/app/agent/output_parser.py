@@ -0,0 +1,168 @@
+import logging
+import re
+from typing import Optional, Union
+
+import orjson
+from langchain.agents import AgentOutputParser
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.exceptions import OutputParserException
+
+logger = logging.getLogger(__name__)
+
+FINAL_ANSWER_MARKER = "Final Answer:"
+
+# Action: <инструмент> ... Action Input: <ввод> (до Observation или конца текста)
+_ACTION_RE = re.compile(
+    r"Action\s*\d*\s*:\s*(?P<action>[^\n]*?)\s*\n+\s*Action\s*\d*\s*Input\s*\d*\s*:[ \t]*"
+    r"(?P<input>.*?)(?=\n\s*Observation\s*:|\Z)",
+    re.DOTALL,
+)
+_ACTION_MARKER_RE = re.compile(r"Action\s*\d*\s*:")
+# Обрамление ```json ... ``` вокруг Action Input
+_CODE_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+_WHITESPACE_RE = re.compile(r"\s*")
+
+_CLOSING = {"{": "}", "[": "]"}
+
+
+def _strip_trailing_commas(text: str) -> str:
+    """
+    Удаление запятых перед закрывающей скобкой ({"a": 1,}) вне строковых литералов.
+    """
+    result: list[str] = []
+    in_string = False
+    escaped = False
+
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == ",":
+            next_pos = _WHITESPACE_RE.match(text, i + 1).end()
+            if text[next_pos : next_pos + 1] in ("}", "]"):
+                continue
+        result.append(char)
+
+    return "".join(result)
+
+
+def repair_json(text: str) -> Optional[str]:
+    """
+    Локальное исправление почти корректного JSON из Action Input.
+
+    Исправляются типичные ошибки LLM: лишний текст после JSON, запятая перед
+    закрывающей скобкой, незакрытые скобки и кавычки. None - исправить не удалось.
+    """
+    text = text.strip()
+
+    stack: list[str] = []
+    in_string = False
+    escaped = False
+    end = len(text)
+
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+
+        if char == '"':
+            in_string = True
+        elif char in _CLOSING:
+            stack.append(_CLOSING[char])
+        elif char in "}]":
+            if not stack or stack[-1] != char:
+                return None
+            stack.pop()
+            if not stack:
+                # JSON закончился - остальное считаем лишним текстом
+                end = i + 1
+                break
+
+    candidate = text[:end]
+    if in_string:
+        candidate += '"'
+    candidate += "".join(reversed(stack))
+    candidate = _strip_trailing_commas(candidate)
+
+    try:
+        orjson.loads(candidate)
+    except orjson.JSONDecodeError:
+        return None
+    return candidate
+
+
+def _clean_tool_input(raw_input: str) -> str:
+    """
+    Нормализация Action Input: кавычки, обрамление кодом и исправление JSON.
+    """
+    tool_input = _CODE_FENCE_RE.sub("", raw_input.strip()).strip()
+
+    if tool_input in ('""', "''"):
+        return ""
+
+    if tool_input.startswith(("{", "[")):
+        try:
+            orjson.loads(tool_input)
+        except orjson.JSONDecodeError:
+            repaired = repair_json(tool_input)
+            if repaired is not None:
+                logger.info("Repaired malformed Action Input JSON locally")
+                return repaired
+        return tool_input
+
+    return tool_input.strip('"')
+
+
+class ReActOutputParser(AgentOutputParser):
+    """
+    Разбор ответа LLM в формате ReAct (Thought / Action / Action Input / Final Answer).
+
+    В отличие от стандартного парсера LangChain, типичные отклонения от формата
+    исправляются локально, без повторного вызова LLM:
+    - битый JSON в Action Input (незакрытые скобки, лишний текст, ```json);
+    - одновременно Action и Final Answer - выполняется то, что идет первым.
+    Ошибка формата (и повторный вызов LLM) остается только для ответов,
+    в которых нет ни разбираемого Action, ни Final Answer.
+    """
+
+    def parse(self, text: str) -> Union[AgentAction, AgentFinish]:
+        final_pos = text.find(FINAL_ANSWER_MARKER)
+        action_marker = _ACTION_MARKER_RE.search(text)
+
+        if action_marker and (final_pos == -1 or action_marker.start() < final_pos):
+            match = _ACTION_RE.search(text, action_marker.start())
+            action = match.group("action").strip().strip("`*\"'") if match else ""
+            if not action:
+                raise OutputParserException(
+                    f"Could not parse LLM output: `{text}`", llm_output=text, send_to_llm=True
+                )
+
+            tool_input = match.group("input")
+            # Final Answer после Action - модель пропустила Observation, отбрасываем его
+            if FINAL_ANSWER_MARKER in tool_input:
+                tool_input = tool_input.split(FINAL_ANSWER_MARKER, 1)[0]
+
+            return AgentAction(action, _clean_tool_input(tool_input), text)
+
+        if final_pos != -1:
+            output = text[final_pos + len(FINAL_ANSWER_MARKER) :].strip()
+            return AgentFinish({"output": output}, text)
+
+        raise OutputParserException(
+            f"Could not parse LLM output: `{text}`", llm_output=text, send_to_llm=True
+        )
+
+    @property
+    def _type(self) -> str:
+        return "react-repairing"
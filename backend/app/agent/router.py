@@ -0,0 +1,216 @@
+import logging
+import re
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from app.agent.tools import KNOWN_LOCATIONS
+
+logger = logging.getLogger(__name__)
+
+# "кафе рядом с Кремлем", "бары недалеко от Арбата"
+_GEO_PLACE_RE = re.compile(
+    r"^(?P<what>.+?)\s+(?:рядом\s+со?|недалеко\s+от|неподалеку\s+от|около|возле)\s+(?P<where>.+)$"
+)
+# "кафе рядом", "бары поблизости", "музеи рядом со мной"
+_GEO_NEAR_ME_RE = re.compile(
+    r"^(?P<what>.+?)\s+(?:рядом|поблизости|недалеко|неподалеку)(?:\s+со\s+мной)?$"
+)
+# Признак геозапроса относительно пользователя в любом месте сообщения
+_NEAR_ME_HINT_RE = re.compile(
+    r"\b(?:рядом|поблизости|недалеко|неподалеку|близко)\b|\bрядом\s+со\s+мной\b"
+)
+# "хочу уютное кафе", "посоветуй романтичный ресторан"
+_PREFERENCE_RE = re.compile(
+    r"^(?:я\s+)?(?:хочу|ищу|посоветуй|подскажи|найди|покажи)\s+"
+    r"(?P<query>.*\b(?:уютн|романтич|активн|тих|спокойн|необычн|стильн|атмосферн|красив)\w*.*)$"
+)
+# Признаки, при которых запрос по атмосфере нельзя отдать в search_by_preferences:
+# указание места ("рядом с", "на Арбате", "в центре") или отрицание ("не дорогое", "без")
+_PREFERENCE_BLOCKERS_RE = re.compile(
+    r"\b(?:не|без|рядом|около|возле|недалеко|неподалеку|поблизости|близко|на|в|во)\b"
+)
+# Слова, не несущие критериев поиска
+_STOPWORDS = frozenset(
+    {
+        "а",
+        "бы",
+        "в",
+        "где",
+        "есть",
+        "какие",
+        "какое",
+        "какой",
+        "какую",
+        "мне",
+        "найди",
+        "нибудь",
+        "покажи",
+        "посоветуй",
+        "подскажи",
+        "хочу",
+        "ищу",
+        "что",
+        "хорошие",
+        "хорошее",
+        "хороший",
+        "хорошую",
+        "лучшие",
+    }
+)
+_WORD_RE = re.compile(r"[а-яёa-z]+")
+# Максимальная длина запроса (в словах) для быстрого пути по предпочтениям
+_MAX_PREFERENCE_WORDS = 10
+# Максимальное количество тегов, на которые может отобразиться запрос
+_MAX_ROUTE_TAGS = 5
+
+
+@dataclass
+class RouteDecision:
+    """
+    Решение роутера: какой инструмент вызвать и с какими параметрами.
+    """
+
+    tool: str
+    tool_input: dict[str, Any]
+
+
+def _stem(word: str) -> str:
+    """
+    Грубая основа слова для сопоставления падежных форм ("кремлем" -> "кремл").
+    """
+    if len(word) > 5:
+        return word[:-2]
+    if len(word) > 4:
+        return word[:-1]
+    return word
+
+
+def looks_like_near_me(message: str) -> bool:
+    """
+    Похож ли запрос на поиск рядом с пользователем (без указания другой локации).
+    """
+    text = " ".join(message.lower().replace("ё", "е").split())
+    if not _NEAR_ME_HINT_RE.search(text):
+        return False
+    match = _GEO_PLACE_RE.match(text.strip(" ?!.,"))
+    return match is None or match.group("where") in ("мной", "меня")
+
+
+class QueryRouter:
+    """
+    Быстрый роутер однозначных запросов.
+
+    Простые запросы ("кафе рядом с Кремлем", "хочу уютное кафе") однозначно
+    отображаются на один вызов поискового инструмента, поэтому их можно обработать
+    без ReAct цикла и вызовов LLM. Если уверенности нет, роутер возвращает None
+    и запрос обрабатывает агент.
+    """
+
+    def __init__(self, available_tags: list[str]):
+        self.available_tags = available_tags
+        self._tags_lc = [(tag, tag.lower()) for tag in available_tags]
+        self._location_patterns = [
+            (key, re.compile(r"\b" + r"\w*\s+".join(_stem(part) for part in key.split())))
+            for key in KNOWN_LOCATIONS
+        ]
+
+    def route(self, message: str, has_user_location: bool = False) -> Optional[RouteDecision]:
+        """
+        Определить инструмент для запроса или None, если нужен полноценный агент.
+        """
+        text = " ".join(message.lower().replace("ё", "е").split()).strip(" ?!.,")
+        if not text:
+            return None
+
+        decision = self._route_geo(text, has_user_location) or self._route_preferences(text)
+        if decision:
+            logger.info(f"Fast route: {decision.tool} {decision.tool_input}")
+        return decision
+
+    def _route_geo(self, text: str, has_user_location: bool) -> Optional[RouteDecision]:
+        """
+        Геозапрос: категория мест + известная локация (или "рядом со мной").
+        """
+        match = _GEO_NEAR_ME_RE.match(text)
+        if match:
+            if not has_user_location:
+                return None
+            location = "текущая геолокация"
+        else:
+            match = _GEO_PLACE_RE.match(text)
+            if not match:
+                return None
+
+            where = match.group("where")
+            if where in ("мной", "меня"):
+                if not has_user_location:
+                    return None
+                location = "текущая геолокация"
+            else:
+                location = self._match_location(where)
+                if location is None:
+                    return None
+
+        tags = self._match_tags(match.group("what"))
+        if not tags:
+            return None
+
+        return RouteDecision(
+            tool="search_by_geo",
+            tool_input={"location": location, "radius_meters": 1500, "tags": tags},
+        )
+
+    def _route_preferences(self, text: str) -> Optional[RouteDecision]:
+        """
+        Запрос по атмосфере: "хочу/ищу/посоветуй" + явное описание атмосферы.
+        """
+        match = _PREFERENCE_RE.match(text)
+        if not match:
+            return None
+
+        query = match.group("query")
+        if len(query.split()) > _MAX_PREFERENCE_WORDS:
+            return None
+        # Локацию и отрицания семантический поиск не учитывает - такие запросы для агента
+        if _PREFERENCE_BLOCKERS_RE.search(query):
+            return None
+
+        return RouteDecision(tool="search_by_preferences", tool_input={"query": query})
+
+    def _match_location(self, where: str) -> Optional[str]:
+        """
+        Сопоставление локации с известными (с учетом падежных форм).
+        """
+        for key, pattern in self._location_patterns:
+            if pattern.search(where):
+                return key
+        return None
+
+    def _match_tags(self, what: str) -> list[str]:
+        """
+        Сопоставление слов запроса с тегами из базы.
+
+        Каждое значимое слово должно соответствовать хотя бы одному тегу,
+        иначе в запросе есть критерии, которые роутер не понимает.
+        """
+        matched: list[str] = []
+        for word in _WORD_RE.findall(what):
+            if word in _STOPWORDS:
+                continue
+
+            stem = _stem(word)
+            word_tags = [
+                tag
+                for tag, tag_lc in self._tags_lc
+                if any(part.startswith(stem) for part in tag_lc.split())
+            ]
+            if not word_tags:
+                return []
+
+            for tag in word_tags:
+                if tag not in matched:
+                    matched.append(tag)
+
+        if len(matched) > _MAX_ROUTE_TAGS:
+            return []
+        return matched
@@ -1,16 +1,130 @@
+import functools
+import hashlib
 import logging
-from typing import Any, Optional
-
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+import numpy as np
+import orjson
 from app.core.config import settings
 from app.core.database import DatabaseManager
-from app.core.models import Place, Tag, UserInteraction, UserProfile, place_tags
-from openai import OpenAI
-from qdrant_client.models import FieldCondition, Filter
-from sqlalchemy import column, func, select
-from sqlalchemy.orm import Session
+from app.core.models import Place, Tag, UserInteraction, UserProfile
+from app.services.embeddings import EmbeddingBatcher, get_embedding_client
+from qdrant_client.models import (
+    FieldCondition,
+    Filter,
+    MatchAny,
+    QuantizationSearchParams,
+    QueryRequest,
+    Range,
+    SearchParams,
+)
+from sqlalchemy import Text, bindparam, column, func, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Session, load_only, selectinload
 
 logger = logging.getLogger(__name__)
 
+# Известные локации для геокодирования (название в нижнем регистре -> координаты)
+KNOWN_LOCATIONS: dict[str, tuple[float, float]] = {
+    "кремль": (55.7520, 37.6175),
+    "красная площадь": (55.7539, 37.6208),
+    "пушкинская": (55.7657, 37.6039),
+    "тверская": (55.7658, 37.6050),
+    "арбат": (55.7503, 37.5892),
+    "чистые пруды": (55.7642, 37.6430),
+    "центр": (55.7558, 37.6173),
+    "москва": (55.7558, 37.6173),
+}
+
+# Начиная с этого числа мест скоры персонализации считаются векторизованно (NumPy)
+VECTORIZED_RANKING_MIN_PLACES = 32
+
+# Все известные локации одним регулярным выражением (длинные названия - раньше)
+_KNOWN_LOCATIONS_RE = re.compile(
+    "|".join(re.escape(key) for key in sorted(KNOWN_LOCATIONS, key=len, reverse=True))
+)
+
+# Префикс ключей кэша эмбеддингов запросов в Redis
+EMBEDDING_CACHE_PREFIX = b"emb:"
+
+# Префикс ключей кэша профилей пользователей в Redis
+PROFILE_CACHE_PREFIX = "profile:"
+
+# Разделитель тегов в строке tag_list (представление places_with_tags)
+TAG_LIST_SEPARATOR = ", "
+
+# Значения location, при которых используются координаты пользователя
+USER_LOCATION_ALIASES = ("текущая геолокация", "рядом со мной", "близко", "здесь", "тут")
+
+
+def profile_cache_key(telegram_id: int) -> str:
+    """
+    Ключ Redis с закэшированным профилем пользователя.
+    """
+    return f"{PROFILE_CACHE_PREFIX}{telegram_id}"
+
+
+def split_tags(tag_list: Optional[str]) -> list[str]:
+    """
+    Строка тегов "Кафе, Бары" -> список ["Кафе", "Бары"].
+    """
+    if not tag_list:
+        return []
+    return tag_list.split(TAG_LIST_SEPARATOR)
+
+
+@functools.lru_cache(maxsize=4096)
+def match_known_location(location: str) -> Optional[str]:
+    """
+    Известная локация, упомянутая в строке (ключ KNOWN_LOCATIONS), или None.
+    """
+    match = _KNOWN_LOCATIONS_RE.search(location.lower())
+    return match.group() if match else None
+
+
+def tag_set(tags: Optional[list[str]]) -> frozenset[str]:
+    """
+    Множество тегов в нижнем регистре для сравнения по точному совпадению.
+    """
+    if not tags:
+        return frozenset()
+    return frozenset(tag.strip().lower() for tag in tags)
+
+
+@dataclass(slots=True)
+class NearbyPlace:
+    """
+    Место из find_places_nearby.
+
+    Строки хранятся компактно (без словаря атрибутов на каждый объект), в словарь
+    для ответа инструмента преобразуются только отобранные места.
+    """
+
+    id: int
+    name: str
+    rating: float
+    distance_meters: float
+    address: Optional[str]
+    district: Optional[str]
+    tags: list[str]
+    # Теги в нижнем регистре - только для фильтрации, в ответ не попадают
+    tags_lc: frozenset[str]
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "rating": self.rating,
+            "distance_meters": self.distance_meters,
+            "address": self.address,
+            "district": self.district,
+            "tags": self.tags,
+        }
+
 
 class SearchTools:
     """
@@ -19,69 +133,191 @@ class SearchTools:
 
     def __init__(self, db_manager: DatabaseManager):
         self.db_manager = db_manager
-        self.openai_client = OpenAI(
-            api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_EMBEDDING_BASE_URL
-        )
+        self.openai_client = get_embedding_client()
         self.embedding_model = settings.OPENAI_EMBEDDING_MODEL
+        self.embedding_batcher = EmbeddingBatcher(
+            self.openai_client,
+            self.embedding_model,
+            max_batch_size=settings.EMBEDDING_BATCH_SIZE,
+            max_wait=settings.EMBEDDING_BATCH_WAIT_MS / 1000,
+            timeout=settings.EMBEDDING_TIMEOUT,
+        )
+        # Справочные данные (теги, районы): имя -> (время загрузки, значение)
+        self._reference_cache: dict[str, tuple[float, list[str]]] = {}
+        # Загрузка справочных данных одним потоком: остальные ждут результат
+        self._reference_lock = threading.Lock()
 
-    def search_by_preferences(
-        self, query: str, tags: Optional[list[str]] = None, min_rating: float = 4.0, limit: int = 25
-    ) -> list[dict[str, Any]]:
+    def embed_query(self, query: str) -> list[float]:
         """
-        Семантический поиск мест по описанию предпочтений.
+        Эмбеддинг текстового запроса.
+        """
+        return self.embed_queries([query])[0]
 
-        Используется для нечетких параметров (уютное, романтичное, необычное).
+    def embed_queries(self, queries: list[str]) -> list[list[float]]:
         """
-        logger.info(f"search_by_preferences: query='{query}', tags={tags}, min_rating={min_rating}")
+        Эмбеддинги текстовых запросов.
+
+        Одновременные запросы разных пользователей объединяются в один вызов API.
+        Эмбеддинги кэшируются в Redis (float32 байты) по хэшу модели и текста.
+        """
+        keys = [self._embedding_cache_key(query) for query in queries]
+        embeddings: list[Optional[list[float]]] = [None] * len(queries)
 
         try:
-            embedding_response = self.openai_client.embeddings.create(
-                model=self.embedding_model, input=query
+            for i, cached in enumerate(self.db_manager.get_redis_sync().mget(keys)):
+                if cached is not None:
+                    embeddings[i] = np.frombuffer(cached, dtype=np.float32).tolist()
+        except Exception as e:
+            logger.warning(f"Embedding cache read failed: {e}")
+
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if not missing:
+            return embeddings
+
+        computed = self.embedding_batcher.embed_many([queries[i] for i in missing])
+
+        try:
+            pipeline = self.db_manager.get_redis_sync().pipeline(transaction=False)
+            for i, embedding in zip(missing, computed):
+                embeddings[i] = embedding
+                pipeline.set(
+                    keys[i],
+                    np.asarray(embedding, dtype=np.float32).tobytes(),
+                    ex=settings.EMBEDDING_CACHE_TTL,
+                )
+            pipeline.execute()
+        except Exception as e:
+            logger.warning(f"Embedding cache write failed: {e}")
+            for i, embedding in zip(missing, computed):
+                embeddings[i] = embedding
+
+        return embeddings
+
+    def _embedding_cache_key(self, query: str) -> bytes:
+        digest = hashlib.sha256(f"{self.embedding_model}|{query}".encode()).digest()
+        return EMBEDDING_CACHE_PREFIX + digest
+
+    @staticmethod
+    def _preferences_filter(tags: Optional[list[str]], min_rating: float) -> Optional[Filter]:
+        """
+        Фильтр Qdrant по рейтингу и тегам (индексы rating и tags_lc).
+        """
+        conditions = []
+        if min_rating > 0:
+            conditions.append(FieldCondition(key="rating", range=Range(gte=min_rating)))
+        wanted_tags = tag_set(tags)
+        if wanted_tags:
+            conditions.append(
+                FieldCondition(key="tags_lc", match=MatchAny(any=list(wanted_tags)))
             )
-            query_vector = embedding_response.data[0].embedding
+        return Filter(must=conditions) if conditions else None
+
+    @staticmethod
+    def _place_from_point(point) -> dict[str, Any]:
+        # Все поля, нужные для карточки места, берутся из payload,
+        # чтобы не запрашивать их повторно из PostgreSQL
+        return {
+            "id": point.id,
+            "name": point.payload.get("name"),
+            "description": point.payload.get("description"),
+            "tags": split_tags(point.payload.get("tags")),
+            "district": point.payload.get("district"),
+            "address": point.payload.get("address"),
+            "rating": point.payload.get("rating"),
+            "reviews_count": point.payload.get("reviews_count"),
+            "similarity_score": point.score,
+        }
 
-            qdrant = self.db_manager.get_qdrant()
+    def search_many(
+        self,
+        queries: list[str],
+        tags: Optional[list[str]] = None,
+        min_rating: float = 4.0,
+        limit: int = 25,
+    ) -> list[list[dict[str, Any]]]:
+        """
+        Семантический поиск по нескольким запросам с общим фильтром.
+
+        Эмбеддинги считаются одним пакетом, поиск в Qdrant - одним запросом
+        (query_batch_points) вместо отдельного HTTP запроса на каждый текст.
+        Фильтры по рейтингу и тегам выполняются в Qdrant, поэтому запрашивается
+        ровно limit мест без фильтрации на стороне Python.
+        """
+        if not queries:
+            return []
+
+        query_vectors = self.embed_queries(queries)
+        responses = self.db_manager.get_qdrant().query_batch_points(
+            collection_name=settings.QDRANT_COLLECTION,
+            requests=self._search_requests(query_vectors, tags, min_rating, limit),
+        )
+        return [
+            [self._place_from_point(point) for point in response.points] for response in responses
+        ]
 
-            query_filter = None
-            if min_rating > 0:
-                conditions = []
-                conditions.append(FieldCondition(key="rating", range={"gte": min_rating}))
-                query_filter = Filter(must=conditions)
+    async def asearch_vectors(
+        self,
+        query_vectors: list[list[float]],
+        tags: Optional[list[str]] = None,
+        min_rating: float = 4.0,
+        limit: int = 25,
+    ) -> list[list[dict[str, Any]]]:
+        """
+        Асинхронный вариант search_many для готовых эмбеддингов.
+
+        Поиск выполняется через AsyncQdrantClient (gRPC) прямо в event loop,
+        без занятого потока на время запроса к Qdrant.
+        """
+        if not query_vectors:
+            return []
 
-            qdrant_limit = limit * 3 if tags else limit
+        responses = await self.db_manager.get_qdrant_async().query_batch_points(
+            collection_name=settings.QDRANT_COLLECTION,
+            requests=self._search_requests(query_vectors, tags, min_rating, limit),
+        )
+        return [
+            [self._place_from_point(point) for point in response.points] for response in responses
+        ]
 
-            search_results = qdrant.search(
-                collection_name=settings.QDRANT_COLLECTION,
-                query_vector=query_vector,
-                query_filter=query_filter,
-                limit=qdrant_limit,
+    def _search_requests(
+        self,
+        query_vectors: list[list[float]],
+        tags: Optional[list[str]],
+        min_rating: float,
+        limit: int,
+    ) -> list[QueryRequest]:
+        query_filter = self._preferences_filter(tags, min_rating)
+        search_params = SearchParams(
+            hnsw_ef=settings.QDRANT_HNSW_EF,
+            quantization=QuantizationSearchParams(
+                rescore=True, oversampling=settings.QDRANT_OVERSAMPLING
+            ),
+        )
+        return [
+            QueryRequest(
+                query=vector,
+                filter=query_filter,
+                params=search_params,
+                limit=limit,
+                with_payload=True,
             )
+            for vector in query_vectors
+        ]
 
-            places = []
-            for result in search_results:
-                place = {
-                    "id": result.id,
-                    "name": result.payload.get("name"),
-                    "description": result.payload.get("description"),
-                    "tags": result.payload.get("tags"),
-                    "district": result.payload.get("district"),
-                    "rating": result.payload.get("rating"),
-                    "reviews_count": result.payload.get("reviews_count"),
-                    "similarity_score": result.score,
-                }
+    def search_by_preferences(
+        self, query: str, tags: Optional[list[str]] = None, min_rating: float = 4.0, limit: int = 25
+    ) -> list[dict[str, Any]]:
+        """
+        Семантический поиск мест по описанию предпочтений.
 
-                if tags:
-                    place_tags_str = place.get("tags", "").lower()
-                    # Проверяем, что хотя бы один из запрошенных тегов есть в строке тегов места
-                    if any(tag.lower() in place_tags_str for tag in tags):
-                        places.append(place)
-                else:
-                    places.append(place)
+        Используется для нечетких параметров (уютное, романтичное, необычное).
+        """
+        logger.info(f"search_by_preferences: query='{query}', tags={tags}, min_rating={min_rating}")
 
-                if len(places) >= limit:
-                    break
+        try:
+            places = self.search_many([query], tags=tags, min_rating=min_rating, limit=limit)[0]
 
-            logger.info(f"Found {len(places)} places by preferences (after tag filtering)")
+            logger.info(f"Found {len(places)} places by preferences")
             return places
 
         except Exception as e:
@@ -105,28 +341,64 @@ class SearchTools:
         """
         logger.info(f"search_by_geo: location='{location}', radius={radius_meters}m, tags={tags}")
 
-        session: Session = self.db_manager.get_session()
         try:
-            if (
-                user_latitude
-                and user_longitude
-                and (
-                    not location
-                    or location.lower()
-                    in ["текущая геолокация", "рядом со мной", "близко", "здесь", "тут"]
-                )
-            ):
-                lat, lon = user_latitude, user_longitude
-                logger.info(f"Using user location: ({lat}, {lon})")
-            else:
-                lat, lon = self._geocode_location(location)
+            lat, lon = self.resolve_coordinates(location, user_latitude, user_longitude)
 
             if lat is None or lon is None:
                 logger.warning(f"Failed to geocode: {location}")
                 return []
 
-            sql_limit = limit * 3 if tags else limit
+            # Фильтр по тегам выполняется в БД, поэтому запрашивается ровно limit мест
+            nearby = self.fetch_nearby(lat, lon, radius_meters, min_rating, limit, tags)
+            places = [place.to_dict() for place in nearby]
+
+            logger.info(f"Found {len(places)} places by geo location")
+            return places
+
+        except Exception as e:
+            logger.error(f"Error in search_by_geo: {e}", exc_info=True)
+            return []
 
+    def resolve_coordinates(
+        self,
+        location: str,
+        user_latitude: Optional[float] = None,
+        user_longitude: Optional[float] = None,
+    ) -> tuple[Optional[float], Optional[float]]:
+        """
+        Координаты для геопоиска: пользователя ("рядом со мной") или геокодированного адреса.
+        """
+        if (
+            user_latitude
+            and user_longitude
+            and (not location or location.lower() in USER_LOCATION_ALIASES)
+        ):
+            logger.info(f"Using user location: ({user_latitude}, {user_longitude})")
+            return user_latitude, user_longitude
+
+        return self._geocode_location(location)
+
+    def fetch_nearby(
+        self,
+        lat: float,
+        lon: float,
+        radius_meters: int,
+        min_rating: float,
+        sql_limit: int,
+        tags: Optional[list[str]] = None,
+    ) -> list[NearbyPlace]:
+        """
+        Места в радиусе от точки (find_places_nearby) с хотя бы одним из тегов tags.
+
+        Теги в нижнем регистре (tag_list_lc) вычисляются в БД.
+        """
+        wanted_tags = tag_set(tags)
+        tag_filter = bindparam(
+            "tag_filter", sorted(wanted_tags) if wanted_tags else None, type_=ARRAY(Text)
+        )
+
+        session: Session = self.db_manager.get_session()
+        try:
             query = select(
                 column("id"),
                 column("name"),
@@ -135,44 +407,48 @@ class SearchTools:
                 column("address"),
                 column("district"),
                 column("tag_list").label("tags"),
+                column("tag_list_lc"),
             ).select_from(
-                func.find_places_nearby(lat, lon, radius_meters, min_rating, sql_limit).alias(
-                    "places"
-                )
+                func.find_places_nearby(
+                    lat, lon, radius_meters, min_rating, sql_limit, tag_filter
+                ).alias("places")
             )
 
-            result = session.execute(query)
-
-            places = []
-            for row in result:
-                place_data = {
-                    "id": row.id,
-                    "name": row.name,
-                    "rating": row.rating,
-                    "distance_meters": row.distance_meters,
-                    "address": row.address,
-                    "district": row.district,
-                    "tags": row.tags,
-                }
-
-                if tags:
-                    place_tags_str = (row.tags or "").lower()
-                    if any(tag.lower() in place_tags_str for tag in tags):
-                        places.append(place_data)
-                else:
-                    places.append(place_data)
+            return [
+                NearbyPlace(
+                    id=row.id,
+                    name=row.name,
+                    rating=row.rating,
+                    distance_meters=row.distance_meters,
+                    address=row.address,
+                    district=row.district,
+                    tags=split_tags(row.tags),
+                    tags_lc=frozenset(row.tag_list_lc or ()),
+                )
+                for row in session.execute(query)
+            ]
+        finally:
+            session.close()
 
-                if len(places) >= limit:
+    @staticmethod
+    def filter_nearby(
+        places: list[NearbyPlace], tags: Optional[list[str]], limit: int
+    ) -> list[dict[str, Any]]:
+        """
+        Фильтрация мест по тегам (совпадение хотя бы одного тега) и обрезка до limit.
+        """
+        wanted_tags = tag_set(tags)
+        if not wanted_tags:
+            return [place.to_dict() for place in places[:limit]]
+
+        filtered = []
+        for place in places:
+            if wanted_tags & place.tags_lc:
+                filtered.append(place.to_dict())
+                if len(filtered) >= limit:
                     break
 
-            logger.info(f"Found {len(places)} places by geo location (after tag filtering)")
-            return places
-
-        except Exception as e:
-            logger.error(f"Error in search_by_geo: {e}", exc_info=True)
-            return []
-        finally:
-            session.close()
+        return filtered
 
     def _geocode_location(self, location: str) -> tuple[Optional[float], Optional[float]]:
         """
@@ -180,22 +456,11 @@ class SearchTools:
 
         TODO: надо бы использовать полноценный геокодер (Яндекс.Карты API).
         """
-        known_locations = {
-            "кремль": (55.7520, 37.6175),
-            "красная площадь": (55.7539, 37.6208),
-            "пушкинская": (55.7657, 37.6039),
-            "тверская": (55.7658, 37.6050),
-            "арбат": (55.7503, 37.5892),
-            "чистые пруды": (55.7642, 37.6430),
-            "центр": (55.7558, 37.6173),
-            "москва": (55.7558, 37.6173),
-        }
-
-        location_lower = location.lower()
-        for key, coords in known_locations.items():
-            if key in location_lower:
-                logger.info(f"Geocoded '{location}' to {coords} using known location '{key}'")
-                return coords
+        key = match_known_location(location)
+        if key is not None:
+            coords = KNOWN_LOCATIONS[key]
+            logger.info(f"Geocoded '{location}' to {coords} using known location '{key}'")
+            return coords
 
         fallback_coords = (55.7558, 37.6173)
         logger.warning(
@@ -203,20 +468,40 @@ class SearchTools:
         )
         return fallback_coords
 
-    def get_user_profile(self, telegram_id: int) -> dict[str, Any]:
+    def get_user_profile(
+        self, telegram_id: int, session: Optional[Session] = None
+    ) -> dict[str, Any]:
         """
         Получить профиль и историю пользователя.
 
         Используется для персонализации и когда запрос неопределенный.
+        Если передана session, запросы выполняются в ней (сессия не закрывается).
+        Профиль кэшируется в Redis на PROFILE_CACHE_TTL секунд. При сохранении нового
+        взаимодействия save_interaction записывает в кэш обновленный профиль
+        (при ошибке записи ключ удаляется).
         """
         logger.info(f"get_user_profile: telegram_id={telegram_id}")
 
-        session: Session = self.db_manager.get_session()
+        cached = self._get_cached_profile(telegram_id)
+        if cached is not None:
+            return cached
+
+        own_session = session is None
+        if own_session:
+            session = self.db_manager.get_session()
         try:
-            profile = session.query(UserProfile).filter_by(telegram_id=telegram_id).first()
+            # Только нужные колонки, без загрузки ORM объекта в identity map
+            profile = session.execute(
+                select(
+                    UserProfile.telegram_id,
+                    UserProfile.preferred_tags,
+                    UserProfile.avoided_tags,
+                    UserProfile.favorite_districts,
+                ).where(UserProfile.telegram_id == telegram_id)
+            ).first()
 
             if not profile:
-                return {
+                result = {
                     "telegram_id": telegram_id,
                     "preferred_tags": [],
                     "avoided_tags": [],
@@ -224,21 +509,22 @@ class SearchTools:
                     "visited_places": [],
                     "is_empty": True,
                 }
-
-            interactions = (
-                session.query(UserInteraction.place_id, UserInteraction.interaction_type)
-                .filter(UserInteraction.telegram_id == telegram_id)
-                .order_by(UserInteraction.created_at.desc())
-                .limit(50)
-                .all()
+                self._cache_profile(telegram_id, result)
+                return result
+
+            # Последние 50 понравившихся мест (индекс idx_user_interactions_user_type_created)
+            visited_places = list(
+                session.execute(
+                    select(UserInteraction.place_id)
+                    .where(
+                        UserInteraction.telegram_id == telegram_id,
+                        UserInteraction.interaction_type == "liked",
+                    )
+                    .order_by(UserInteraction.created_at.desc())
+                    .limit(50)
+                ).scalars()
             )
 
-            visited_places = [
-                interaction.place_id
-                for interaction in interactions
-                if interaction.interaction_type in ("liked")
-            ]
-
             result = {
                 "telegram_id": profile.telegram_id,
                 "preferred_tags": profile.preferred_tags or [],
@@ -249,10 +535,14 @@ class SearchTools:
             }
 
             logger.info(f"Profile loaded: {len(visited_places)} visits")
+            self._cache_profile(telegram_id, result)
             return result
 
         except Exception as e:
             logger.error(f"Error in get_user_profile: {e}", exc_info=True)
+            if not own_session:
+                # Сессия вызывающего кода должна остаться пригодной для следующих запросов
+                session.rollback()
             return {
                 "telegram_id": telegram_id,
                 "preferred_tags": [],
@@ -262,13 +552,40 @@ class SearchTools:
                 "is_empty": True,
             }
         finally:
-            session.close()
+            if own_session:
+                session.close()
+
+    def _get_cached_profile(self, telegram_id: int) -> Optional[dict[str, Any]]:
+        try:
+            cached = self.db_manager.get_redis_sync().get(profile_cache_key(telegram_id))
+            if cached is not None:
+                return orjson.loads(cached)
+        except Exception as e:
+            logger.warning(f"Profile cache read failed: {e}")
+        return None
+
+    def _cache_profile(self, telegram_id: int, profile: dict[str, Any]):
+        try:
+            self.db_manager.get_redis_sync().set(
+                profile_cache_key(telegram_id),
+                orjson.dumps(profile, option=orjson.OPT_SERIALIZE_NUMPY),
+                ex=settings.PROFILE_CACHE_TTL,
+            )
+        except Exception as e:
+            logger.warning(f"Profile cache write failed: {e}")
 
-    def rank_personalized(self, place_ids: list[int], telegram_id: int) -> list[dict[str, Any]]:
+    def rank_personalized(
+        self,
+        place_ids: list[int],
+        telegram_id: int,
+        profile: Optional[dict[str, Any]] = None,
+    ) -> list[dict[str, Any]]:
         """
         Переранжировать результаты с учетом профиля пользователя.
 
         Используется для returning users после получения кандидатов.
+        Если профиль уже загружен (например, заранее параллельно с поиском),
+        его можно передать в profile, чтобы не делать повторный запрос в БД.
         """
         logger.info(f"rank_personalized: {len(place_ids)} мест для user {telegram_id}")
 
@@ -277,82 +594,62 @@ class SearchTools:
             if not place_ids:
                 return []
 
-            profile = self.get_user_profile(telegram_id)
-
-            tags_subquery = (
-                session.query(
-                    place_tags.c.place_id,
-                    func.array_agg(Tag.name).label("tags_array"),
-                )
-                .join(Tag, place_tags.c.tag_id == Tag.id)
-                .group_by(place_tags.c.place_id)
-                .subquery()
-            )
-
-            query = (
-                session.query(
-                    Place.id,
-                    Place.name,
-                    Place.rating,
-                    Place.reviews_count,
-                    Place.district,
-                    Place.address,
-                    tags_subquery.c.tags_array,
-                )
-                .outerjoin(tags_subquery, Place.id == tags_subquery.c.place_id)
-                .filter(Place.id.in_(place_ids))
-            )
-
-            results = query.all()
-
-            places = []
-            for row in results:
-                places.append(
-                    {
-                        "id": row.id,
-                        "name": row.name,
-                        "rating": row.rating,
-                        "reviews_count": row.reviews_count,
-                        "district": row.district,
-                        "address": row.address,
-                        "tags": (
-                            row.tags_array
-                            if row.tags_array and row.tags_array[0] is not None
-                            else []
-                        ),
-                    }
-                )
+            if profile is None:
+                profile = self.get_user_profile(telegram_id, session=session)
 
             preferred_tags = set(profile.get("preferred_tags", []))
             avoided_tags = set(profile.get("avoided_tags", []))
             favorite_districts = set(profile.get("favorite_districts", []))
 
-            for place in places:
-                current_place_tags = set(place.get("tags") or [])
-
-                # Базовый скор - рейтинг
-                base_score = place["rating"] / 5.0
-
-                # Бонус за совпадение с предпочтениями
-                tag_overlap = len(current_place_tags & preferred_tags)
-                tag_bonus = 0.2 * min(tag_overlap / max(len(preferred_tags), 1), 1.0)
-
-                # Штраф за избегаемые теги
-                avoided_overlap = len(current_place_tags & avoided_tags)
-                tag_penalty = 0.3 * (avoided_overlap / max(len(current_place_tags), 1))
-
-                # Бонус за любимый район
-                district_bonus = 0.15 if place.get("district") in favorite_districts else 0
-
-                # Бонус за популярность
-                popularity_score = min(place["reviews_count"] / 100, 1.0) * 0.1
-
-                # Итоговый скор
-                personalization_score = (
-                    base_score + tag_bonus - tag_penalty + district_bonus + popularity_score
+            if preferred_tags or avoided_tags or favorite_districts:
+                places = [
+                    {
+                        "id": place.id,
+                        "name": place.name,
+                        "rating": place.rating,
+                        "reviews_count": place.reviews_count,
+                        "district": place.district,
+                        "address": place.address,
+                        "tags": [tag.name for tag in place.tags],
+                    }
+                    for place in self._load_places_with_tags(
+                        session,
+                        place_ids,
+                        Place.name,
+                        Place.rating,
+                        Place.reviews_count,
+                        Place.district,
+                        Place.address,
+                    )
+                ]
+            else:
+                # Пустой профиль: скор зависит только от рейтинга и популярности,
+                # теги для ранжирования не нужны (в карточках остаются теги из поиска)
+                places = [
+                    dict(row._mapping)
+                    for row in session.execute(
+                        select(
+                            Place.id,
+                            Place.name,
+                            Place.rating,
+                            Place.reviews_count,
+                            Place.district,
+                            Place.address,
+                        ).where(Place.id.in_(place_ids))
+                    )
+                ]
+
+            if len(places) >= VECTORIZED_RANKING_MIN_PLACES:
+                scores = self._personalization_scores(
+                    places, preferred_tags, avoided_tags, favorite_districts
                 )
-
-                place["personalization_score"] = max(0, min(1, personalization_score))
+                for place, score in zip(places, scores.tolist()):
+                    place["personalization_score"] = score
+            else:
+                for place in places:
+                    place["personalization_score"] = self._personalization_score(
+                        place, preferred_tags, avoided_tags, favorite_districts
+                    )
 
             places.sort(key=lambda x: x["personalization_score"], reverse=True)
 
@@ -365,6 +662,102 @@ class SearchTools:
         finally:
             session.close()
 
+    @staticmethod
+    def _personalization_score(
+        place: dict[str, Any],
+        preferred_tags: set[str],
+        avoided_tags: set[str],
+        favorite_districts: set[str],
+    ) -> float:
+        """
+        Персонализированный скор одного места (0-1).
+        """
+        current_place_tags = set(place.get("tags") or [])
+
+        # Базовый скор - рейтинг
+        base_score = place["rating"] / 5.0
+
+        # Бонус за совпадение с предпочтениями
+        tag_overlap = len(current_place_tags & preferred_tags)
+        tag_bonus = 0.2 * min(tag_overlap / max(len(preferred_tags), 1), 1.0)
+
+        # Штраф за избегаемые теги
+        avoided_overlap = len(current_place_tags & avoided_tags)
+        tag_penalty = 0.3 * (avoided_overlap / max(len(current_place_tags), 1))
+
+        # Бонус за любимый район
+        district_bonus = 0.15 if place.get("district") in favorite_districts else 0
+
+        # Бонус за популярность
+        popularity_score = min(place["reviews_count"] / 100, 1.0) * 0.1
+
+        # Итоговый скор
+        personalization_score = (
+            base_score + tag_bonus - tag_penalty + district_bonus + popularity_score
+        )
+        return max(0, min(1, personalization_score))
+
+    @staticmethod
+    def _personalization_scores(
+        places: list[dict[str, Any]],
+        preferred_tags: set[str],
+        avoided_tags: set[str],
+        favorite_districts: set[str],
+    ) -> np.ndarray:
+        """
+        Векторизованный расчет скоров _personalization_score для списка мест.
+
+        Теги мест кодируются матрицей индикаторов (место x тег), пересечения
+        с предпочтениями считаются умножением матрицы на вектор.
+        """
+        place_tags = [set(place.get("tags") or []) for place in places]
+        tag_index = {
+            tag: i for i, tag in enumerate(set().union(*place_tags, preferred_tags, avoided_tags))
+        }
+
+        indicators = np.zeros((len(places), len(tag_index)), dtype=np.float32)
+        for row, tags in enumerate(place_tags):
+            indicators[row, [tag_index[tag] for tag in tags]] = 1.0
+
+        preferred = np.zeros(len(tag_index), dtype=np.float32)
+        preferred[[tag_index[tag] for tag in preferred_tags]] = 1.0
+        avoided = np.zeros(len(tag_index), dtype=np.float32)
+        avoided[[tag_index[tag] for tag in avoided_tags]] = 1.0
+
+        ratings = np.array([place["rating"] for place in places], dtype=np.float64)
+        reviews = np.array([place["reviews_count"] for place in places], dtype=np.float64)
+        in_favorite_district = np.array(
+            [place.get("district") in favorite_districts for place in places]
+        )
+        tags_count = np.maximum(indicators.sum(axis=1), 1.0)
+
+        base_score = ratings / 5.0
+        tag_bonus = 0.2 * np.minimum((indicators @ preferred) / max(len(preferred_tags), 1), 1.0)
+        tag_penalty = 0.3 * (indicators @ avoided) / tags_count
+        district_bonus = np.where(in_favorite_district, 0.15, 0.0)
+        popularity_score = np.minimum(reviews / 100, 1.0) * 0.1
+
+        return np.clip(
+            base_score + tag_bonus - tag_penalty + district_bonus + popularity_score, 0.0, 1.0
+        )
+
+    @staticmethod
+    def _load_places_with_tags(session: Session, place_ids: list[int], *columns) -> list[Place]:
+        """
+        Места по ID с тегами: только указанные колонки мест и отдельный запрос
+        тегов (selectinload, place_id IN (...) по индексу place_tags) вместо array_agg.
+        """
+        return list(
+            session.execute(
+                select(Place)
+                .options(
+                    load_only(*columns),
+                    selectinload(Place.tags).load_only(Tag.name),
+                )
+                .where(Place.id.in_(place_ids))
+            ).scalars()
+        )
+
     def get_places_details(self, place_ids: list[int]) -> list[dict[str, Any]]:
         """
         Получить полную информацию о местах по их ID.
@@ -378,53 +771,33 @@ class SearchTools:
         try:
             session = self.db_manager.get_session()
 
-            tags_subquery = (
-                session.query(
-                    place_tags.c.place_id,
-                    func.array_agg(Tag.name).label("tags_array"),
-                )
-                .join(Tag, place_tags.c.tag_id == Tag.id)
-                .group_by(place_tags.c.place_id)
-                .subquery()
-            )
-
-            query = (
-                session.query(
-                    Place.id,
-                    Place.name,
-                    Place.rating,
-                    Place.reviews_count,
-                    Place.district,
-                    Place.address,
-                    Place.phone,
-                    Place.website,
-                    Place.working_hours,
-                    tags_subquery.c.tags_array,
-                )
-                .outerjoin(tags_subquery, Place.id == tags_subquery.c.place_id)
-                .filter(Place.id.in_(place_ids))
+            results = self._load_places_with_tags(
+                session,
+                place_ids,
+                Place.name,
+                Place.rating,
+                Place.reviews_count,
+                Place.district,
+                Place.address,
+                Place.phone,
+                Place.website,
+                Place.working_hours,
             )
 
-            results = query.all()
-
             places = []
-            for row in results:
+            for place in results:
                 places.append(
                     {
-                        "id": row.id,
-                        "name": row.name,
-                        "rating": row.rating,
-                        "reviews_count": row.reviews_count,
-                        "district": row.district,
-                        "address": row.address,
-                        "phone": row.phone,
-                        "website": row.website,
-                        "working_hours": row.working_hours,
-                        "tags": (
-                            row.tags_array
-                            if row.tags_array and row.tags_array[0] is not None
-                            else []
-                        ),
+                        "id": place.id,
+                        "name": place.name,
+                        "rating": place.rating,
+                        "reviews_count": place.reviews_count,
+                        "district": place.district,
+                        "address": place.address,
+                        "phone": place.phone,
+                        "website": place.website,
+                        "working_hours": place.working_hours,
+                        "tags": [tag.name for tag in place.tags],
                     }
                 )
 
@@ -441,17 +814,59 @@ class SearchTools:
                 except Exception:
                     pass
 
+    def _get_reference_data(self, name: str, loader: Callable[[], list[str]]) -> list[str]:
+        """
+        Справочные данные с кэшированием на REFERENCE_DATA_TTL секунд.
+
+        Пустой результат (например, при недоступной БД) не кэшируется.
+        """
+        cached = self._reference_cache.get(name)
+        if cached and time.monotonic() - cached[0] < settings.REFERENCE_DATA_TTL:
+            return cached[1]
+
+        with self._reference_lock:
+            # Пока ждали блокировку, данные мог загрузить другой поток
+            cached = self._reference_cache.get(name)
+            if cached and time.monotonic() - cached[0] < settings.REFERENCE_DATA_TTL:
+                return cached[1]
+
+            value = loader()
+            if value:
+                self._reference_cache[name] = (time.monotonic(), value)
+            elif cached:
+                # БД недоступна - продолжаем использовать устаревшие данные
+                return cached[1]
+            return value
+
+    def invalidate_reference_data(self):
+        """
+        Сброс кэша справочных данных (после изменения тегов или мест в БД).
+        """
+        with self._reference_lock:
+            self._reference_cache.clear()
+
     def get_all_tags(self) -> list[str]:
         """
-        Получить список всех доступных тегов из базы данных.
+        Получить список всех доступных тегов (с кэшированием).
+        """
+        return self._get_reference_data("tags", self._load_all_tags)
+
+    def get_all_districts(self) -> list[str]:
+        """
+        Получить список всех районов (с кэшированием).
+        """
+        return self._get_reference_data("districts", self._load_all_districts)
+
+    def _load_all_tags(self) -> list[str]:
+        """
+        Загрузить список всех доступных тегов из базы данных.
         """
         logger.info("get_all_tags: loading tags from database")
 
         session: Session = None
         try:
             session = self.db_manager.get_session()
-            tags = session.query(Tag.name).order_by(Tag.name).all()
-            tag_list = [tag[0] for tag in tags]
+            tag_list = list(session.execute(select(Tag.name).order_by(Tag.name)).scalars())
             logger.info(f"Loaded {len(tag_list)} tags")
             return tag_list
         except Exception as e:
@@ -464,12 +879,16 @@ class SearchTools:
                 except Exception:
                     pass
 
-    def select_places_to_show(self, place_ids: list[int]) -> list[dict[str, Any]]:
+    def select_places_to_show(
+        self, place_ids: list[int], known_places: Optional[dict[int, dict[str, Any]]] = None
+    ) -> list[dict[str, Any]]:
         """
         Финальный выбор мест для показа пользователю.
 
         Агент вызывает этот инструмент когда готов дать рекомендации,
         передавая ID мест которые считает наиболее подходящими.
+        known_places - места, уже полученные поиском в этом запросе (id -> данные):
+        они содержат все поля для карточки, поэтому из БД загружаются только остальные.
         """
         logger.info(f"select_places_to_show: {len(place_ids)} places selected by agent")
 
@@ -477,26 +896,38 @@ class SearchTools:
             return []
 
         place_ids = place_ids[:7]
+        known_places = known_places or {}
 
-        return self.get_places_details(place_ids)
+        missing_ids = [place_id for place_id in place_ids if place_id not in known_places]
+        details_map = {}
+        if missing_ids:
+            details_map = {place["id"]: place for place in self.get_places_details(missing_ids)}
 
-    def get_all_districts(self) -> list[str]:
+        # Порядок мест - как выбрал агент
+        places = []
+        for place_id in place_ids:
+            place = known_places.get(place_id) or details_map.get(place_id)
+            if place is not None:
+                places.append(place)
+
+        return places
+
+    def _load_all_districts(self) -> list[str]:
         """
-        Получить список всех районов из базы данных.
+        Загрузить список всех районов из базы данных.
         """
         logger.info("get_all_districts: loading districts from database")
 
         session: Session = None
         try:
             session = self.db_manager.get_session()
-            districts = (
-                session.query(Place.district)
-                .filter(Place.district.isnot(None))
+            districts = session.execute(
+                select(Place.district)
+                .where(Place.district.isnot(None))
                 .distinct()
                 .order_by(Place.district)
-                .all()
-            )
-            district_list = [d[0] for d in districts if d[0]]
+            ).scalars()
+            district_list = [district for district in districts if district]
             logger.info(f"Loaded {len(district_list)} districts")
             return district_list
         except Exception as e:
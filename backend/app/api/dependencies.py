@@ -2,7 +2,7 @@ import logging
 from typing import Optional
 
 from app.core.security import TokenData, verify_telegram_bot_token, verify_token
-from fastapi import Depends, Header, HTTPException, status
+from fastapi import Depends, Header, HTTPException, Request, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
 logger = logging.getLogger(__name__)
@@ -50,10 +50,14 @@ async def verify_bot_token(x_bot_token: Optional[str] = Header(None)) -> bool:
 
 
 async def get_telegram_id_from_token(
+    request: Request,
     credentials: HTTPAuthorizationCredentials = Depends(security),
 ) -> int:
     """
     Получить telegram_id из JWT токена.
+
+    telegram_id сохраняется в request.state - по нему считаются лимиты запросов.
     """
     token_data = await get_current_user(credentials)
+    request.state.telegram_id = token_data.telegram_id
     return token_data.telegram_id
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 
 from app.core.database import DatabaseManager, get_db_manager
@@ -9,41 +10,42 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
+async def _check_postgres(db_manager: DatabaseManager) -> None:
+    async with db_manager.get_async_session() as session:
+        await session.execute(text("SELECT 1"))
+
+
+async def _check_qdrant(db_manager: DatabaseManager) -> None:
+    await db_manager.get_qdrant_async().get_collections()
+
+
+async def _check_redis(db_manager: DatabaseManager) -> None:
+    redis = await db_manager.get_redis()
+    await redis.ping()
+
+
 @router.get("/health")
 async def health_check(db_manager: DatabaseManager = Depends(get_db_manager)):
+    """
+    Проверка доступности сервисов.
+
+    Сервисы проверяются параллельно: время ответа - максимум, а не сумма задержек.
+    """
     status = {"status": "healthy", "services": {}}
 
-    # PostgreSQL
-    try:
-        session = db_manager.get_session()
-        try:
-            session.execute(text("SELECT 1"))
-            status["services"]["postgresql"] = "ok"
-        finally:
-            session.close()
-    except Exception as e:
-        logger.error(f"PostgreSQL health check failed: {e}")
-        status["services"]["postgresql"] = "error"
-        status["status"] = "unhealthy"
-
-    # Qdrant
-    try:
-        qdrant = db_manager.get_qdrant()
-        qdrant.get_collections()
-        status["services"]["qdrant"] = "ok"
-    except Exception as e:
-        logger.error(f"Qdrant health check failed: {e}")
-        status["services"]["qdrant"] = "error"
-        status["status"] = "unhealthy"
-
-    # Redis
-    try:
-        redis = await db_manager.get_redis()
-        await redis.ping()
-        status["services"]["redis"] = "ok"
-    except Exception as e:
-        logger.error(f"Redis health check failed: {e}")
-        status["services"]["redis"] = "error"
-        status["status"] = "unhealthy"
+    checks = {
+        "postgresql": _check_postgres(db_manager),
+        "qdrant": _check_qdrant(db_manager),
+        "redis": _check_redis(db_manager),
+    }
+    results = await asyncio.gather(*checks.values(), return_exceptions=True)
+
+    for service, result in zip(checks, results):
+        if isinstance(result, Exception):
+            logger.error(f"{service} health check failed: {result}")
+            status["services"][service] = "error"
+            status["status"] = "unhealthy"
+        else:
+            status["services"][service] = "ok"
 
     return status
@@ -1,6 +1,9 @@
 import logging
+from typing import Optional
 
+import orjson
 from app.agent.agent import PlacesRecommendationAgent
+from app.agent.tools import profile_cache_key
 from app.api.dependencies import get_telegram_id_from_token
 from app.api.schemas import (
     ClearSessionResponse,
@@ -9,42 +12,157 @@ from app.api.schemas import (
     SendMessageRequest,
     SendMessageResponse,
 )
-from app.core.database import DatabaseManager, get_db_manager
+from app.core.config import settings
+from app.core.database import DatabaseManager, get_db, get_db_manager
 from app.middleware.rate_limit import limiter
 from app.services.session import SessionManager
 from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Сохранение взаимодействия и обновление профиля одним запросом:
+# - теги и район места (из параметров, если они есть в кэше Redis, иначе из БД);
+# - запись взаимодействия;
+# - создание профиля или обновление его предпочтений (liked - теги в предпочтения,
+#   район в любимые, теги убираются из избегаемых; disliked - наоборот).
+# Если места нет в БД, ни взаимодействие, ни профиль не записываются и запрос
+# не возвращает строк (эндпоинт отвечает 404).
+# Теги и район возвращаются вместе с профилем для записи в кэш, профиль целиком
+# (включая последние понравившиеся места) - для записи в кэш профилей.
+# Массивы объединяются фильтром <> ALL без DISTINCT/EXCEPT: без сортировки и хэширования,
+# сохраненные теги остаются в исходном порядке, новые добавляются в конец.
+_SAVE_INTERACTION_SQL = text(
+    """
+    WITH place_info AS (
+        SELECT CAST(:district AS TEXT) AS district, CAST(:tag_names AS TEXT[]) AS tag_names
+        WHERE CAST(:cached AS BOOLEAN)
+        UNION ALL
+        SELECT
+            p.district,
+            COALESCE(
+                array_agg(t.name) FILTER (WHERE t.name IS NOT NULL), '{}'::text[]
+            ) AS tag_names
+        FROM places p
+        LEFT JOIN place_tags pt ON pt.place_id = p.id
+        LEFT JOIN tags t ON t.id = pt.tag_id
+        WHERE NOT CAST(:cached AS BOOLEAN) AND p.id = CAST(:place_id AS BIGINT)
+        GROUP BY p.id
+    ),
+    new_interaction AS (
+        INSERT INTO user_interactions (telegram_id, place_id, interaction_type, created_at)
+        SELECT
+            CAST(:telegram_id AS BIGINT),
+            CAST(:place_id AS BIGINT),
+            CAST(:interaction_type AS TEXT),
+            now()
+        FROM place_info
+    ),
+    profile AS (
+        INSERT INTO user_profiles AS up (
+            telegram_id, preferred_tags, avoided_tags, favorite_districts
+        )
+        SELECT
+            CAST(:telegram_id AS BIGINT),
+            CASE WHEN :interaction_type = 'liked' THEN pi.tag_names ELSE '{}'::text[] END,
+            CASE WHEN :interaction_type = 'disliked' THEN pi.tag_names ELSE '{}'::text[] END,
+            CASE
+                WHEN :interaction_type = 'liked' AND pi.district IS NOT NULL
+                THEN ARRAY[pi.district]
+                ELSE '{}'::text[]
+            END
+        FROM place_info pi
+        ON CONFLICT (telegram_id) DO UPDATE SET
+            preferred_tags = CASE
+                WHEN :interaction_type = 'liked' THEN COALESCE(up.preferred_tags, '{}') || ARRAY(
+                    SELECT tag FROM unnest(EXCLUDED.preferred_tags) AS tag
+                    WHERE tag <> ALL(COALESCE(up.preferred_tags, '{}'))
+                )
+                ELSE ARRAY(
+                    SELECT tag FROM unnest(COALESCE(up.preferred_tags, '{}')) AS tag
+                    WHERE tag <> ALL(EXCLUDED.avoided_tags)
+                )
+            END,
+            avoided_tags = CASE
+                WHEN :interaction_type = 'disliked' THEN COALESCE(up.avoided_tags, '{}') || ARRAY(
+                    SELECT tag FROM unnest(EXCLUDED.avoided_tags) AS tag
+                    WHERE tag <> ALL(COALESCE(up.avoided_tags, '{}'))
+                )
+                ELSE ARRAY(
+                    SELECT tag FROM unnest(COALESCE(up.avoided_tags, '{}')) AS tag
+                    WHERE tag <> ALL(EXCLUDED.preferred_tags)
+                )
+            END,
+            favorite_districts = COALESCE(up.favorite_districts, '{}') || ARRAY(
+                SELECT district FROM unnest(EXCLUDED.favorite_districts) AS district
+                WHERE district <> ALL(COALESCE(up.favorite_districts, '{}'))
+            )
+        RETURNING preferred_tags, avoided_tags, favorite_districts
+    )
+    SELECT
+        profile.*,
+        pi.district,
+        pi.tag_names,
+        -- Последние понравившиеся места, как в SearchTools.get_user_profile.
+        -- Новое взаимодействие не видно в снимке запроса, поэтому добавляется отдельно
+        CASE WHEN :interaction_type = 'liked' THEN ARRAY[CAST(:place_id AS BIGINT)] ELSE '{}' END
+        || ARRAY(
+            SELECT ui.place_id
+            FROM user_interactions ui
+            WHERE ui.telegram_id = CAST(:telegram_id AS BIGINT) AND ui.interaction_type = 'liked'
+            ORDER BY ui.created_at DESC
+            LIMIT CASE WHEN :interaction_type = 'liked' THEN 49 ELSE 50 END
+        ) AS visited_places
+    FROM profile
+    CROSS JOIN place_info pi
+    """
+)
 
-agent: PlacesRecommendationAgent = None
-session_manager: SessionManager = None
 
+async def _prepare_message_context(
+    session_mgr: SessionManager, telegram_id: int, payload: SendMessageRequest
+) -> tuple[list[dict[str, str]], Optional[float], Optional[float]]:
+    """
+    Загрузка истории чата и геоданных пользователя, сохранение нового сообщения.
+
+    Если геоданные переданы в запросе, они сохраняются для будущих запросов,
+    иначе используются сохраненные ранее.
+    """
+    chat_history, saved_location = await session_mgr.get_history_and_location(
+        telegram_id, user_message=payload.message
+    )
 
-def get_agent(db_manager: DatabaseManager = Depends(get_db_manager)) -> PlacesRecommendationAgent:
-    global agent
-    if agent is None:
-        agent = PlacesRecommendationAgent(db_manager)
-    return agent
+    user_latitude = payload.latitude
+    user_longitude = payload.longitude
 
+    if user_latitude is not None and user_longitude is not None:
+        await session_mgr.save_user_location(telegram_id, user_latitude, user_longitude)
+        logger.info(
+            f"Saved location from request for user {telegram_id}: ({user_latitude}, {user_longitude})"
+        )
+    elif saved_location:
+        user_latitude = saved_location.get("latitude")
+        user_longitude = saved_location.get("longitude")
+        logger.info(
+            f"Using saved location for user {telegram_id}: ({user_latitude}, {user_longitude})"
+        )
 
-def get_session_manager(db_manager: DatabaseManager = Depends(get_db_manager)) -> SessionManager:
-    global session_manager
-    if session_manager is None:
-        session_manager = SessionManager(db_manager)
-    return session_manager
+    return chat_history, user_latitude, user_longitude
 
 
-@router.post("/send_message", response_model=SendMessageResponse)
-@limiter.limit("20/minute")  # 20 запросов в минуту на пользователя
+# Модели ответов только описывают схему в OpenAPI: словари отдаются ORJSONResponse
+# напрямую, без валидации и сериализации ответа через pydantic
+@router.post("/send_message", responses={200: {"model": SendMessageResponse}})
+# 20 запросов в минуту на пользователя, общий лимит с send_message_stream
+@limiter.shared_limit("20/minute", scope="send_message")
 async def send_message(
     request: Request,
     payload: SendMessageRequest,
     telegram_id: int = Depends(get_telegram_id_from_token),
-    agent: PlacesRecommendationAgent = Depends(get_agent),
-    session_mgr: SessionManager = Depends(get_session_manager),
 ):
     """
     Эндпоинт для отправки сообщений.
@@ -57,26 +175,13 @@ async def send_message(
 
     Если геоданные не переданы в запросе, используются сохраненные ранее геоданные пользователя.
     """
-    try:
-        chat_history = await session_mgr.get_chat_history(telegram_id)
-        await session_mgr.add_message(telegram_id, "user", payload.message)
+    agent: PlacesRecommendationAgent = request.app.state.agent
+    session_mgr: SessionManager = request.app.state.session_manager
 
-        user_latitude = payload.latitude
-        user_longitude = payload.longitude
-
-        if user_latitude is not None and user_longitude is not None:
-            await session_mgr.save_user_location(telegram_id, user_latitude, user_longitude)
-            logger.info(
-                f"Saved location from request for user {telegram_id}: ({user_latitude}, {user_longitude})"
-            )
-        else:
-            saved_location = await session_mgr.get_user_location(telegram_id)
-            if saved_location:
-                user_latitude = saved_location.get("latitude")
-                user_longitude = saved_location.get("longitude")
-                logger.info(
-                    f"Using saved location for user {telegram_id}: ({user_latitude}, {user_longitude})"
-                )
+    try:
+        chat_history, user_latitude, user_longitude = await _prepare_message_context(
+            session_mgr, telegram_id, payload
+        )
 
         result = await agent.process_message(
             message=payload.message,
@@ -89,7 +194,7 @@ async def send_message(
         response_text = result.get("text", "") if isinstance(result, dict) else result
         await session_mgr.add_message(telegram_id, "assistant", response_text)
 
-        return SendMessageResponse(ok=True, response=result, telegram_id=telegram_id)
+        return {"ok": True, "response": result, "telegram_id": telegram_id}
 
     except HTTPException:
         raise
@@ -98,32 +203,75 @@ async def send_message(
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.delete("/session", response_model=ClearSessionResponse)
+@router.post("/send_message/stream")
+@limiter.shared_limit("20/minute", scope="send_message")  # общий лимит с send_message
+async def send_message_stream(
+    request: Request,
+    payload: SendMessageRequest,
+    telegram_id: int = Depends(get_telegram_id_from_token),
+):
+    """
+    Потоковый вариант send_message.
+
+    Ответ в формате NDJSON: строки {"type": "token", "text": "..."} с фрагментами
+    финального ответа по мере генерации и последняя строка {"type": "result", ...}
+    с полным ответом (text, places, response_type).
+    """
+    agent: PlacesRecommendationAgent = request.app.state.agent
+    session_mgr: SessionManager = request.app.state.session_manager
+
+    try:
+        chat_history, user_latitude, user_longitude = await _prepare_message_context(
+            session_mgr, telegram_id, payload
+        )
+    except Exception as e:
+        logger.error(f"Error preparing message context: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def event_stream():
+        async for event in agent.stream_message(
+            message=payload.message,
+            telegram_id=telegram_id,
+            chat_history=chat_history,
+            user_latitude=user_latitude,
+            user_longitude=user_longitude,
+        ):
+            if event["type"] == "result":
+                await session_mgr.add_message(telegram_id, "assistant", event["text"])
+            yield orjson.dumps(event, default=str) + b"\n"
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+
+@router.delete("/session", responses={200: {"model": ClearSessionResponse}})
 async def clear_session(
+    request: Request,
     telegram_id: int = Depends(get_telegram_id_from_token),
-    session_mgr: SessionManager = Depends(get_session_manager),
 ):
     """
     Очистить сессию текущего пользователя (включая историю чата и геолокацию).
     """
+    session_mgr: SessionManager = request.app.state.session_manager
+
     try:
         await session_mgr.clear_session(telegram_id)
         await session_mgr.clear_user_location(telegram_id)
 
-        return ClearSessionResponse(ok=True, message=f"Session cleared for user {telegram_id}")
+        return {"ok": True, "message": f"Session cleared for user {telegram_id}"}
 
     except Exception as e:
         logger.error(f"Error clearing session: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/interaction", response_model=InteractionResponse)
+@router.post("/interaction", responses={200: {"model": InteractionResponse}})
 @limiter.limit("60/minute")  # 60 запросов в минуту
 async def save_interaction(
     request: Request,
     payload: InteractionRequest,
     telegram_id: int = Depends(get_telegram_id_from_token),
     db_manager: DatabaseManager = Depends(get_db_manager),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Сохранение взаимодействия пользователя с местом (like/dislike).
@@ -133,97 +281,84 @@ async def save_interaction(
         "interaction_type": "liked" | "disliked"
     }
     """
-    from app.core.models import Place, Tag, UserInteraction, UserProfile, place_tags
-    from sqlalchemy.orm import Session
+    session_mgr: SessionManager = request.app.state.session_manager
 
     try:
         place_id = payload.place_id
         interaction_type = payload.interaction_type
 
-        session: Session = db_manager.get_session()
-
-        try:
-            profile = session.query(UserProfile).filter_by(telegram_id=telegram_id).first()
-            if not profile:
-                profile = UserProfile(
-                    telegram_id=telegram_id,
-                    preferred_tags=[],
-                    avoided_tags=[],
-                    favorite_districts=[],
-                )
-                session.add(profile)
-                session.flush()
-
-            interaction = UserInteraction(
-                telegram_id=telegram_id, place_id=place_id, interaction_type=interaction_type
-            )
-            session.add(interaction)
-
-            place = session.query(Place).filter_by(id=place_id).first()
-            if place:
-                place_tags_query = (
-                    session.query(Tag.name)
-                    .join(place_tags, Tag.id == place_tags.c.tag_id)
-                    .filter(place_tags.c.place_id == place_id)
-                )
-                place_tag_names = [tag.name for tag in place_tags_query.all()]
-
-                if interaction_type == "liked":
-                    if place_tag_names:
-                        current_preferred = set(profile.preferred_tags or [])
-                        current_avoided = set(profile.avoided_tags or [])
+        # Теги и район места из кэша избавляют запрос от JOIN по place_tags и tags
+        place_meta = await session_mgr.get_place_meta(place_id)
 
-                        current_preferred.update(place_tag_names)
-
-                        current_avoided -= set(place_tag_names)
-
-                        profile.preferred_tags = list(current_preferred)
-                        profile.avoided_tags = list(current_avoided)
-
-                    if place.district:
-                        current_districts = set(profile.favorite_districts or [])
-                        current_districts.add(place.district)
-                        profile.favorite_districts = list(current_districts)
-
-                elif interaction_type == "disliked":
-                    if place_tag_names:
-                        current_avoided = set(profile.avoided_tags or [])
-                        current_preferred = set(profile.preferred_tags or [])
-
-                        current_avoided.update(place_tag_names)
-
-                        current_preferred -= set(place_tag_names)
-
-                        profile.avoided_tags = list(current_avoided)
-                        profile.preferred_tags = list(current_preferred)
-
-                logger.info(
-                    f"Updated profile for user {telegram_id}: "
-                    f"preferred_tags={len(profile.preferred_tags or [])}, "
-                    f"avoided_tags={len(profile.avoided_tags or [])}, "
-                    f"favorite_districts={len(profile.favorite_districts or [])}"
-                )
-
-            session.commit()
-
-            logger.info(
-                f"Saved {interaction_type} interaction: user={telegram_id}, place={place_id}"
-            )
-
-            return InteractionResponse(
-                ok=True,
-                interaction={
+        profile = (
+            await db.execute(
+                _SAVE_INTERACTION_SQL,
+                {
                     "telegram_id": telegram_id,
                     "place_id": place_id,
                     "interaction_type": interaction_type,
+                    "cached": place_meta is not None,
+                    "tag_names": place_meta["tags"] if place_meta else None,
+                    "district": place_meta["district"] if place_meta else None,
                 },
             )
+        ).one_or_none()
+        if profile is None:
+            raise HTTPException(status_code=404, detail=f"Place {place_id} not found")
+        await db.commit()
+
+        if place_meta is None:
+            await session_mgr.save_place_meta(place_id, profile.tag_names, profile.district)
+
+        logger.info(
+            f"Updated profile for user {telegram_id}: "
+            f"preferred_tags={len(profile.preferred_tags or [])}, "
+            f"avoided_tags={len(profile.avoided_tags or [])}, "
+            f"favorite_districts={len(profile.favorite_districts or [])}"
+        )
+        logger.info(f"Saved {interaction_type} interaction: user={telegram_id}, place={place_id}")
 
-        finally:
-            session.close()
+        # Новая версия профиля сразу записывается в кэш: следующее чтение
+        # агентом не идет в БД. Формат - как у SearchTools.get_user_profile.
+        # Взаимодействие уже сохранено: ошибка кэша только логируется
+        profile_key = profile_cache_key(telegram_id)
+        redis = None
+        try:
+            redis = await db_manager.get_redis()
+            await redis.set(
+                profile_key,
+                orjson.dumps(
+                    {
+                        "telegram_id": telegram_id,
+                        "preferred_tags": profile.preferred_tags or [],
+                        "avoided_tags": profile.avoided_tags or [],
+                        "favorite_districts": profile.favorite_districts or [],
+                        "visited_places": profile.visited_places or [],
+                        "is_empty": False,
+                    }
+                ),
+                ex=settings.PROFILE_CACHE_TTL,
+            )
+        except Exception as e:
+            logger.warning(f"Failed to update profile cache: {e}")
+            if redis is not None:
+                try:
+                    await redis.delete(profile_key)
+                except Exception as e:
+                    logger.warning(f"Failed to invalidate profile cache: {e}")
+
+        return {
+            "ok": True,
+            "interaction": {
+                "telegram_id": telegram_id,
+                "place_id": place_id,
+                "interaction_type": interaction_type,
+            },
+        }
 
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error saving interaction: {e}", exc_info=True)
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
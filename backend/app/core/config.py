@@ -1,3 +1,5 @@
+import json
+import os
 from typing import Optional, Union
 
 from pydantic import field_validator
@@ -23,28 +25,82 @@ class Settings(BaseSettings):
     POSTGRES_DB: str = "places_db"
     POSTGRES_USER: str = "places_user"
     POSTGRES_PASSWORD: str = "places_password"
+    # Размеры кэшей скомпилированных запросов SQLAlchemy и prepared statements asyncpg
+    POSTGRES_QUERY_CACHE_SIZE: int = 500
+    POSTGRES_STATEMENT_CACHE_SIZE: int = 256
 
     # Qdrant
     QDRANT_HOST: str = "localhost"
     QDRANT_PORT: int = 6333
+    QDRANT_GRPC_PORT: int = 6334
     QDRANT_COLLECTION: str = "places"
+    # Параметры поиска: размер списка кандидатов HNSW и запас кандидатов
+    # для пересчета скоров по оригинальным векторам (коллекция с int8 квантизацией)
+    QDRANT_HNSW_EF: int = 64
+    QDRANT_OVERSAMPLING: float = 2.0
 
     # Redis
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
     REDIS_PASSWORD: Optional[str] = None
+    # Максимум соединений в пуле асинхронного клиента Redis
+    REDIS_MAX_CONNECTIONS: int = 50
     SESSION_TTL: int = 86400  # 24 hours
+    # Максимум сообщений в истории чата пользователя
+    CHAT_HISTORY_LIMIT: int = 20
 
     # OpenAI / LLM
     LLM_BASE_URL: str = "https://openrouter.ai/api/v1"
     OPENAI_API_KEY: str = ""  # ОБЯЗАТЕЛЬНО: укажите в .env
     OPENAI_MODEL: str = "google/gemini-2.5-flash"
     OPENAI_TEMPERATURE: float = 0.7
+    # Маркер cache_control для статического префикса промпта (OpenRouter/Anthropic).
+    # Для прямого OpenAI API отключите: там кэширование префикса автоматическое
+    LLM_PROMPT_CACHE_CONTROL: bool = True
+    # Уровень обслуживания OpenAI (например "priority" - ниже задержка, "flex" - дешевле)
+    LLM_SERVICE_TIER: Optional[str] = None
+    # performanceConfig latency=optimized для Bedrock/Anthropic через прокси
+    LLM_LATENCY_OPTIMIZED: bool = False
+    # Лимиты ReAct цикла: самый длинный сценарий (поиск -> профиль -> ранжирование ->
+    # выбор мест -> ответ) укладывается в 5 итераций, +1 на исправление формата
+    AGENT_MAX_ITERATIONS: int = 6
+    AGENT_MAX_EXECUTION_TIME: float = 60.0  # секунды
+    # Количество последних сообщений истории, передаваемых агенту.
+    # Большее окно дольше сохраняет начало истории неизменным для кэша префикса
+    AGENT_HISTORY_MESSAGES: int = 10
+    # Быстрый путь без LLM для однозначных запросов ("кафе рядом с Кремлем")
+    AGENT_FAST_ROUTING: bool = True
+    # Упреждающий геопоиск вокруг пользователя параллельно с первым вызовом LLM
+    AGENT_SPECULATIVE_GEO: bool = True
+    # Потоки для блокирующих вызовов инструментов (запросы к БД, эмбеддинги)
+    AGENT_TOOL_THREADS: int = min(32, (os.cpu_count() or 1) * 2)
+
+    # Семантический кэш ответов агента (похожие запросы без истории диалога)
+    SEMANTIC_CACHE_ENABLED: bool = True
+    SEMANTIC_CACHE_SIZE: int = 10000
+    SEMANTIC_CACHE_TTL: int = 86400  # 24 hours
+    SEMANTIC_CACHE_THRESHOLD: float = 0.95  # минимальная косинусная близость
+
+    # Время жизни кэша справочных данных (теги, районы) в секундах
+    REFERENCE_DATA_TTL: int = 3600
 
     # Embeddings
     OPENAI_EMBEDDING_BASE_URL: str = "https://localhost:1234/v1"
     OPENAI_EMBEDDING_MODEL: str = "text-embedding-bge-m3"
     OPENAI_EMBEDDING_DIM: int = 1024
+    # Пакетирование эмбеддингов: максимум текстов в пакете и окно ожидания (мс)
+    EMBEDDING_BATCH_SIZE: int = 64
+    EMBEDDING_BATCH_WAIT_MS: int = 20
+    # Максимальное ожидание эмбеддинга из пакета в секундах
+    EMBEDDING_TIMEOUT: float = 30.0
+    # Время жизни эмбеддингов запросов в Redis в секундах (7 дней)
+    EMBEDDING_CACHE_TTL: int = 604800
+
+    # Время жизни профиля пользователя в кэше Redis в секундах
+    # (профиль обновляется в кэше при каждом сохранении взаимодействия)
+    PROFILE_CACHE_TTL: int = 3600
+    # Время жизни тегов и района места в кэше Redis в секундах (24 часа)
+    PLACE_META_CACHE_TTL: int = 86400
 
     # Telegram
     TELEGRAM_BOT_TOKEN: str = ""  # ОБЯЗАТЕЛЬНО: укажите в .env
@@ -57,35 +113,26 @@ class Settings(BaseSettings):
 
     @field_validator("ALLOWED_ORIGINS", mode="before")
     @classmethod
-    def parse_allowed_origins(cls, v):
-        import json
-
+    def parse_allowed_origins(cls, v) -> list[str]:
+        """
+        Список origins из JSON массива или строки через запятую. Некорректное значение - [].
+        """
         if isinstance(v, list):
             return v
 
-        if not v or (isinstance(v, str) and not v.strip()):
+        if not isinstance(v, str) or not v.strip():
             return []
 
-        if isinstance(v, str):
-            v_stripped = v.strip()
-            if v_stripped.startswith("["):
-                try:
-                    parsed = json.loads(v_stripped)
-                    if isinstance(parsed, list):
-                        return parsed
-                except (json.JSONDecodeError, ValueError):
-                    pass
-
-            return [origin.strip() for origin in v_stripped.split(",") if origin.strip()]
+        v_stripped = v.strip()
+        if v_stripped.startswith("["):
+            try:
+                parsed = json.loads(v_stripped)
+                if isinstance(parsed, list):
+                    return parsed
+            except ValueError:
+                pass
 
-        return v
-
-    @field_validator("ALLOWED_ORIGINS", mode="after")
-    @classmethod
-    def ensure_allowed_origins_is_list(cls, v):
-        if not isinstance(v, list):
-            return []
-        return v
+        return [origin.strip() for origin in v_stripped.split(",") if origin.strip()]
 
     # Phoenix Tracing
     PHOENIX_ENABLED: bool = True
@@ -96,6 +143,10 @@ class Settings(BaseSettings):
     def postgres_url(self) -> str:
         return f"postgresql://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
 
+    @property
+    def postgres_async_url(self) -> str:
+        return f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
+
     @property
     def redis_url(self) -> str:
         if self.REDIS_PASSWORD:
@@ -1,10 +1,17 @@
 import logging
-from typing import Optional
+from typing import AsyncIterator, Optional
 
+import redis
 import redis.asyncio as aioredis
 from app.core.config import settings
-from qdrant_client import QdrantClient
-from sqlalchemy import create_engine
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.orm import Session, sessionmaker
 
 logger = logging.getLogger(__name__)
@@ -15,9 +22,13 @@ class DatabaseManager:
 
     def __init__(self):
         self._qdrant_client: Optional[QdrantClient] = None
+        self._qdrant_async_client: Optional[AsyncQdrantClient] = None
         self._redis_client: Optional[aioredis.Redis] = None
+        self._redis_sync_client: Optional[redis.Redis] = None
         self._engine = None
         self._session_factory = None
+        self._async_engine: Optional[AsyncEngine] = None
+        self._async_session_factory: Optional[async_sessionmaker[AsyncSession]] = None
 
     def get_engine(self):
         if self._engine is None:
@@ -45,20 +56,118 @@ class DatabaseManager:
         factory = self.get_session_factory()
         return factory()
 
+    def get_async_engine(self) -> AsyncEngine:
+        """
+        Асинхронный engine (asyncpg) для запросов из обработчиков FastAPI без блокировки event loop.
+        """
+        if self._async_engine is None:
+            self._async_engine = create_async_engine(
+                settings.postgres_async_url,
+                pool_pre_ping=True,
+                pool_size=20,
+                max_overflow=10,
+                pool_recycle=3600,
+                # Кэш скомпилированных SQLAlchemy запросов
+                query_cache_size=settings.POSTGRES_QUERY_CACHE_SIZE,
+                # Кэш prepared statements asyncpg на каждом соединении: повторный запрос
+                # с тем же SQL не разбирается и не планируется сервером заново
+                connect_args={
+                    "prepared_statement_cache_size": settings.POSTGRES_STATEMENT_CACHE_SIZE
+                },
+            )
+            logger.info("SQLAlchemy async engine created")
+        return self._async_engine
+
+    def get_async_session_factory(self) -> async_sessionmaker[AsyncSession]:
+        if self._async_session_factory is None:
+            self._async_session_factory = async_sessionmaker(
+                bind=self.get_async_engine(),
+                autoflush=False,
+                expire_on_commit=False,
+            )
+            logger.info("SQLAlchemy async session factory created")
+        return self._async_session_factory
+
+    def get_async_session(self) -> AsyncSession:
+        factory = self.get_async_session_factory()
+        return factory()
+
     def get_qdrant(self) -> QdrantClient:
         if self._qdrant_client is None:
             self._qdrant_client = QdrantClient(host=settings.QDRANT_HOST, port=settings.QDRANT_PORT)
             logger.info("Qdrant client created")
         return self._qdrant_client
 
+    def get_qdrant_async(self) -> AsyncQdrantClient:
+        """
+        Асинхронный клиент Qdrant (gRPC) для поиска из event loop без блокировки.
+        """
+        if self._qdrant_async_client is None:
+            self._qdrant_async_client = AsyncQdrantClient(
+                host=settings.QDRANT_HOST,
+                port=settings.QDRANT_PORT,
+                grpc_port=settings.QDRANT_GRPC_PORT,
+                prefer_grpc=True,
+            )
+            logger.info("Async Qdrant client created")
+        return self._qdrant_async_client
+
     async def get_redis(self) -> aioredis.Redis:
         if self._redis_client is None:
-            self._redis_client = await aioredis.from_url(
-                settings.redis_url, encoding="utf-8", decode_responses=True
+            self._redis_client = aioredis.from_url(
+                settings.redis_url,
+                encoding="utf-8",
+                decode_responses=True,
+                max_connections=settings.REDIS_MAX_CONNECTIONS,
+                health_check_interval=30,
+                socket_keepalive=True,
             )
             logger.info("Redis client created")
         return self._redis_client
 
+    async def init_async(self):
+        """
+        Создание асинхронных клиентов при старте приложения.
+
+        Первый запрос не тратит время на подключение, а одновременные первые
+        запросы не создают несколько клиентов.
+        """
+        redis = await self.get_redis()
+        try:
+            await redis.ping()
+        except Exception as e:
+            # Без Redis приложение работает (кэши и история недоступны), не блокируем старт
+            logger.warning(f"Redis is unavailable at startup: {e}")
+
+        async with self.get_async_session_factory().begin() as session:
+            await session.execute(text("SELECT 1"))
+
+        logger.info("Async clients initialized")
+
+    def get_redis_sync(self) -> redis.Redis:
+        """
+        Синхронный клиент Redis для инструментов агента (выполняются в потоках).
+
+        Ответы не декодируются: в кэше хранятся бинарные данные (векторы).
+        """
+        if self._redis_sync_client is None:
+            self._redis_sync_client = redis.Redis.from_url(settings.redis_url)
+            logger.info("Sync Redis client created")
+        return self._redis_sync_client
+
+    async def close_async(self):
+        if self._redis_client:
+            await self._redis_client.aclose()
+            logger.info("Redis client closed")
+
+        if self._async_engine:
+            await self._async_engine.dispose()
+            logger.info("SQLAlchemy async engine closed")
+
+        if self._qdrant_async_client:
+            await self._qdrant_async_client.close()
+            logger.info("Async Qdrant client closed")
+
     def close_all(self):
         if self._engine:
             self._engine.dispose()
@@ -68,9 +177,21 @@ class DatabaseManager:
             self._qdrant_client.close()
             logger.info("Qdrant client closed")
 
+        if self._redis_sync_client:
+            self._redis_sync_client.close()
+            logger.info("Sync Redis client closed")
+
 
 db_manager = DatabaseManager()
 
 
 def get_db_manager() -> DatabaseManager:
     return db_manager
+
+
+async def get_db() -> AsyncIterator[AsyncSession]:
+    """
+    Асинхронная сессия БД на время обработки запроса (FastAPI dependency).
+    """
+    async with db_manager.get_async_session() as session:
+        yield session
@@ -41,7 +41,8 @@ class Place(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # Relationships
-    tags = relationship("Tag", secondary="place_tags", back_populates="places")
+    # lazy="raise": теги загружаются только явно (selectinload), без скрытых N+1 запросов
+    tags = relationship("Tag", secondary="place_tags", back_populates="places", lazy="raise")
     interactions = relationship("UserInteraction", back_populates="place")
 
     __table_args__ = (
@@ -113,7 +114,13 @@ class UserInteraction(Base):
     place = relationship("Place", back_populates="interactions")
 
     __table_args__ = (
-        Index("idx_user_interactions_telegram", "telegram_id"),
         Index("idx_user_interactions_place", "place_id"),
-        Index("idx_user_interactions_type", "interaction_type"),
+        # Покрывает и запросы только по telegram_id (префикс индекса)
+        Index(
+            "idx_user_interactions_user_type_created",
+            "telegram_id",
+            "interaction_type",
+            created_at.desc(),
+            postgresql_include=["place_id"],
+        ),
     )
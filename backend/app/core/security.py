@@ -1,4 +1,6 @@
+import functools
 import logging
+import time
 from datetime import datetime, timedelta
 from typing import Optional
 
@@ -11,6 +13,12 @@ logger = logging.getLogger(__name__)
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Ключ и параметры проверки JWT готовятся один раз при импорте, а не при каждом вызове
+_JWT_KEY = settings.JWT_SECRET_KEY.encode()
+_JWT_ALGORITHMS = [settings.JWT_ALGORITHM]
+# Токены без exp или telegram_id отклоняются самим PyJWT; aud в токенах не используется
+_JWT_DECODE_OPTIONS = {"require": ["exp", "telegram_id"], "verify_aud": False}
+
 
 class TokenData(BaseModel):
     """
@@ -28,19 +36,29 @@ def create_access_token(telegram_id: int, expires_delta: Optional[timedelta] = N
     expire = datetime.utcnow() + expires_delta
     to_encode = {"telegram_id": telegram_id, "exp": expire}
 
-    encoded_jwt = jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, _JWT_KEY, algorithm=settings.JWT_ALGORITHM)
     return encoded_jwt
 
 
-def verify_token(token: str) -> Optional[TokenData]:
+@functools.lru_cache(maxsize=10_000)
+def _decode_token(token: str) -> Optional[tuple[int, Optional[float]]]:
+    """
+    Проверка подписи и разбор JWT токена: (telegram_id, exp) или None.
+
+    Результат кэшируется по строке токена - один и тот же токен приходит с каждым
+    запросом пользователя, HMAC проверяется один раз. Срок действия сверяется
+    при каждом обращении в verify_token.
+    """
     try:
-        payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+        payload = jwt.decode(
+            token, _JWT_KEY, algorithms=_JWT_ALGORITHMS, options=_JWT_DECODE_OPTIONS
+        )
         telegram_id: int = payload.get("telegram_id")
 
         if telegram_id is None:
             return None
 
-        return TokenData(telegram_id=telegram_id)
+        return telegram_id, payload.get("exp")
 
     except jwt.ExpiredSignatureError:
         logger.warning("Token expired")
@@ -50,5 +68,18 @@ def verify_token(token: str) -> Optional[TokenData]:
         return None
 
 
+def verify_token(token: str) -> Optional[TokenData]:
+    decoded = _decode_token(token)
+    if decoded is None:
+        return None
+
+    telegram_id, exp = decoded
+    if exp is not None and exp <= time.time():
+        logger.warning("Token expired")
+        return None
+
+    return TokenData(telegram_id=telegram_id)
+
+
 def verify_telegram_bot_token(token: str) -> bool:
     return token == settings.BOT_API_TOKEN
@@ -0,0 +1,28 @@
+import logging
+
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCompressionMiddleware(GZipMiddleware):
+    """
+    GZip сжатие ответов, кроме потоковых эндпоинтов.
+
+    Потоковые ответы (NDJSON с токенами) не сжимаются: буфер gzip задерживал бы
+    отправку фрагментов клиенту.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["path"].endswith("/stream"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+def setup_compression(app):
+    # Ответы меньше 1 КБ не сжимаются: выигрыш меньше накладных расходов
+    app.add_middleware(ResponseCompressionMiddleware, minimum_size=1024, compresslevel=5)
+
+    logger.info("Response compression configured")
@@ -1,15 +1,36 @@
 import logging
 
+from app.core.config import settings
+from fastapi import Request
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from slowapi.util import get_remote_address
 
 logger = logging.getLogger(__name__)
 
+
+def get_rate_limit_key(request: Request) -> str:
+    """
+    Ключ лимита: telegram_id из JWT (его сохраняет зависимость авторизации),
+    для запросов без авторизации - IP адрес.
+
+    Пользователи за одним NAT не делят общий лимит.
+    """
+    telegram_id = getattr(request.state, "telegram_id", None)
+    if telegram_id is not None:
+        return f"user:{telegram_id}"
+    return get_remote_address(request)
+
+
+# Счетчики в Redis - лимит общий для всех воркеров uvicorn.
+# Если Redis недоступен, лимиты временно считаются в памяти процесса.
 limiter = Limiter(
-    key_func=get_remote_address,
+    key_func=get_rate_limit_key,
     default_limits=["100/minute", "1000/hour"],
-    storage_uri="memory://",
+    storage_uri=settings.redis_url,
+    storage_options={"socket_keepalive": True},
+    strategy="moving-window",
+    in_memory_fallback_enabled=True,
 )
 
 
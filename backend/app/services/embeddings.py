@@ -0,0 +1,145 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Optional
+
+import httpx
+from app.core.config import settings
+from openai import OpenAI
+
+logger = logging.getLogger(__name__)
+
+_embedding_client: Optional[OpenAI] = None
+_embedding_client_lock = threading.Lock()
+
+
+def get_embedding_client() -> OpenAI:
+    """
+    Общий клиент API эмбеддингов.
+
+    Один на процесс: соединения (HTTP/2, keep-alive) переиспользуются между
+    запросами, TLS рукопожатие выполняется один раз.
+    """
+    global _embedding_client
+    if _embedding_client is None:
+        with _embedding_client_lock:
+            if _embedding_client is None:
+                _embedding_client = OpenAI(
+                    api_key=settings.OPENAI_API_KEY,
+                    base_url=settings.OPENAI_EMBEDDING_BASE_URL,
+                    http_client=httpx.Client(
+                        http2=True,
+                        limits=httpx.Limits(
+                            max_connections=100,
+                            max_keepalive_connections=50,
+                            keepalive_expiry=60,
+                        ),
+                    ),
+                )
+                logger.info("Embedding API client created")
+    return _embedding_client
+
+
+def close_embedding_client():
+    global _embedding_client
+    if _embedding_client is not None:
+        _embedding_client.close()
+        _embedding_client = None
+        logger.info("Embedding API client closed")
+
+
+class EmbeddingBatcher:
+    """
+    Объединение запросов эмбеддингов в пакеты.
+
+    Запросы из разных потоков, пришедшие в пределах max_wait секунд, отправляются
+    одним вызовом embeddings.create(input=[...]) - вместо HTTP запроса на каждый текст.
+    Пакет отправляется по истечении окна или при накоплении max_batch_size текстов.
+    Вызывающий поток ждет результат не дольше timeout секунд.
+    """
+
+    def __init__(
+        self,
+        client: OpenAI,
+        model: str,
+        max_batch_size: int = 64,
+        max_wait: float = 0.02,
+        timeout: float = 30.0,
+    ):
+        self.client = client
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.timeout = timeout
+
+        self._queue: queue.Queue[tuple[str, Future]] = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def embed(self, text: str) -> list[float]:
+        """
+        Эмбеддинг текста (блокирует вызывающий поток до отправки пакета).
+        """
+        return self.embed_many([text])[0]
+
+    def embed_many(self, texts: list[str]) -> list[list[float]]:
+        """
+        Эмбеддинги нескольких текстов: все тексты попадают в очередь сразу
+        и отправляются в одном пакете (или нескольких, если их больше max_batch_size).
+        """
+        self._ensure_worker()
+        futures: list[Future] = []
+        for text in texts:
+            future: Future = Future()
+            self._queue.put((text, future))
+            futures.append(future)
+        return [future.result(timeout=self.timeout) for future in futures]
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="embedding-batcher", daemon=True
+                )
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            self._flush(batch)
+
+    def _flush(self, batch: list[tuple[str, Future]]):
+        # Одинаковые тексты в пакете отправляются один раз
+        texts = list(dict.fromkeys(text for text, _ in batch))
+
+        # Любая ошибка (включая неполный ответ API) завершает ожидающие future исключением:
+        # иначе упадет единственный поток пакетирования и вызывающие будут ждать вечно
+        try:
+            response = self.client.embeddings.create(model=self.model, input=texts)
+            embeddings = {texts[item.index]: item.embedding for item in response.data}
+
+            if len(batch) > 1:
+                logger.info(f"Embedded batch: {len(batch)} requests, {len(texts)} unique texts")
+
+            for text, future in batch:
+                future.set_result(embeddings[text])
+        except Exception as e:
+            logger.error(f"Embedding batch of {len(texts)} failed: {e}", exc_info=True)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
@@ -0,0 +1,144 @@
+import copy
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+GeoBucket = Optional[tuple[float, float]]
+
+
+def geo_bucket(latitude: Optional[float], longitude: Optional[float]) -> GeoBucket:
+    """
+    Грубая географическая ячейка (~1 км) для ключа кэша.
+    """
+    if latitude is None or longitude is None:
+        return None
+    return round(latitude, 2), round(longitude, 2)
+
+
+class SemanticCache:
+    """
+    Семантический LRU-кэш ответов агента.
+
+    Ключ - эмбеддинг запроса и географическая ячейка пользователя. Ответ
+    возвращается, если в той же ячейке есть запрос с косинусной близостью
+    не ниже threshold. Векторы хранятся в заранее выделенной матрице, поиск -
+    одно матричное умножение.
+    """
+
+    def __init__(self, max_size: int, ttl: int, threshold: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+
+        self._vectors: Optional[np.ndarray] = None
+        self._expires_at = np.zeros(max_size, dtype=np.float64)
+        self._bucket_ids = np.full(max_size, -1, dtype=np.int64)
+        self._values: list[Optional[dict[str, Any]]] = [None] * max_size
+        # slot -> None в порядке использования (последний - самый свежий)
+        self._lru: OrderedDict[int, None] = OrderedDict()
+        # Ячейка каждого слота и число занятых слотов ячейки: ячейка удаляется из
+        # индекса вместе с последним слотом, поэтому индекс не растет без ограничений
+        self._slot_buckets: list[GeoBucket] = [None] * max_size
+        self._bucket_sizes: dict[GeoBucket, int] = {}
+        self._bucket_index: dict[GeoBucket, int] = {}
+        self._next_bucket_id = 0
+
+    def get(self, embedding: list[float], bucket: GeoBucket = None) -> Optional[dict[str, Any]]:
+        """
+        Найти закэшированный ответ на близкий запрос.
+        """
+        if self._vectors is None or not self._lru:
+            return None
+
+        bucket_id = self._bucket_index.get(bucket)
+        if bucket_id is None:
+            return None
+
+        query = self._normalize(embedding)
+        if query is None or query.shape[0] != self._vectors.shape[1]:
+            return None
+
+        scores = self._vectors @ query
+        active = (self._bucket_ids == bucket_id) & (self._expires_at > time.monotonic())
+        scores[~active] = -1.0
+
+        slot = int(np.argmax(scores))
+        if scores[slot] < self.threshold:
+            return None
+
+        self._lru.move_to_end(slot)
+        logger.info(f"Semantic cache hit: similarity={scores[slot]:.3f}")
+        # Копия: ответы из кэша не должны разделять вложенные списки (places)
+        return copy.deepcopy(self._values[slot])
+
+    def set(self, embedding: list[float], value: dict[str, Any], bucket: GeoBucket = None):
+        """
+        Сохранить ответ для запроса.
+        """
+        vector = self._normalize(embedding)
+        if vector is None:
+            return
+
+        if self._vectors is None:
+            self._vectors = np.zeros((self.max_size, vector.shape[0]), dtype=np.float32)
+        elif vector.shape[0] != self._vectors.shape[1]:
+            logger.warning("Semantic cache: embedding dimension changed, clearing cache")
+            self.clear()
+            self._vectors = np.zeros((self.max_size, vector.shape[0]), dtype=np.float32)
+
+        if len(self._lru) < self.max_size:
+            slot = len(self._lru)
+        else:
+            slot, _ = self._lru.popitem(last=False)
+            self._release_bucket(self._slot_buckets[slot])
+
+        bucket_id = self._bucket_index.get(bucket)
+        if bucket_id is None:
+            bucket_id = self._bucket_index[bucket] = self._next_bucket_id
+            self._next_bucket_id += 1
+        self._bucket_sizes[bucket] = self._bucket_sizes.get(bucket, 0) + 1
+
+        self._vectors[slot] = vector
+        self._expires_at[slot] = time.monotonic() + self.ttl
+        self._bucket_ids[slot] = bucket_id
+        self._slot_buckets[slot] = bucket
+        self._values[slot] = copy.deepcopy(value)
+        self._lru[slot] = None
+        self._lru.move_to_end(slot)
+
+    def clear(self):
+        """
+        Полная очистка кэша (например, после обновления данных в БД).
+        """
+        self._vectors = None
+        self._expires_at[:] = 0
+        self._bucket_ids[:] = -1
+        self._values = [None] * self.max_size
+        self._lru.clear()
+        self._slot_buckets = [None] * self.max_size
+        self._bucket_sizes.clear()
+        self._bucket_index.clear()
+
+    def _release_bucket(self, bucket: GeoBucket):
+        """
+        Освобождение слота ячейки; ячейка без слотов удаляется из индекса.
+        """
+        remaining = self._bucket_sizes[bucket] - 1
+        if remaining:
+            self._bucket_sizes[bucket] = remaining
+        else:
+            del self._bucket_sizes[bucket]
+            del self._bucket_index[bucket]
+
+    @staticmethod
+    def _normalize(embedding: list[float]) -> Optional[np.ndarray]:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        if norm == 0.0:
+            return None
+        return vector / norm
@@ -1,13 +1,26 @@
-import json
 import logging
 from datetime import datetime
+from typing import Optional
 
+import orjson
 from app.core.config import settings
 from app.core.database import DatabaseManager
 
 logger = logging.getLogger(__name__)
 
 
+def _chat_key(telegram_id: int) -> str:
+    return f"chat:{telegram_id}"
+
+
+def _location_key(telegram_id: int) -> str:
+    return f"location:{telegram_id}"
+
+
+def _place_meta_key(place_id: int) -> str:
+    return f"place:{place_id}"
+
+
 class SessionManager:
     """
     Менеджер сессий пользователей.
@@ -16,70 +29,65 @@ class SessionManager:
     def __init__(self, db_manager: DatabaseManager):
         self.db_manager = db_manager
 
-    async def get_session_key(self, telegram_id: int) -> str:
-        return f"session:{telegram_id}"
-
     async def get_chat_history(self, telegram_id: int) -> list[dict[str, str]]:
         try:
             redis = await self.db_manager.get_redis()
-            session_key = await self.get_session_key(telegram_id)
-
-            history_json = await redis.get(session_key)
 
-            if history_json:
-                return json.loads(history_json)
-            return []
+            # Список хранит сообщения от новых к старым
+            history_raw = await redis.lrange(
+                _chat_key(telegram_id), 0, settings.CHAT_HISTORY_LIMIT - 1
+            )
+            return [orjson.loads(message) for message in reversed(history_raw)]
 
         except Exception as e:
             logger.error(f"Error getting history: {e}", exc_info=True)
             return []
 
     async def add_message(self, telegram_id: int, role: str, content: str):
+        """
+        Добавление сообщения в историю.
+
+        История - список Redis: новое сообщение добавляется в начало, список
+        обрезается до CHAT_HISTORY_LIMIT, без чтения и перезаписи всей истории.
+        """
         try:
             redis = await self.db_manager.get_redis()
-            session_key = await self.get_session_key(telegram_id)
 
-            history = await self.get_chat_history(telegram_id)
-
-            history.append(
-                {"role": role, "content": content, "timestamp": datetime.utcnow().isoformat()}
-            )
-
-            if len(history) > 20:
-                history = history[-20:]
-
-            await redis.setex(
-                session_key, settings.SESSION_TTL, json.dumps(history, ensure_ascii=False)
-            )
+            async with redis.pipeline(transaction=False) as pipe:
+                self._push_message(pipe, telegram_id, role, content)
+                await pipe.execute()
 
         except Exception as e:
             logger.error(f"Error adding message: {e}", exc_info=True)
 
+    @staticmethod
+    def _push_message(pipe, telegram_id: int, role: str, content: str) -> None:
+        """
+        Команды добавления сообщения в историю (LPUSH, LTRIM, EXPIRE) в pipeline.
+        """
+        history_key = _chat_key(telegram_id)
+        message = {"role": role, "content": content, "timestamp": datetime.utcnow().isoformat()}
+
+        pipe.lpush(history_key, orjson.dumps(message))
+        pipe.ltrim(history_key, 0, settings.CHAT_HISTORY_LIMIT - 1)
+        pipe.expire(history_key, settings.SESSION_TTL)
+
     async def clear_session(self, telegram_id: int):
         try:
             redis = await self.db_manager.get_redis()
-            session_key = await self.get_session_key(telegram_id)
-
-            await redis.delete(session_key)
+            await redis.delete(_chat_key(telegram_id))
             logger.info(f"Session cleared for user {telegram_id}")
 
         except Exception as e:
             logger.error(f"Error clearing session: {e}", exc_info=True)
 
-    async def get_location_key(self, telegram_id: int) -> str:
-        return f"location:{telegram_id}"
-
     async def save_user_location(self, telegram_id: int, latitude: float, longitude: float) -> None:
         try:
             redis = await self.db_manager.get_redis()
-            location_key = await self.get_location_key(telegram_id)
+            location_key = _location_key(telegram_id)
 
             location_data = {"latitude": latitude, "longitude": longitude}
-            await redis.setex(
-                location_key,
-                settings.SESSION_TTL,
-                json.dumps(location_data, ensure_ascii=False),
-            )
+            await redis.setex(location_key, settings.SESSION_TTL, orjson.dumps(location_data))
             logger.info(f"Saved location for user {telegram_id}: ({latitude}, {longitude})")
 
         except Exception as e:
@@ -88,12 +96,12 @@ class SessionManager:
     async def get_user_location(self, telegram_id: int) -> dict[str, float] | None:
         try:
             redis = await self.db_manager.get_redis()
-            location_key = await self.get_location_key(telegram_id)
+            location_key = _location_key(telegram_id)
 
             location_json = await redis.get(location_key)
 
             if location_json:
-                location_data = json.loads(location_json)
+                location_data = orjson.loads(location_json)
                 logger.info(
                     f"Retrieved location for user {telegram_id}: "
                     f"({location_data.get('latitude')}, {location_data.get('longitude')})"
@@ -105,13 +113,81 @@ class SessionManager:
             logger.error(f"Error getting location: {e}", exc_info=True)
             return None
 
+    async def get_history_and_location(
+        self, telegram_id: int, user_message: Optional[str] = None
+    ) -> tuple[list[dict[str, str]], Optional[dict[str, float]]]:
+        """
+        История чата и сохраненные геоданные пользователя за один запрос к Redis.
+
+        Если передан user_message, он добавляется в историю в том же pipeline
+        (после чтения - в возвращаемую историю не попадает).
+        """
+        try:
+            redis = await self.db_manager.get_redis()
+            location_key = _location_key(telegram_id)
+
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.lrange(_chat_key(telegram_id), 0, settings.CHAT_HISTORY_LIMIT - 1)
+                pipe.get(location_key)
+                if user_message is not None:
+                    self._push_message(pipe, telegram_id, "user", user_message)
+                history_raw, location_json = (await pipe.execute())[:2]
+
+            history = [orjson.loads(message) for message in reversed(history_raw)]
+            location_data = orjson.loads(location_json) if location_json else None
+            return history, location_data
+
+        except Exception as e:
+            logger.error(f"Error getting history and location: {e}", exc_info=True)
+            return [], None
+
     async def clear_user_location(self, telegram_id: int) -> None:
         try:
             redis = await self.db_manager.get_redis()
-            location_key = await self.get_location_key(telegram_id)
+            location_key = _location_key(telegram_id)
 
             await redis.delete(location_key)
             logger.info(f"Cleared location for user {telegram_id}")
 
         except Exception as e:
             logger.error(f"Error clearing location: {e}", exc_info=True)
+
+    async def get_place_meta(self, place_id: int) -> Optional[dict]:
+        """
+        Теги и район места из кэша Redis (hash place:{id}, одним HMGET).
+
+        None - места нет в кэше.
+        """
+        try:
+            redis = await self.db_manager.get_redis()
+            place_key = _place_meta_key(place_id)
+
+            tags_json, district = await redis.hmget(place_key, "tags", "district")
+            if tags_json is None:
+                return None
+            return {"tags": orjson.loads(tags_json), "district": district or None}
+
+        except Exception as e:
+            logger.error(f"Error getting place meta: {e}", exc_info=True)
+            return None
+
+    async def save_place_meta(
+        self, place_id: int, tags: list[str], district: Optional[str]
+    ) -> None:
+        try:
+            redis = await self.db_manager.get_redis()
+            place_key = _place_meta_key(place_id)
+
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.hset(
+                    place_key,
+                    mapping={
+                        "tags": orjson.dumps(tags),
+                        "district": district or "",
+                    },
+                )
+                pipe.expire(place_key, settings.PLACE_META_CACHE_TTL)
+                await pipe.execute()
+
+        except Exception as e:
+            logger.error(f"Error saving place meta: {e}", exc_info=True)
@@ -1,14 +1,19 @@
 import logging
 from contextlib import asynccontextmanager
 
+from app.agent.agent import PlacesRecommendationAgent
 from app.api.routes import auth, health, telegram
 from app.core.config import settings
 from app.core.database import db_manager
 from app.core.models import Base
 from app.core.tracing import init_phoenix_tracing, instrument_langchain
+from app.middleware.compression import setup_compression
 from app.middleware.rate_limit import setup_rate_limiting
+from app.services.embeddings import close_embedding_client
+from app.services.session import SessionManager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
 logging.basicConfig(
     level=logging.INFO if settings.DEBUG else logging.WARNING,
@@ -33,8 +38,17 @@ async def lifespan(app: FastAPI):
         logger.error(f"Error creating database tables: {e}")
         raise
 
+    await db_manager.init_async()
+
+    # Общие для всех запросов объекты создаются один раз при старте
+    app.state.agent = PlacesRecommendationAgent(db_manager)
+    app.state.session_manager = SessionManager(db_manager)
+
     yield
     logger.info("Stopping application...")
+    await db_manager.close_async()
+    db_manager.close_all()
+    close_embedding_client()
 
 
 app = FastAPI(
@@ -42,9 +56,11 @@ app = FastAPI(
     description="LLM-агент для рекомендаций мест досуга через Telegram",
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 setup_rate_limiting(app)
+setup_compression(app)
 
 app.add_middleware(
     CORSMiddleware,
@@ -67,4 +83,12 @@ async def root():
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run("main:app", host=settings.API_HOST, port=settings.API_PORT, reload=settings.DEBUG)
+    uvicorn.run(
+        "main:app",
+        host=settings.API_HOST,
+        port=settings.API_PORT,
+        reload=settings.DEBUG,
+        # uvloop и httptools входят в uvicorn[standard]
+        loop="uvloop",
+        http="httptools",
+    )
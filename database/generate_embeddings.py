@@ -1,14 +1,39 @@
+import argparse
+import hashlib
 import logging
 import os
+import sqlite3
 import sys
+import threading
+import time
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from typing import Any
 
 import psycopg2
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import APIConnectionError, APITimeoutError, OpenAI, RateLimitError
 from psycopg2.extras import RealDictCursor
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, PointStruct, VectorParams
+from qdrant_client.models import (
+    Datatype,
+    Distance,
+    OptimizersConfigDiff,
+    PayloadSchemaType,
+    PointStruct,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    VectorParams,
+)
+from tenacity import (
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_random_exponential,
+)
 from tqdm import tqdm
 
 logging.basicConfig(
@@ -20,13 +45,109 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 
+class RateLimiter:
+    """
+    Ограничение запросов и токенов в минуту (token bucket).
+
+    Емкость по запросам и токенам восполняется равномерно (rpm/60 и tpm/60 в секунду).
+    Пачка отправляется только когда на нее хватает емкости - вместо ошибок 429
+    и повторов с ожиданием. 0 - ограничение выключено.
+    """
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int):
+        if not self.rpm and not self.tpm:
+            return
+
+        # Пачка больше минутного лимита токенов ждет полного восполнения, а не бесконечно
+        tokens = min(tokens, self.tpm) if self.tpm else 0
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                elapsed = now - self._updated
+                self._updated = now
+                if self.rpm:
+                    self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+                if self.tpm:
+                    self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+                has_request = not self.rpm or self._requests >= 1
+                has_tokens = not self.tpm or self._tokens >= tokens
+                if has_request and has_tokens:
+                    if self.rpm:
+                        self._requests -= 1
+                    if self.tpm:
+                        self._tokens -= tokens
+                    return
+
+                wait = 0.0
+                if not has_request:
+                    wait = max(wait, (1 - self._requests) * 60 / self.rpm)
+                if not has_tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60 / self.tpm)
+
+            time.sleep(wait)
+
+
+class EmbeddingCache:
+    """
+    Локальный кэш embeddings описаний между запусками (SQLite).
+
+    Ключ - хэш модели и текста описания (blake2b), значение - вектор float32.
+    Неизменившиеся места при повторной генерации не отправляются в API.
+    """
+
+    def __init__(self, path: str, model: str):
+        self.model = model
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings_cache "
+            "(desc_hash BLOB PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._lock = threading.Lock()
+
+    def _hash(self, text: str) -> bytes:
+        return hashlib.blake2b(f"{self.model}\n{text}".encode(), digest_size=16).digest()
+
+    def get_many(self, texts: list[str]) -> dict[str, list[float]]:
+        hashes = {self._hash(text): text for text in texts}
+        placeholders = ",".join("?" * len(hashes))
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT desc_hash, vector FROM embeddings_cache "
+                f"WHERE desc_hash IN ({placeholders})",
+                list(hashes),
+            ).fetchall()
+        return {hashes[desc_hash]: array("f", vector).tolist() for desc_hash, vector in rows}
+
+    def set_many(self, items: dict[str, list[float]]):
+        rows = [(self._hash(text), array("f", vector).tobytes()) for text, vector in items.items()]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings_cache (desc_hash, vector) VALUES (?, ?)", rows
+            )
+
+    def close(self):
+        self._conn.close()
+
+
 class EmbeddingGenerator:
     """
     Генератор embeddings для мест досуга.
     """
 
     def __init__(self):
-        self.pg_conn = psycopg2.connect(
+        # Соединение с PostgreSQL нужно только для чтения мест и не держится
+        # открытым (idle in transaction) на все время генерации embeddings
+        self.pg_params = dict(
             host=os.getenv("POSTGRES_HOST", "localhost"),
             port=os.getenv("POSTGRES_PORT", "5432"),
             database=os.getenv("POSTGRES_DB", "places_db"),
@@ -45,7 +166,18 @@ class EmbeddingGenerator:
 
         self.collection_name = "places"
         self.embedding_model = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-bge-m3")
-        self.embedding_dim = os.getenv("OPENAI_EMBEDDING_DIM", 1024)
+        self.embedding_dim = int(os.getenv("OPENAI_EMBEDDING_DIM", "1024"))
+        self.embedding_cache = EmbeddingCache(
+            os.getenv("EMBEDDING_CACHE_PATH", "embeddings_cache.sqlite"), self.embedding_model
+        )
+        # Сколько пачек embeddings отправляется в API одновременно
+        self.max_concurrency = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+        # Число процессов, загружающих точки в Qdrant
+        self.upload_parallel = min(8, os.cpu_count() or 1)
+        # Лимиты API embeddings: запросов и токенов в минуту (0 - без ограничения)
+        self.rate_limiter = RateLimiter(
+            rpm=int(os.getenv("OPENAI_RPM", "0")), tpm=int(os.getenv("OPENAI_TPM", "0"))
+        )
 
     def load_places(self) -> list[dict[str, Any]]:
         logger.info("Загрузка мест из PostgreSQL...")
@@ -58,42 +190,111 @@ class EmbeddingGenerator:
             p.rating,
             p.reviews_count,
             p.address,
-            COALESCE(pwt.tag_list, '') as tags
+            COALESCE(pwt.tag_list, '') as tags,
+            -- Описание для embedding собирается сразу в запросе, а не по месту в Python.
+            -- concat_ws пропускает NULL: части без данных в описание не попадают
+            concat_ws(
+                '. ',
+                p.name,
+                'Категории: ' || NULLIF(pwt.tag_list, ''),
+                'Район: ' || NULLIF(p.district, ''),
+                'Рейтинг: ' || round(p.rating::numeric, 1)
+            ) as description
         FROM places p
         LEFT JOIN places_with_tags pwt ON p.id = pwt.id
         WHERE p.rating >= 4.0
         ORDER BY p.id;
         """
 
-        with self.pg_conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute(query)
-            places = cursor.fetchall()
+        conn = psycopg2.connect(**self.pg_params)
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(query)
+                places = cursor.fetchall()
+        finally:
+            conn.close()
 
         logger.info(f"Загружено {len(places)} мест")
         return [dict(place) for place in places]
 
-    def create_description(self, place: dict[str, Any]) -> str:
-        parts = [place["name"]]
-
-        if place.get("tags"):
-            parts.append(f"Категории: {place['tags']}")
-
-        if place.get("district"):
-            parts.append(f"Район: {place['district']}")
-
-        if place.get("rating"):
-            parts.append(f"Рейтинг: {place['rating']:.1f}")
-
-        return ". ".join(parts)
-
     def create_embedding(self, text: str) -> list[float]:
         try:
             response = self.openai_client.embeddings.create(model=self.embedding_model, input=text)
             return response.data[0].embedding
         except Exception as e:
-            logger.error(f"Ошибка создания embedding: {e}")
+            logger.error("Ошибка создания embedding: %s", e)
             raise
 
+    # Повтор при превышении лимитов и сетевых ошибках: экспоненциальная задержка со случайным
+    # разбросом, чтобы параллельные пачки не повторяли запросы одновременно
+    @retry(
+        retry=retry_if_exception_type((RateLimitError, APITimeoutError, APIConnectionError)),
+        wait=wait_random_exponential(min=1, max=30),
+        stop=stop_after_attempt(6),
+        reraise=True,
+    )
+    def _create_embeddings_batch(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embeddings для нескольких текстов одним запросом к API.
+        """
+        # Оценка токенов: для кириллицы примерно 1 токен на 3 символа
+        self.rate_limiter.acquire(sum(len(text) // 3 + 1 for text in texts))
+        response = self.openai_client.embeddings.create(model=self.embedding_model, input=texts)
+        # API возвращает index каждого текста, порядок ответа на всякий случай восстанавливаем
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def _embed_batch(self, places: list[dict[str, Any]]):
+        """
+        Embeddings описаний пачки мест: (место, описание, вектор).
+
+        В API отправляются только описания, которых нет в локальном кэше.
+        Если пакетный запрос не прошел, тексты отправляются по одному, чтобы
+        одно проблемное описание не отбрасывало всю пачку.
+        """
+        descriptions = [place["description"] for place in places]
+        vectors = self.embedding_cache.get_many(descriptions)
+        misses = list(dict.fromkeys(text for text in descriptions if text not in vectors))
+
+        created = {}
+        if misses:
+            try:
+                created = dict(zip(misses, self._create_embeddings_batch(misses)))
+            except Exception as e:
+                logger.warning("Ошибка пакетного создания embeddings, обработка по одному: %s", e)
+                for description in misses:
+                    try:
+                        created[description] = self.create_embedding(description)
+                    except Exception as e:
+                        logger.error("Ошибка создания embedding для '%.50s': %s", description, e)
+
+        if created:
+            self.embedding_cache.set_many(created)
+            vectors.update(created)
+
+        return [
+            (place, description, vectors[description])
+            for place, description in zip(places, descriptions)
+            if description in vectors
+        ]
+
+    @staticmethod
+    def _build_point(place: dict[str, Any], description: str, vector: list[float]) -> PointStruct:
+        payload = {
+            "name": place["name"],
+            "description": description,
+            "tags": place.get("tags", ""),
+            # Теги в нижнем регистре - для фильтра MatchAny в Qdrant
+            "tags_lc": [
+                tag.strip().lower() for tag in (place.get("tags") or "").split(",") if tag.strip()
+            ],
+            "district": place.get("district", ""),
+            "address": place.get("address", ""),
+            # Колонки могут быть NULL: get(..., 0) для них вернет None
+            "rating": float(place.get("rating") or 0),
+            "reviews_count": int(place.get("reviews_count") or 0),
+        }
+        return PointStruct(id=int(place["id"]), vector=vector, payload=payload)
+
     def setup_qdrant_collection(self):
         try:
             self.qdrant_client.delete_collection(self.collection_name)
@@ -103,10 +304,60 @@ class EmbeddingGenerator:
 
         self.qdrant_client.create_collection(
             collection_name=self.collection_name,
-            vectors_config=VectorParams(size=self.embedding_dim, distance=Distance.COSINE),
+            # Оригинальные векторы хранятся в float16 на диске: вдвое меньше, чем float32,
+            # и нужны только для rescore; поиск идет по квантованным векторам в RAM
+            vectors_config=VectorParams(
+                size=self.embedding_dim,
+                distance=Distance.COSINE,
+                datatype=Datatype.FLOAT16,
+                on_disk=True,
+            ),
+            # int8 квантизация: в 4 раза меньше памяти под векторы, поиск по квантованным
+            # векторам в RAM, точный пересчет скоров по оригинальным (rescore при поиске)
+            quantization_config=ScalarQuantization(
+                scalar=ScalarQuantizationConfig(
+                    type=ScalarType.INT8, quantile=0.99, always_ram=True
+                )
+            ),
+            # Индексация HNSW отключена на время массовой загрузки,
+            # включается после нее (enable_indexing)
+            optimizers_config=OptimizersConfigDiff(indexing_threshold=0),
         )
         logger.info(f"Создана коллекция {self.collection_name}")
 
+        # Индексы для фильтрации по тегам и рейтингу на стороне Qdrant
+        self.qdrant_client.create_payload_index(
+            collection_name=self.collection_name,
+            field_name="tags_lc",
+            field_schema=PayloadSchemaType.KEYWORD,
+        )
+        self.qdrant_client.create_payload_index(
+            collection_name=self.collection_name,
+            field_name="rating",
+            field_schema=PayloadSchemaType.FLOAT,
+        )
+        logger.info("Созданы индексы payload: tags_lc, rating")
+
+    def _embed_batches(self, pool: ThreadPoolExecutor, batches: list[list[dict[str, Any]]]):
+        """
+        Embeddings пачек в исходном порядке: (пачка, результат _embed_batch).
+
+        В работе не больше 2 * max_concurrency пачек: следующая отправляется только
+        после выдачи готовой, поэтому в памяти не копятся результаты всех пачек
+        (pool.map отправляет все задачи сразу).
+        """
+        batch_iter = iter(batches)
+        pending = deque(
+            (batch, pool.submit(self._embed_batch, batch))
+            for batch in islice(batch_iter, 2 * self.max_concurrency)
+        )
+        while pending:
+            batch, future = pending.popleft()
+            next_batch = next(batch_iter, None)
+            if next_batch is not None:
+                pending.append((next_batch, pool.submit(self._embed_batch, next_batch)))
+            yield batch, future.result()
+
     def upload_to_qdrant(
         self,
         places: list[dict[str, Any]],
@@ -115,45 +366,61 @@ class EmbeddingGenerator:
     ):
         logger.info("Генерация embeddings и загрузка в Qdrant...")
 
-        points = []
-
-        for place in tqdm(places, desc="Обработка мест"):
-            try:
-                description = self.create_description(place)
-
-                vector = self.create_embedding(description)
-
-                payload = {
-                    "name": place["name"],
-                    "description": description,
-                    "tags": place.get("tags", ""),
-                    "district": place.get("district", ""),
-                    "rating": float(place.get("rating", 0)),
-                    "reviews_count": int(place.get("reviews_count", 0)),
-                }
-
-                point = PointStruct(id=int(place["id"]), vector=vector, payload=payload)
-                points.append(point)
-
-                if len(points) >= batch_size:
-                    self.qdrant_client.upsert(collection_name=self.collection_name, points=points)
-                    points = []
-
-            except Exception as e:
-                logger.error(f"Ошибка обработки {place['name']}: {e}")
-                continue
-
-        if points:
-            self.qdrant_client.upsert(collection_name=self.collection_name, points=points)
+        # Описания отправляются в API пачками по batch_size: один HTTP запрос на пачку.
+        # До max_concurrency пачек обрабатываются параллельно, очередь готовых пачек
+        # ограничена (_embed_batches). Готовые точки отдаются
+        # в upload_points генератором: пачки сериализуются и отправляются в Qdrant
+        # несколькими процессами, пока следующие пачки embeddings еще считаются
+        batches = [
+            places[start : start + batch_size] for start in range(0, len(places), batch_size)
+        ]
+
+        with (
+            ThreadPoolExecutor(self.max_concurrency, thread_name_prefix="embeddings") as pool,
+            tqdm(total=len(places), desc="Обработка мест") as progress,
+        ):
+
+            def points():
+                for batch, embedded in self._embed_batches(pool, batches):
+                    for place, description, vector in embedded:
+                        # Одно некорректное место не должно прерывать загрузку всех остальных
+                        try:
+                            point = self._build_point(place, description, vector)
+                        except Exception as e:
+                            logger.error("Ошибка подготовки места %s: %s", place.get("id"), e)
+                            continue
+                        yield point
+                    progress.update(len(batch))
+
+            self.qdrant_client.upload_points(
+                collection_name=self.collection_name,
+                points=points(),
+                batch_size=256,
+                parallel=self.upload_parallel,
+            )
 
         logger.info("Загрузка в Qdrant завершена")
 
-    def verify_collection(self):
+    def enable_indexing(self, indexing_threshold: int = 20000):
+        self.qdrant_client.update_collection(
+            collection_name=self.collection_name,
+            optimizer_config=OptimizersConfigDiff(indexing_threshold=indexing_threshold),
+        )
+        logger.info(f"Индексация HNSW включена (indexing_threshold={indexing_threshold})")
+
+    def verify_collection(self, test_search: bool = False):
         collection_info = self.qdrant_client.get_collection(self.collection_name)
         logger.info(f"Количество векторов в коллекции: {collection_info.points_count}")
 
+        # Тестовый поиск требует embedding запроса - только по флагу --verify
+        if not test_search:
+            return
+
         test_query = "уютное кафе с книгами"
-        test_vector = self.create_embedding(test_query)
+        test_vector = self.embedding_cache.get_many([test_query]).get(test_query)
+        if test_vector is None:
+            test_vector = self.create_embedding(test_query)
+            self.embedding_cache.set_many({test_query: test_vector})
 
         results = self.qdrant_client.search(
             collection_name=self.collection_name, query_vector=test_vector, limit=5
@@ -164,7 +431,7 @@ class EmbeddingGenerator:
         for i, result in enumerate(results, 1):
             logger.info(f"{i}. {result.payload['name']} (score: {result.score:.3f})")
 
-    def run(self):
+    def run(self, verify: bool = False):
         try:
             places = self.load_places()
 
@@ -174,7 +441,8 @@ class EmbeddingGenerator:
 
             self.setup_qdrant_collection()
             self.upload_to_qdrant(places)
-            self.verify_collection()
+            self.enable_indexing()
+            self.verify_collection(test_search=verify)
 
             logger.info("Генерация embeddings завершена успешно")
 
@@ -182,16 +450,22 @@ class EmbeddingGenerator:
             logger.error(f"Ошибка: {e}", exc_info=True)
             raise
         finally:
-            self.pg_conn.close()
+            self.embedding_cache.close()
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Генерация embeddings мест и загрузка в Qdrant")
+    parser.add_argument(
+        "--verify", action="store_true", help="тестовый поиск по коллекции после загрузки"
+    )
+    args = parser.parse_args()
+
     if not os.getenv("OPENAI_API_KEY"):
         logger.error("Не установлен OPENAI_API_KEY")
         sys.exit(1)
 
     generator = EmbeddingGenerator()
-    generator.run()
+    generator.run(verify=args.verify)
 
 
 if __name__ == "__main__":
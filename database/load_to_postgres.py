@@ -1,10 +1,14 @@
+import csv
+import io
 import json
 import logging
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import psycopg2
 from dotenv import load_dotenv
+from psycopg2.extras import execute_values
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -25,6 +29,111 @@ def get_connection(
     return psycopg2.connect(host=host, port=port, database=database, user=user, password=password)
 
 
+# Колонки places_staging в порядке загрузки через COPY
+PLACE_COLUMNS = [
+    "id",
+    "name",
+    "city",
+    "district",
+    "address",
+    "rating",
+    "reviews_count",
+    "ratings_count",
+    "working_hours",
+    "website",
+    "phone",
+    "longitude",
+    "latitude",
+]
+
+# Размер части CSV, которая готовится и загружается за раз
+CSV_CHUNK_SIZE = 50_000
+
+# Типы колонок CSV задаются явно: без определения типов по данным,
+# телефоны читаются строками, а не числами
+CSV_DTYPES = {
+    "id": "Int64",
+    "name": str,
+    "city": str,
+    "district": str,
+    "address": str,
+    "working_hours": str,
+    "website": str,
+    "phone": str,
+    "mobile_phone": str,
+    "tags_json": str,
+}
+
+
+def drop_invalid_places(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Отбрасывание строк, которые PostgreSQL не примет: без id или названия.
+
+    Проверка выполняется масками по колонкам целиком - до COPY, чтобы одна
+    такая строка не откатывала загрузку всего файла.
+    """
+    valid = df["id"].notna().to_numpy() & df["name"].str.strip().fillna("").ne("").to_numpy()
+    if not valid.all():
+        logger.warning(f"Пропущено {int((~valid).sum())} строк без id или названия")
+    return df[valid]
+
+
+def prepare_place_rows(df: pd.DataFrame) -> list[tuple]:
+    """
+    Строки для загрузки мест: очистка колонок целиком (векторно), NaN -> None.
+    """
+    places = df.reindex(columns=[*PLACE_COLUMNS, "mobile_phone"])
+
+    phone = places["phone"].fillna(places["mobile_phone"])
+    places["phone"] = phone.astype(str).str.strip().where(phone.notna())
+
+    places["id"] = places["id"].astype("int64")
+    places["rating"] = pd.to_numeric(places["rating"], errors="coerce")
+    for column in ("reviews_count", "ratings_count"):
+        places[column] = np.trunc(pd.to_numeric(places[column], errors="coerce")).astype("Int64")
+
+    # Координаты сохраняются только если известны обе и попадают в допустимый диапазон
+    longitude = pd.to_numeric(places["longitude"], errors="coerce")
+    latitude = pd.to_numeric(places["latitude"], errors="coerce")
+    has_location = longitude.between(-180, 180) & latitude.between(-90, 90)
+    places["longitude"] = longitude.where(has_location)
+    places["latitude"] = latitude.where(has_location)
+
+    places = places[PLACE_COLUMNS].astype(object)
+    places = places.where(places.notna(), None)
+    return list(places.itertuples(index=False, name=None))
+
+
+def _load_tags_json(place_id: int, tags_json: str) -> list:
+    try:
+        return json.loads(tags_json) if tags_json else []
+    except json.JSONDecodeError:
+        logger.error("Ошибка парсинга JSON для места ID %s", place_id)
+        return []
+
+
+def prepare_place_tags(df: pd.DataFrame) -> list[tuple[int, str]]:
+    """
+    Пары (место, имя тега) из колонки tags_json.
+
+    Списки тегов разворачиваются в одну Series (explode) - очистка имен
+    выполняется сразу для всех тегов.
+    """
+    if "tags_json" not in df:
+        return []
+
+    tags_json = df.set_index("id")["tags_json"].dropna()
+    tags = pd.Series(
+        [_load_tags_json(place_id, value) for place_id, value in tags_json.items()],
+        index=tags_json.index,
+        dtype=object,
+    )
+
+    tags = tags.explode().dropna().astype(str).str.strip()
+    tags = tags[tags != ""]
+    return list(zip(tags.index.astype("int64").tolist(), tags.tolist()))
+
+
 def load_data_to_postgres(
     csv_file: str = "../data/places_cleaned.csv",
     host: str = "localhost",
@@ -40,132 +149,97 @@ def load_data_to_postgres(
     if not csv_path.exists():
         raise FileNotFoundError(f"CSV файл не найден: {csv_path}")
 
-    df = pd.read_csv(csv_path)
-    logger.info(f"Загружено {len(df)} записей")
-
     logger.info(f"Подключение к PostgreSQL ({host}:{port}/{database})...")
     conn = get_connection(host, port, database, user, password)
     cursor = conn.cursor()
 
     try:
+        # Очистка и загрузка - одна транзакция: при ошибке остаются старые данные.
+        # Коммит не ждет сброса WAL на диск: загрузку всегда можно повторить
+        cursor.execute("SET LOCAL synchronous_commit = OFF")
+
         logger.info("Очистка существующих данных...")
         cursor.execute("DELETE FROM place_tags")
         cursor.execute("DELETE FROM tags")
         cursor.execute("DELETE FROM places")
-        conn.commit()
 
         logger.info("Загрузка мест в БД...")
-        inserted_count = 0
-
-        for _, row in df.iterrows():
-            phone = row.get("phone") or row.get("mobile_phone")
-            if pd.notna(phone):
-                phone = str(phone).strip()
-            else:
-                phone = None
-
-            lat = row.get("latitude")
-            lon = row.get("longitude")
-
-            if pd.notna(lat) and pd.notna(lon):
-                cursor.execute(
-                    """
-                    INSERT INTO places (
-                        id, name, city, district, address, rating, reviews_count, ratings_count,
-                        working_hours, website, phone, location
-                    ) VALUES (
-                        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                        ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography
-                    )
-                """,
-                    (
-                        int(row["id"]),
-                        row["name"],
-                        row.get("city"),
-                        row.get("district"),
-                        row.get("address"),
-                        float(row["rating"]) if pd.notna(row.get("rating")) else None,
-                        (int(row["reviews_count"]) if pd.notna(row.get("reviews_count")) else None),
-                        (int(row["ratings_count"]) if pd.notna(row.get("ratings_count")) else None),
-                        row.get("working_hours"),
-                        row.get("website"),
-                        phone,
-                        float(lon),
-                        float(lat),
-                    ),
-                )
-            else:
-                cursor.execute(
-                    """
-                    INSERT INTO places (
-                        id, name, city, district, address, rating, reviews_count, ratings_count,
-                        working_hours, website, phone, location
-                    ) VALUES (
-                        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NULL
-                    )
-                """,
-                    (
-                        int(row["id"]),
-                        row["name"],
-                        row.get("city"),
-                        row.get("district"),
-                        row.get("address"),
-                        float(row["rating"]) if pd.notna(row.get("rating")) else None,
-                        (int(row["reviews_count"]) if pd.notna(row.get("reviews_count")) else None),
-                        (int(row["ratings_count"]) if pd.notna(row.get("ratings_count")) else None),
-                        row.get("working_hours"),
-                        row.get("website"),
-                        phone,
-                    ),
-                )
-
-            inserted_count += 1
-
-            if inserted_count % 100 == 0:
-                conn.commit()
-
-        conn.commit()
-        logger.info(f"Загружено {inserted_count} мест")
+        # Места загружаются через COPY во временную таблицу (самый быстрый способ загрузки
+        # в PostgreSQL, временные таблицы не пишутся в WAL), затем одним INSERT ... SELECT
+        # в places с вычислением location.
+        # Без координат ST_MakePoint(NULL, NULL) дает NULL - location остается пустым
+        cursor.execute(
+            """
+            CREATE TEMP TABLE places_staging (
+                id BIGINT,
+                name TEXT,
+                city TEXT,
+                district TEXT,
+                address TEXT,
+                rating REAL,
+                reviews_count INTEGER,
+                ratings_count INTEGER,
+                working_hours TEXT,
+                website TEXT,
+                phone TEXT,
+                lon DOUBLE PRECISION,
+                lat DOUBLE PRECISION
+            ) ON COMMIT DROP
+            """
+        )
+
+        # CSV читается частями: каждая часть готовится и сразу загружается через COPY,
+        # в памяти не держится весь файл
+        loaded_count = 0
+        place_tag_names = []
+        for chunk in pd.read_csv(csv_path, chunksize=CSV_CHUNK_SIZE, dtype=CSV_DTYPES):
+            chunk = drop_invalid_places(chunk)
+            place_rows = prepare_place_rows(chunk)
+            place_tag_names.extend(prepare_place_tags(chunk))
+
+            # None записывается пустым полем без кавычек - в формате CSV это NULL
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(place_rows)
+            buffer.seek(0)
+            cursor.copy_expert("COPY places_staging FROM STDIN WITH (FORMAT CSV)", buffer)
+            loaded_count += len(place_rows)
+
+        cursor.execute(
+            """
+            INSERT INTO places (
+                id, name, city, district, address, rating, reviews_count, ratings_count,
+                working_hours, website, phone, location
+            )
+            SELECT
+                id, name, city, district, address, rating, reviews_count, ratings_count,
+                working_hours, website, phone,
+                ST_SetSRID(ST_MakePoint(lon, lat), 4326)::geography
+            FROM places_staging
+            """
+        )
+        logger.info(f"Загружено {loaded_count} мест")
 
         logger.info("Загрузка тегов и создание связей...")
-        tag_map = {}  # словарь для маппинга имени тега к его ID
-
-        for _, row in df.iterrows():
-            place_id = int(row["id"])
-            tags_json = row.get("tags_json")
-
-            if pd.notna(tags_json) and tags_json:
-                try:
-                    for tag_name in json.loads(tags_json):
-                        tag_name = tag_name.strip()
-                        if not tag_name:
-                            continue
-
-                        if tag_name not in tag_map:
-                            cursor.execute(
-                                "INSERT INTO tags (name) VALUES (%s) ON CONFLICT (name) DO NOTHING RETURNING id",
-                                (tag_name,),
-                            )
-                            result = cursor.fetchone()
-                            if result:
-                                tag_id = result[0]
-                            else:
-                                cursor.execute("SELECT id FROM tags WHERE name = %s", (tag_name,))
-                                tag_id = cursor.fetchone()[0]
-                            tag_map[tag_name] = tag_id
-                        else:
-                            tag_id = tag_map[tag_name]
-
-                        cursor.execute(
-                            """
-                            INSERT INTO place_tags (place_id, tag_id) 
-                            VALUES (%s, %s)
-                            ON CONFLICT (place_id, tag_id) DO NOTHING
-                        """,
-                            (place_id, tag_id),
-                        )
-                except json.JSONDecodeError:
-                    logger.error(f"Ошибка парсинга JSON для места ID {place_id}")
+        tag_names = list(dict.fromkeys(tag_name for _, tag_name in place_tag_names))
+        # Все новые теги - одним INSERT, их id - одним SELECT
+        execute_values(
+            cursor,
+            "INSERT INTO tags (name) VALUES %s ON CONFLICT (name) DO NOTHING",
+            [(tag_name,) for tag_name in tag_names],
+            page_size=1000,
+        )
+        cursor.execute("SELECT name, id FROM tags WHERE name = ANY(%s)", (tag_names,))
+        tag_map = dict(cursor.fetchall())  # словарь для маппинга имени тега к его ID
+
+        execute_values(
+            cursor,
+            """
+            INSERT INTO place_tags (place_id, tag_id) VALUES %s
+            ON CONFLICT (place_id, tag_id) DO NOTHING
+            """,
+            [(place_id, tag_map[tag_name]) for place_id, tag_name in place_tag_names],
+            page_size=1000,
+        )
 
         conn.commit()
         logger.info("Данные успешно загружены в БД!")
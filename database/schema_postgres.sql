@@ -54,19 +54,28 @@ SELECT
         string_agg(t.name, ', ' ORDER BY t.name),
         ''
     ) as tag_list,
-    array_agg(t.name ORDER BY t.name) FILTER (WHERE t.name IS NOT NULL) as tags_array
+    array_agg(t.name ORDER BY t.name) FILTER (WHERE t.name IS NOT NULL) as tags_array,
+    -- Теги в нижнем регистре для сравнения без приведения регистра на стороне приложения
+    COALESCE(
+        array_agg(lower(t.name) ORDER BY t.name) FILTER (WHERE t.name IS NOT NULL),
+        '{}'
+    ) as tag_list_lc
 FROM places p
 LEFT JOIN place_tags pt ON p.id = pt.place_id
 LEFT JOIN tags t ON pt.tag_id = t.id
 GROUP BY p.id;
 
 -- Функция для поиска мест рядом с заданными координатами
+-- и хотя бы одним из тегов tag_filter (в нижнем регистре, NULL - без фильтра).
+-- DROP: старая версия без tag_filter и с другим набором возвращаемых колонок
+DROP FUNCTION IF EXISTS find_places_nearby(DOUBLE PRECISION, DOUBLE PRECISION, INTEGER, REAL, INTEGER);
 CREATE OR REPLACE FUNCTION find_places_nearby(
     lat DOUBLE PRECISION,
     lon DOUBLE PRECISION,
     radius_meters INTEGER DEFAULT 5000,
     min_rating REAL DEFAULT 0.0,
-    limit_count INTEGER DEFAULT 20
+    limit_count INTEGER DEFAULT 20,
+    tag_filter TEXT[] DEFAULT NULL
 )
 RETURNS TABLE (
     id BIGINT,
@@ -75,7 +84,8 @@ RETURNS TABLE (
     distance_meters DOUBLE PRECISION,
     address TEXT,
     district TEXT,
-    tag_list TEXT
+    tag_list TEXT,
+    tag_list_lc TEXT[]
 ) AS $$
 BEGIN
     RETURN QUERY
@@ -89,7 +99,8 @@ BEGIN
         ) as distance_meters,
         p.address,
         p.district,
-        pwt.tag_list
+        pwt.tag_list,
+        pwt.tag_list_lc
     FROM places p
     LEFT JOIN places_with_tags pwt ON p.id = pwt.id
     WHERE p.rating >= min_rating
@@ -98,6 +109,7 @@ BEGIN
           ST_MakePoint(lon, lat)::geography,
           radius_meters
       )
+      AND (tag_filter IS NULL OR pwt.tag_list_lc && tag_filter)
     ORDER BY p.rating DESC, distance_meters
     LIMIT limit_count;
 END;
@@ -125,9 +137,14 @@ CREATE TABLE IF NOT EXISTS user_interactions (
     FOREIGN KEY (place_id) REFERENCES places(id) ON DELETE CASCADE
 );
 
-CREATE INDEX IF NOT EXISTS idx_user_interactions_telegram ON user_interactions(telegram_id);
 CREATE INDEX IF NOT EXISTS idx_user_interactions_place ON user_interactions(place_id);
-CREATE INDEX IF NOT EXISTS idx_user_interactions_type ON user_interactions(interaction_type);
+-- Последние взаимодействия пользователя определенного типа (профиль пользователя).
+-- Покрывает и запросы только по telegram_id (префикс индекса)
+CREATE INDEX IF NOT EXISTS idx_user_interactions_user_type_created
+    ON user_interactions(telegram_id, interaction_type, created_at DESC) INCLUDE (place_id);
+-- Избыточные индексы: telegram_id - префикс составного индекса, interaction_type - 2 значения
+DROP INDEX IF EXISTS idx_user_interactions_telegram;
+DROP INDEX IF EXISTS idx_user_interactions_type;
 
 -- Функция для обновления timestamp
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -1,9 +1,15 @@
 import asyncio
 import logging
 import os
+import re
+import signal
 import sys
+import time
+import weakref
+from typing import Optional
 
 import httpx
+import orjson
 from dotenv import load_dotenv
 from telegram import (
     InlineKeyboardButton,
@@ -34,6 +40,121 @@ TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
 BOT_API_TOKEN = os.getenv("BOT_API_TOKEN", "")
 
+# Время хранения JWT в кэше бота (секунды). Токен API живет 7 дней - кэш заметно короче,
+# истекший или отозванный раньше токен дополнительно сбрасывается по ответу 401
+JWT_CACHE_TTL = 24 * 3600
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Максимальная пауза между проверками доступности API после сбоя (секунды)
+API_PROBE_MAX_DELAY = 60.0
+
+API_UNAVAILABLE_TEXT = "Сервис временно недоступен. Попробуй чуть позже."
+
+# Окно объединения быстро идущих подряд сообщений одного чата (секунды)
+MESSAGE_COALESCE_DELAY = 0.4
+
+# Удаление звездочек Markdown за один проход - для отправки текста без разметки
+STRIP_MARKDOWN_TABLE = str.maketrans("", "", "*")
+
+# Отметка об уже выбранной оценке в начале карточки места. Telegram возвращает текст
+# сообщения без Markdown разметки, поэтому звездочки необязательны
+FEEDBACK_PREFIX_RE = re.compile(r"❤️ (?:\*\*)?Отлично!|👎 (?:\*\*)?Понял,")
+
+# Слова, по которым запрос считается поиском рядом с пользователем.
+# Одно регулярное выражение без учета регистра - один проход по тексту сообщения
+LOCATION_KEYWORDS = [
+    "рядом со мной",
+    "близко",
+    "недалеко",
+    "рядом",
+    "около меня",
+    "возле меня",
+    "поблизости",
+    "здесь",
+    "тут",
+]
+LOCATION_KEYWORDS_RE = re.compile("|".join(map(re.escape, LOCATION_KEYWORDS)), re.IGNORECASE)
+
+
+# Тексты команд: неизменная часть создается один раз при загрузке модуля
+WELCOME_TEXT = """
+Я помогу тебе найти идеальное место для досуга в Москве!
+
+🔍 **Как я работаю:**
+- Просто напиши, что ты ищешь (например: "уютное кафе с книжками")
+- Я пойму твои предпочтения и предложу подходящие варианты
+- Учту локацию, атмосферу, рейтинг и твои прошлые предпочтения
+
+💡 **Примеры запросов:**
+• "Хочу романтичный ресторан для свидания"
+• "Кафе рядом с Пушкинской с хорошим кофе"
+• "Что-то необычное и интересное"
+• "Музей для детей в центре"
+
+📍 **Команды:**
+/help - справка
+/clear - начать новый диалог
+"""
+
+HELP_TEXT = """
+ℹ️ **Справка**
+
+**Основные команды:**
+/start - начало работы
+/help - эта справка
+/clear - очистить историю диалога
+/location - поделиться геолокацией
+
+**Как искать места:**
+Просто опиши, что ты хочешь! Я понимаю естественный язык.
+
+**Примеры:**
+✓ "Уютное кафе с книжками рядом с Арбатом"
+✓ "Романтичное место для свидания"
+✓ "Музей с интерактивными экспонатами"
+✓ "Бар с живой музыкой в центре"
+
+**Поиск рядом с тобой:**
+Напиши "рядом со мной" или "близко" - я автоматически предложу поделиться геолокацией!
+Или используй команду /location в любой момент.
+
+Готов помочь! 🚀
+"""
+
+
+# Клавиатуры не меняются - создаются один раз при загрузке модуля
+LOCATION_OR_SKIP_KEYBOARD = ReplyKeyboardMarkup(
+    [
+        [KeyboardButton("📍 Поделиться геолокацией", request_location=True)],
+        [KeyboardButton("Пропустить")],
+    ],
+    one_time_keyboard=True,
+    resize_keyboard=True,
+)
+LOCATION_OR_CANCEL_KEYBOARD = ReplyKeyboardMarkup(
+    [
+        [KeyboardButton("📍 Поделиться моей геолокацией", request_location=True)],
+        [KeyboardButton("❌ Отмена")],
+    ],
+    one_time_keyboard=True,
+    resize_keyboard=True,
+)
+LOCATION_OR_ALL_KEYBOARD = ReplyKeyboardMarkup(
+    [
+        [KeyboardButton("📍 Поделиться геолокацией", request_location=True)],
+        [KeyboardButton("Искать по всей Москве")],
+    ],
+    one_time_keyboard=True,
+    resize_keyboard=True,
+)
+
+
+class ApiUnavailableError(Exception):
+    """
+    API недоступен: запрос не отправлялся (circuit breaker открыт).
+    """
+
 
 class PlacesBot:
     """
@@ -46,11 +167,38 @@ class PlacesBot:
         self.bot_api_token = bot_api_token
         self.app = Application.builder().token(token).build()
 
-        # HTTP клиент для запросов к API
-        self.http_client = httpx.AsyncClient(timeout=30.0)
+        # HTTP клиент для запросов к API: пул keep-alive соединений к backend
+        # (без TCP рукопожатия на каждое сообщение), повтор при ошибке соединения.
+        # limits задаются в транспорте - при явном transport параметры клиента не действуют
+        self.http_client = httpx.AsyncClient(
+            base_url=api_url,
+            timeout=httpx.Timeout(30.0, connect=5.0),
+            transport=httpx.AsyncHTTPTransport(
+                retries=2,
+                limits=httpx.Limits(
+                    max_connections=100, max_keepalive_connections=50, keepalive_expiry=60
+                ),
+            ),
+        )
+
+        # Кэш JWT токенов пользователей (telegram_id -> (jwt_token, срок хранения))
+        self.user_tokens: dict[int, tuple[str, float]] = {}
+
+        # Блокировки для фоновой обработки сообщений ((chat_id, user_id) -> Lock).
+        # Слабые ссылки: блокировка удаляется, когда ее никто не держит и не ждет
+        self._chat_locks = weakref.WeakValueDictionary()
+
+        # Сообщения, ожидающие объединения перед отправкой в API
+        # ((chat_id, user_id) -> обновления): в групповом чате сообщения разных
+        # пользователей не объединяются
+        self._pending_messages: dict[tuple[int, int], list[Update]] = {}
 
-        # Кэш JWT токенов пользователей (telegram_id -> jwt_token)
-        self.user_tokens = {}
+        # Circuit breaker запросов к API: False - API недоступен, идет фоновая проверка
+        self._api_available = True
+        self._health_probe: Optional[asyncio.Task] = None
+
+        # Обработчики кнопок под карточками мест по действию из callback_data
+        self._callback_handlers = {"like": self._handle_like, "dislike": self._handle_dislike}
 
         self._register_handlers()
 
@@ -70,18 +218,18 @@ class PlacesBot:
             return await message.reply_text(text, parse_mode=ParseMode.MARKDOWN, **kwargs)
         except Exception as e:
             logger.warning(f"Failed to send with Markdown: {e}")
-            return await message.reply_text(text.replace("**", "").replace("*", ""), **kwargs)
+            return await message.reply_text(text.translate(STRIP_MARKDOWN_TABLE), **kwargs)
 
     async def _edit_markdown_text(self, query, text: str, **kwargs):
         try:
             return await query.edit_message_text(text, parse_mode=ParseMode.MARKDOWN, **kwargs)
         except Exception as e:
             logger.warning(f"Failed to edit with Markdown: {e}")
-            return await query.edit_message_text(text.replace("**", ""), **kwargs)
+            return await query.edit_message_text(text.translate(STRIP_MARKDOWN_TABLE), **kwargs)
 
     @staticmethod
     def _remove_feedback_prefix(text: str) -> str:
-        if "❤️ **Отлично!" in text or "👎 **Понял," in text:
+        if FEEDBACK_PREFIX_RE.match(text):
             return text.split("\n\n", 1)[-1]
         return text
 
@@ -91,119 +239,137 @@ class PlacesBot:
 
         logger.info(f"User {telegram_id} started bot")
 
-        welcome_text = f"""
-👋 Привет, {user.first_name}!
-
-Я помогу тебе найти идеальное место для досуга в Москве!
-
-🔍 **Как я работаю:**
-- Просто напиши, что ты ищешь (например: "уютное кафе с книжками")
-- Я пойму твои предпочтения и предложу подходящие варианты
-- Учту локацию, атмосферу, рейтинг и твои прошлые предпочтения
-
-💡 **Примеры запросов:**
-• "Хочу романтичный ресторан для свидания"
-• "Кафе рядом с Пушкинской с хорошим кофе"
-• "Что-то необычное и интересное"
-• "Музей для детей в центре"
-
-📍 **Команды:**
-/help - справка
-/clear - начать новый диалог
-"""
+        welcome_text = f"\n👋 Привет, {user.first_name}!\n{WELCOME_TEXT}"
         await update.message.reply_text(welcome_text, parse_mode=ParseMode.MARKDOWN)
 
-        keyboard = [
-            [KeyboardButton("📍 Поделиться геолокацией", request_location=True)],
-            [KeyboardButton("Пропустить")],
-        ]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-
         await update.message.reply_text(
             "📍 Хочешь, чтобы я искал места рядом с тобой?\n"
             "Поделись геолокацией, и я смогу показывать самые близкие варианты!",
-            reply_markup=reply_markup,
+            reply_markup=LOCATION_OR_SKIP_KEYBOARD,
         )
 
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        help_text = """
-ℹ️ **Справка**
-
-**Основные команды:**
-/start - начало работы
-/help - эта справка
-/clear - очистить историю диалога
-/location - поделиться геолокацией
-
-**Как искать места:**
-Просто опиши, что ты хочешь! Я понимаю естественный язык.
-
-**Примеры:**
-✓ "Уютное кафе с книжками рядом с Арбатом"
-✓ "Романтичное место для свидания"
-✓ "Музей с интерактивными экспонатами"
-✓ "Бар с живой музыкой в центре"
-
-**Поиск рядом с тобой:**
-Напиши "рядом со мной" или "близко" - я автоматически предложу поделиться геолокацией!
-Или используй команду /location в любой момент.
-
-Готов помочь! 🚀
-"""
-        await update.message.reply_text(help_text, parse_mode=ParseMode.MARKDOWN)
+        await update.message.reply_text(HELP_TEXT, parse_mode=ParseMode.MARKDOWN)
 
     async def request_location_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        keyboard = [
-            [KeyboardButton("📍 Поделиться моей геолокацией", request_location=True)],
-            [KeyboardButton("❌ Отмена")],
-        ]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-
         await update.message.reply_text(
             "📍 Чтобы я мог искать места рядом с тобой, поделись своей геолокацией.\n\n"
             "Нажми на кнопку ниже или отправь геолокацию вручную через 📎 → Геопозиция",
-            reply_markup=reply_markup,
+            reply_markup=LOCATION_OR_CANCEL_KEYBOARD,
         )
 
-    async def get_user_jwt(self, telegram_id: int) -> str:
-        if telegram_id in self.user_tokens:
-            return self.user_tokens[telegram_id]
+    async def get_user_jwt(self, telegram_id: int) -> Optional[str]:
+        cached = self.user_tokens.get(telegram_id)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
 
+        jwt_token = await self._fetch_jwt(telegram_id)
+        if jwt_token:
+            self.user_tokens[telegram_id] = (jwt_token, time.monotonic() + JWT_CACHE_TTL)
+        else:
+            self.user_tokens.pop(telegram_id, None)
+        return jwt_token
+
+    async def _fetch_jwt(self, telegram_id: int) -> Optional[str]:
         try:
             # Запрашиваем токен у API
-            response = await self.http_client.post(
-                f"{self.api_url}/api/auth/telegram/login",
-                json={"telegram_id": telegram_id},
-                headers={"X-Bot-Token": self.bot_api_token},
+            response = await self._api_request(
+                "POST",
+                "/api/auth/telegram/login",
+                content=orjson.dumps({"telegram_id": telegram_id}),
+                headers={"X-Bot-Token": self.bot_api_token, **JSON_HEADERS},
             )
 
             if response.status_code == 200:
-                data = response.json()
-                jwt_token = data.get("access_token")
-                self.user_tokens[telegram_id] = jwt_token
-                return jwt_token
+                return orjson.loads(response.content).get("access_token")
             else:
                 logger.error(f"Failed to get JWT token: {response.status_code}")
 
+        except ApiUnavailableError:
+            raise
         except Exception as e:
             logger.error(f"Error getting JWT token: {e}", exc_info=True)
 
         return None
 
+    async def _authorized_request(
+        self, method: str, url: str, telegram_id: int, json: Optional[dict] = None
+    ) -> Optional[httpx.Response]:
+        """
+        Запрос к API с JWT пользователя. None - не удалось получить токен.
+
+        При ответе 401 токен удаляется из кэша, запрос повторяется один раз с новым.
+        Тело запроса сериализуется orjson.
+        """
+        content = orjson.dumps(json) if json is not None else None
+
+        for attempt in range(2):
+            jwt_token = await self.get_user_jwt(telegram_id)
+            if not jwt_token:
+                return None
+
+            response = await self._api_request(
+                method,
+                url,
+                content=content,
+                headers={"Authorization": f"Bearer {jwt_token}", **JSON_HEADERS},
+            )
+            if response.status_code != 401 or attempt:
+                return response
+
+            logger.info(f"JWT for {telegram_id} rejected, requesting a new one")
+            self.user_tokens.pop(telegram_id, None)
+
+    async def _api_request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Запрос к API через circuit breaker.
+
+        После ошибки подключения запросы сразу завершаются ApiUnavailableError (без ожидания
+        таймаутов), пока фоновая проверка /api/health не подтвердит доступность API.
+        Медленный ответ (таймаут чтения) недоступностью не считается - это может быть LLM.
+        """
+        if not self._api_available:
+            raise ApiUnavailableError("API is unavailable")
+
+        try:
+            return await self.http_client.request(method, url, **kwargs)
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            self._open_circuit()
+            raise
+
+    def _open_circuit(self):
+        if not self._api_available:
+            return
+        self._api_available = False
+        logger.warning("API is unavailable, failing requests fast until it recovers")
+        self._health_probe = asyncio.create_task(self._probe_api_health())
+
+    async def _probe_api_health(self):
+        delay = 1.0
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                response = await self.http_client.get("/api/health", timeout=5.0)
+                if response.status_code == 200:
+                    break
+            except Exception as e:
+                logger.debug(f"API health probe failed: {e}")
+            delay = min(delay * 2, API_PROBE_MAX_DELAY)
+
+        self._api_available = True
+        logger.info("API is available again")
+
     async def clear_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         telegram_id = update.effective_user.id
 
         try:
-            jwt_token = await self.get_user_jwt(telegram_id)
-            if not jwt_token:
+            response = await self._authorized_request(
+                "DELETE", "/api/telegram/session", telegram_id
+            )
+            if response is None:
                 await update.message.reply_text("Ошибка аутентификации. Попробуй позже.")
                 return
 
-            response = await self.http_client.delete(
-                f"{self.api_url}/api/telegram/session",
-                headers={"Authorization": f"Bearer {jwt_token}"},
-            )
-
             if response.status_code == 200:
                 await update.message.reply_text(
                     "История диалога очищена. Начнем заново!\n\nЧем могу помочь?"
@@ -211,6 +377,8 @@ class PlacesBot:
             else:
                 await update.message.reply_text("Не удалось очистить историю. Попробуй позже.")
 
+        except ApiUnavailableError:
+            await update.message.reply_text(API_UNAVAILABLE_TEXT)
         except Exception as e:
             logger.error(f"Error clearing session: {e}", exc_info=True)
             await update.message.reply_text("Произошла ошибка. Попробуй позже.")
@@ -257,33 +425,14 @@ class PlacesBot:
             )
             return
 
-        location_keywords = [
-            "рядом со мной",
-            "близко",
-            "недалеко",
-            "рядом",
-            "около меня",
-            "возле меня",
-            "поблизости",
-            "здесь",
-            "тут",
-        ]
-        needs_location = any(keyword in message_text.lower() for keyword in location_keywords)
+        needs_location = LOCATION_KEYWORDS_RE.search(message_text) is not None
         has_location = context.user_data.get("user_location") is not None
 
         if needs_location and not has_location:
-            keyboard = [
-                [KeyboardButton("📍 Поделиться геолокацией", request_location=True)],
-                [KeyboardButton("Искать по всей Москве")],
-            ]
-            reply_markup = ReplyKeyboardMarkup(
-                keyboard, one_time_keyboard=True, resize_keyboard=True
-            )
-
             await update.message.reply_text(
                 "📍 Чтобы искать места рядом с тобой, мне нужна твоя геолокация.\n"
                 "Поделись ей, или я буду искать по всей Москве.",
-                reply_markup=reply_markup,
+                reply_markup=LOCATION_OR_ALL_KEYBOARD,
             )
             return
 
@@ -299,14 +448,41 @@ class PlacesBot:
         except Exception as e:
             logger.debug(f"Failed to send typing action: {e}")
 
-        try:
-            jwt_token = await self.get_user_jwt(telegram_id)
-            if not jwt_token:
-                await update.message.reply_text(
-                    "Ошибка аутентификации. Пожалуйста, попробуй команду /start снова."
-                )
-                return
+        # Сообщения, пришедшие подряд в течение MESSAGE_COALESCE_DELAY, отправляются
+        # в API одним запросом (уточнения и дописывания - один вызов LLM, а не несколько)
+        key = (update.effective_chat.id, update.effective_user.id)
+        pending = self._pending_messages.get(key)
+        if pending is not None:
+            pending.append(update)
+            return
+        self._pending_messages[key] = [update]
+
+        # Запрос к API (ответ LLM) выполняется в фоне: обработчик сразу возвращается,
+        # и медленный ответ одному пользователю не задерживает обновления других чатов
+        context.application.create_task(self._process_and_reply(key, context), update=update)
+
+    def _chat_lock(self, key: tuple[int, int]) -> asyncio.Lock:
+        lock = self._chat_locks.get(key)
+        if lock is None:
+            lock = self._chat_locks[key] = asyncio.Lock()
+        return lock
+
+    async def _process_and_reply(self, key: tuple[int, int], context: ContextTypes.DEFAULT_TYPE):
+        await asyncio.sleep(MESSAGE_COALESCE_DELAY)
+        updates = self._pending_messages.pop(key)
+        message_text = "\n".join(update.message.text for update in updates)
+
+        # Сообщения пользователя в чате обрабатываются по порядку, остальные - параллельно.
+        # Ответ отправляется на последнее из объединенных сообщений
+        async with self._chat_lock(key):
+            await self._send_message_to_api(updates[-1], context, message_text)
+
+    async def _send_message_to_api(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE, message_text: str
+    ):
+        telegram_id = update.effective_user.id
 
+        try:
             payload = {"message": message_text}
 
             user_location = context.user_data.get("user_location")
@@ -317,14 +493,17 @@ class PlacesBot:
                     f"Sending location with message: ({user_location['latitude']}, {user_location['longitude']})"
                 )
 
-            response = await self.http_client.post(
-                f"{self.api_url}/api/telegram/send_message",
-                json=payload,
-                headers={"Authorization": f"Bearer {jwt_token}"},
+            response = await self._authorized_request(
+                "POST", "/api/telegram/send_message", telegram_id, json=payload
             )
+            if response is None:
+                await update.message.reply_text(
+                    "Ошибка аутентификации. Пожалуйста, попробуй команду /start снова."
+                )
+                return
 
             if response.status_code == 200:
-                data = response.json()
+                data = orjson.loads(response.content)
                 bot_response = data.get("response", {})
 
                 text_response = bot_response.get("text", "")
@@ -346,93 +525,101 @@ class PlacesBot:
                 logger.error(f"API error: {response.status_code}")
                 await update.message.reply_text("Извините, произошла ошибка. Попробуйте еще раз.")
 
+        except ApiUnavailableError:
+            await update.message.reply_text(API_UNAVAILABLE_TEXT)
         except Exception as e:
             logger.error(f"Error handling message: {e}", exc_info=True)
             await update.message.reply_text(
                 "Произошла техническая ошибка. Пожалуйста, попробуйте снова."
             )
 
-    async def _send_place_cards(self, update: Update, places: list[dict]):
-        for place in places[:5]:  # Ограничиваем до 5 мест за раз
-            place_id = place.get("id")
-            name = place.get("name", "Без названия")
-            rating = place.get("rating", 0)
-            district = place.get("district", "")
-            address = place.get("address", "")
-            tags = place.get("tags", [])
-            description = place.get("description", "")
-
-            card_text = f"📍 **{name}**\n\n"
-
-            if rating:
-                stars = "⭐" * int(rating)
-                card_text += f"{stars} {rating}/5\n"
-
-            if district:
-                card_text += f"📌 {district}\n"
-
-            if address:
-                card_text += f"🏠 {address}\n"
-
-            if tags:
-                tags_str = ", ".join(tags[:5])
-                card_text += f"\n🏷 {tags_str}\n"
-
-            if description:
-                desc_short = description[:200] + "..." if len(description) > 200 else description
-                card_text += f"\n{desc_short}\n"
-
-            keyboard = [
-                [
-                    InlineKeyboardButton("❤️ Нравится", callback_data=f"like:{place_id}"),
-                    InlineKeyboardButton("👎 Не нравится", callback_data=f"dislike:{place_id}"),
-                ]
+    @staticmethod
+    def _build_place_card(place: dict) -> tuple[str, InlineKeyboardMarkup]:
+        place_id = place.get("id")
+        name = place.get("name", "Без названия")
+        rating = place.get("rating", 0)
+        district = place.get("district", "")
+        address = place.get("address", "")
+        tags = place.get("tags", [])
+        description = place.get("description", "")
+
+        parts = [f"📍 **{name}**\n\n"]
+
+        if rating:
+            stars = "⭐" * int(rating)
+            parts.append(f"{stars} {rating}/5\n")
+
+        if district:
+            parts.append(f"📌 {district}\n")
+
+        if address:
+            parts.append(f"🏠 {address}\n")
+
+        if tags:
+            tags_str = ", ".join(tags[:5])
+            parts.append(f"\n🏷 {tags_str}\n")
+
+        if description:
+            desc_short = description[:200] + "..." if len(description) > 200 else description
+            parts.append(f"\n{desc_short}\n")
+
+        card_text = "".join(parts)
+
+        keyboard = [
+            [
+                InlineKeyboardButton("❤️ Нравится", callback_data=f"like:{place_id}"),
+                InlineKeyboardButton("👎 Не нравится", callback_data=f"dislike:{place_id}"),
             ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+        ]
+        return card_text, InlineKeyboardMarkup(keyboard)
+
+    async def _send_place_cards(self, update: Update, places: list[dict]):
+        cards = [self._build_place_card(place) for place in places[:5]]  # Не больше 5 мест
 
-            await self._send_markdown_text(update.message, card_text, reply_markup=reply_markup)
+        # Карточки отправляются по одной в порядке ранжирования: параллельная отправка
+        # перемешивает их в чате и упирается в ограничение частоты сообщений Telegram.
+        # Ошибка одной карточки не прерывает отправку остальных
+        for card_text, reply_markup in cards:
+            try:
+                await self._send_markdown_text(update.message, card_text, reply_markup=reply_markup)
+            except Exception as e:
+                logger.error(f"Failed to send place card: {e}")
 
     async def button_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
         await query.answer()
 
-        callback_data = query.data
+        # callback_data: "<действие>:<place_id>" или "<действие>:<place_id>:disabled"
+        action, _, place_id = query.data.partition(":")
 
-        if callback_data.endswith(":disabled"):
+        if place_id.endswith(":disabled"):
             await query.answer("Вы уже выбрали этот вариант", show_alert=False)
             return
 
         message_text = query.message.text or ""
-        if "❤️ **Отлично!" in message_text or "👎 **Понял," in message_text:
+        if FEEDBACK_PREFIX_RE.match(message_text):
             await query.answer("Вы уже выбрали этот вариант", show_alert=False)
             return
 
-        if callback_data.startswith("like:"):
-            place_id = callback_data.split(":")[1]
-            await self._handle_like(query, place_id)
-        elif callback_data.startswith("dislike:"):
-            place_id = callback_data.split(":")[1]
-            await self._handle_dislike(query, place_id)
+        handler = self._callback_handlers.get(action)
+        if handler is not None:
+            await handler(query, place_id)
 
     async def _handle_like(self, query, place_id: str):
         telegram_id = query.from_user.id
         logger.info(f"User {telegram_id} liked place {place_id}")
 
         try:
-            jwt_token = await self.get_user_jwt(telegram_id)
-            if not jwt_token:
+            response = await self._authorized_request(
+                "POST",
+                "/api/telegram/interaction",
+                telegram_id,
+                json={"place_id": int(place_id), "interaction_type": "liked"},
+            )
+            if response is None:
                 await query.answer("Ошибка аутентификации.", show_alert=True)
                 return
 
-            response = await self.http_client.post(
-                f"{self.api_url}/api/telegram/interaction",
-                json={
-                    "place_id": int(place_id),
-                    "interaction_type": "liked",
-                },
-                headers={"Authorization": f"Bearer {jwt_token}"},
-            )
-
             if response.status_code == 200:
                 original_text = self._remove_feedback_prefix(query.message.text)
                 new_text = f"❤️ **Отлично! Учту твои предпочтения.**\n\n{original_text}"
@@ -447,6 +634,8 @@ class PlacesBot:
                 logger.error(f"Failed to save like: {response.status_code}")
                 await query.answer("Ошибка сохранения. Попробуйте позже.", show_alert=True)
 
+        except ApiUnavailableError:
+            await query.answer(API_UNAVAILABLE_TEXT, show_alert=True)
         except Exception as e:
             logger.error(f"Error handling like: {e}", exc_info=True)
             await query.answer("Произошла ошибка.", show_alert=True)
@@ -456,20 +645,16 @@ class PlacesBot:
         logger.info(f"User {telegram_id} disliked place {place_id}")
 
         try:
-            jwt_token = await self.get_user_jwt(telegram_id)
-            if not jwt_token:
+            response = await self._authorized_request(
+                "POST",
+                "/api/telegram/interaction",
+                telegram_id,
+                json={"place_id": int(place_id), "interaction_type": "disliked"},
+            )
+            if response is None:
                 await query.answer("Ошибка аутентификации.", show_alert=True)
                 return
 
-            response = await self.http_client.post(
-                f"{self.api_url}/api/telegram/interaction",
-                json={
-                    "place_id": int(place_id),
-                    "interaction_type": "disliked",
-                },
-                headers={"Authorization": f"Bearer {jwt_token}"},
-            )
-
             if response.status_code == 200:
                 original_text = self._remove_feedback_prefix(query.message.text)
                 new_text = f"👎 **Понял, учту это.**\n\n{original_text}"
@@ -488,6 +673,8 @@ class PlacesBot:
                 logger.error(f"Failed to save dislike: {response.status_code}")
                 await query.answer("Ошибка сохранения. Попробуйте позже.", show_alert=True)
 
+        except ApiUnavailableError:
+            await query.answer(API_UNAVAILABLE_TEXT, show_alert=True)
         except Exception as e:
             logger.error(f"Error handling dislike: {e}", exc_info=True)
             await query.answer("Произошла ошибка.", show_alert=True)
@@ -495,7 +682,7 @@ class PlacesBot:
     async def _check_api_health(self, max_retries: int = 5, delay: float = 2.0) -> bool:
         for attempt in range(max_retries):
             try:
-                response = await self.http_client.get(f"{self.api_url}/api/health", timeout=5.0)
+                response = await self.http_client.get("/api/health", timeout=5.0)
                 if response.status_code == 200:
                     logger.info("API is available")
                     return True
@@ -527,17 +714,23 @@ class PlacesBot:
         await self.app.start()
         await self.app.updater.start_polling(allowed_updates=Update.ALL_TYPES)
 
+        # Бот работает до SIGINT/SIGTERM (docker stop) - без периодических пробуждений
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
         logger.info("Bot started and waiting for messages")
 
         try:
-            while True:
-                await asyncio.sleep(1)
-        except KeyboardInterrupt:
+            await stop.wait()
             logger.info("Stopping bot...")
         finally:
             await self.app.updater.stop()
             await self.app.stop()
             await self.app.shutdown()
+            if self._health_probe is not None:
+                self._health_probe.cancel()
             await self.http_client.aclose()
             logger.info("Bot stopped")
 